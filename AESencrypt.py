@@ -1,11 +1,46 @@
 from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
 from base64 import b64encode, b64decode
+import struct
+
+# Streaming format written by encrypt_stream (all integers big-endian):
+#
+#   header: magic b"AESGCMS1" | chunk size (uint32) | nonce prefix (8 random bytes)
+#   frame:  flags and length (uint32) | ciphertext (length bytes) | GCM tag (16 bytes)
+#
+# The top bit of the frame word marks the final frame and the low 31 bits hold the chunk length, which is at
+# most the chunk size. Chunk i is sealed with AES-GCM under the nonce prefix followed by i as a uint32, and
+# with the header plus the frame word as associated data, so frames cannot be reordered, cut short or
+# spliced between streams without failing authentication. Frames can be verified and decrypted one at a time.
+# The header is only authenticated with the first frame, so decrypt_stream refuses chunk sizes above
+# MAX_CHUNK_SIZE before allocating its buffers.
+STREAM_MAGIC = b"AESGCMS1"
+STREAM_HEADER = struct.Struct(">8sI8s")
+FRAME_HEADER = struct.Struct(">I")
+FINAL_FRAME = 0x80000000
+TAG_SIZE = 16
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def _read_full(source, view):
+    # Fill a buffer from a file object or mmap, returning how many bytes were read (short only at EOF)
+    total = 0
+    while total < len(view):
+        if hasattr(source, 'readinto'):
+            n = source.readinto(view[total:])
+        else:
+            data = source.read(len(view) - total)
+            n = len(data)
+            view[total:total + n] = data
+        if not n:
+            break
+        total += n
+    return total
 
 class AESCipher:
-    def __init__(self):
-        # Generate a random 16-byte key
-        self.key = get_random_bytes(16)
+    def __init__(self, key=None):
+        # Use the given key, or generate a random 16-byte key
+        self.key = key if key is not None else get_random_bytes(16)
 
     def _pad(self, data):
         # Add PKCS7 padding to the data
@@ -40,4 +75,75 @@ class AESCipher:
         # Decrypt string using AES in CBC mode with PKCS7 padding
         ciphertext_bytes = b64decode(ciphertext_string.encode('utf-8'))
         decrypted_bytes = self.decrypt_bytes(ciphertext_bytes)
-        return decrypted_bytes.decode('utf-8')
\ No newline at end of file
+        return decrypted_bytes.decode('utf-8')
+
+    def encrypt_stream(self, source, destination, chunk_size=1024 * 1024):
+        # Encrypt a file object or mmap into the framed AES-GCM format, chunk by chunk, with constant memory
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"Chunk size must be between 1 and {MAX_CHUNK_SIZE} bytes")
+        nonce_prefix = get_random_bytes(8)
+        header = STREAM_HEADER.pack(STREAM_MAGIC, chunk_size, nonce_prefix)
+        destination.write(header)
+
+        # Two input buffers so the next chunk can be read ahead to know whether the current one is final
+        current, lookahead = memoryview(bytearray(chunk_size)), memoryview(bytearray(chunk_size))
+        output = memoryview(bytearray(chunk_size))
+        length = _read_full(source, current)
+        index = 0
+        written = len(header)
+        while True:
+            next_length = _read_full(source, lookahead)
+            frame_word = FRAME_HEADER.pack(length | (FINAL_FRAME if next_length == 0 else 0))
+            cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce_prefix + struct.pack(">I", index))
+            cipher.update(header + frame_word)
+            cipher.encrypt(current[:length], output=output[:length])
+            destination.write(frame_word)
+            destination.write(output[:length])
+            destination.write(cipher.digest())
+            written += FRAME_HEADER.size + length + TAG_SIZE
+            if next_length == 0:
+                return written
+            current, lookahead = lookahead, current
+            length = next_length
+            index += 1
+            if index > 0xFFFFFFFF:
+                raise ValueError("Stream too long for the nonce counter")
+
+    def decrypt_stream(self, source, destination):
+        # Decrypt and verify a stream written by encrypt_stream, writing only authenticated plaintext
+        header = source.read(STREAM_HEADER.size)
+        if len(header) != STREAM_HEADER.size:
+            raise ValueError("Truncated stream header")
+        magic, chunk_size, nonce_prefix = STREAM_HEADER.unpack(header)
+        if magic != STREAM_MAGIC:
+            raise ValueError("Not an encrypted stream")
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError("Corrupt stream: chunk size out of range")
+
+        frame = memoryview(bytearray(chunk_size + TAG_SIZE))
+        output = memoryview(bytearray(chunk_size))
+        frame_word = bytearray(FRAME_HEADER.size)
+        index = 0
+        written = 0
+        while True:
+            if _read_full(source, memoryview(frame_word)) != FRAME_HEADER.size:
+                raise ValueError("Truncated stream: final frame missing")
+            word, = FRAME_HEADER.unpack(frame_word)
+            length = word & ~FINAL_FRAME
+            if length > chunk_size:
+                raise ValueError("Corrupt stream: frame larger than chunk size")
+            if _read_full(source, frame[:length + TAG_SIZE]) != length + TAG_SIZE:
+                raise ValueError("Truncated stream frame")
+
+            cipher = AES.new(self.key, AES.MODE_GCM, nonce=nonce_prefix + struct.pack(">I", index))
+            cipher.update(header + bytes(frame_word))
+            cipher.decrypt(frame[:length], output=output[:length])
+            cipher.verify(frame[length:length + TAG_SIZE])
+            destination.write(output[:length])
+            written += length
+
+            if word & FINAL_FRAME:
+                if source.read(1):
+                    raise ValueError("Corrupt stream: data after final frame")
+                return written
+            index += 1
@@ -5,11 +5,37 @@ import hashlib
 import time
 import secrets
 import sys
+import threading
+import zlib
+from collections import OrderedDict
+
+import metrics
+
+
+def hotp(hmac_key, counter, digits=6):
+    # Compute an HOTP value (RFC 4226) from a prepared HMAC-SHA1 object and a counter.
+    h = hmac_key.copy()
+    h.update(struct.pack(">Q", counter))
+    digest = h.digest()
+    o = digest[19] & 15
+    return (struct.unpack(">I", digest[o:o + 4])[0] & 0x7fffffff) % (10 ** digits)
+
 
 class TOTP:
-    def __init__(self):
-        # Generate a random secret key
-        self.secret = base64.b32encode(secrets.token_bytes(10)).decode('utf-8')
+    def __init__(self, secret=None):
+        # Generate a random secret key unless one is given
+        self.secret = secret if secret is not None else base64.b32encode(secrets.token_bytes(10)).decode('utf-8')
+
+    @property
+    def secret(self):
+        # Getter for the base32 secret
+        return self._secret
+
+    @secret.setter
+    def secret(self, secret):
+        # Setter for the base32 secret; the key is decoded once here instead of on every token
+        self._secret = secret
+        self._hmac = hmac.new(base64.b32decode(secret, True), digestmod=hashlib.sha1)
 
     def get_hotp_token(self, intervals_no):
         # Generate an HOTP (HMAC-based One-Time Password) token.
@@ -17,22 +43,15 @@ class TOTP:
         #     intervals_no (int): The number of time intervals.
         # Returns:
         #     int: The HOTP token.
-        key = base64.b32decode(self.secret, True)
-        msg = struct.pack(">Q", intervals_no)
-        h = hmac.new(key, msg, hashlib.sha1).digest()
-        o = h[19] & 15
-        h = (struct.unpack(">I", h[o:o + 4])[0] & 0x7fffffff) % 1000000
-        return h
+        return hotp(self._hmac, intervals_no)
 
     def get_totp_token(self):
         # Generate a TOTP (Time-based One-Time Password) token.
         # Returns:
         #     str: The TOTP token.
         intervals_no = int(time.time()) // 30  # Time interval of 30 seconds
-        x = str(self.get_hotp_token(intervals_no))
-        while len(x) < 6:
-            x += '0'
-        return x
+        # Tokens with leading zeros are padded on the left, as required by RFC 6238
+        return str(self.get_hotp_token(intervals_no)).zfill(6)
 
     def check_totp_expiration(self):
         # Check the expiration of the TOTP token.
@@ -47,7 +66,7 @@ class TOTP:
             user_input = input("Enter TOTP: ")
 
             # Check if the entered TOTP is correct
-            if user_input == correct_totp:
+            if hmac.compare_digest(user_input.encode('utf-8'), correct_totp.encode('utf-8')):
                 print("Correct TOTP entered. Access granted!")
                 break
 
@@ -60,3 +79,80 @@ class TOTP:
                 sys.exit()
 
             print("Incorrect TOTP. Try again.\n")
+
+
+class TOTPVerifier:
+    # Non-interactive TOTP verification for many users at once.
+    #
+    # Each user's secret is decoded once at registration and kept as a prepared HMAC object. A code is
+    # accepted if it matches any time step within +/- drift steps of the current one and that step is later
+    # than the last step accepted for the user (RFC 6238, section 5.2). The last accepted step per user is kept
+    # in a sharded replay cache until it has left every window; entries are only ever dropped once expired,
+    # so the cache holds at most one entry per user that verified within the last 2 * drift + 1 steps.
+
+    def __init__(self, step=30, digits=6, drift=1, shards=16):
+        # Initialize the verifier settings and the sharded replay cache
+        self.step = step
+        self.digits = digits
+        self.drift = drift
+        self._keys = {}
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+
+    def register(self, user_id, secret):
+        # Register or replace the base32 secret of a user
+        self._keys[user_id] = hmac.new(base64.b32decode(secret, True), digestmod=hashlib.sha1)
+
+    def unregister(self, user_id):
+        # Forget the secret of a user
+        self._keys.pop(user_id, None)
+
+    def generate(self, user_id, now=None):
+        # Generate the current code of a registered user
+        now = time.time() if now is None else now
+        return str(hotp(self._keys[user_id], int(now) // self.step, self.digits)).zfill(self.digits)
+
+    def _shard(self, user_id):
+        index = zlib.crc32(str(user_id).encode('utf-8')) % len(self._shards)
+        return self._shards[index], self._locks[index]
+
+    def verify(self, user_id, code, now=None):
+        # Check a code for a user; returns True only once per accepted time step
+        hmac_key = self._keys.get(user_id)
+        if (hmac_key is None or not isinstance(code, str) or len(code) != self.digits
+                or not code.isascii() or not code.isdigit()):
+            return False
+
+        now = time.time() if now is None else now
+        current = int(now) // self.step
+        code_bytes = code.encode('ascii')
+        matched = None
+        # Compare against every step in the window in constant time, without stopping at the first match
+        if metrics.enabled:
+            metrics.record_examined("totp.window_steps", 2 * self.drift + 1)
+        for counter in range(current - self.drift, current + self.drift + 1):
+            candidate = str(hotp(hmac_key, counter, self.digits)).zfill(self.digits).encode('ascii')
+            if hmac.compare_digest(candidate, code_bytes) and matched is None:
+                matched = counter
+        if matched is None:
+            return False
+
+        shard, lock = self._shard(user_id)
+        with lock:
+            # Evict users whose last accepted step has left every window, from the oldest end
+            while shard:
+                _, (_, expires_at) = next(iter(shard.items()))
+                if expires_at > now:
+                    break
+                shard.popitem(last=False)
+            last = shard.get(user_id)
+            if last is not None and matched <= last[0]:
+                return False
+            # The step stays inside the window until current - drift passes it
+            shard[user_id] = (matched, (matched + self.drift + 1) * self.step)
+            shard.move_to_end(user_id)
+        return True
+
+    def replay_cache_size(self):
+        # Number of users whose last accepted step is remembered
+        return sum(len(shard) for shard in self._shards)
@@ -1,11 +1,109 @@
+import hashlib
+import secrets
+import threading
+from collections import Counter, OrderedDict
+
+import metrics
+from TOTP import TOTP
+from similarity import bounded_edit_distance, normalize, similarity_threshold
+from storage import InMemoryUserStore
+
+
 class UserManager:
-    def __init__(self, data):
-        # Initialize the UserManager with user data.
-        self.users_data = data
+    def __init__(self, data, max_cached_users=10000):
+        # Initialize the UserManager with user data: a list of user dicts or a user store backend.
+        if isinstance(data, list):
+            self.users_data = data
+            self.store = InMemoryUserStore(data)
+        else:
+            self.users_data = None
+            self.store = data
+        # Per-user 4-gram fingerprints of the current password and history, stored as keyed hashes in an LRU
+        # cache of at most max_cached_users users. Each entry is tagged with the record's passwordVersion, which
+        # the store bumps whenever the current password or history changes, so a change made through another
+        # manager or another process is noticed on the next lookup with one integer comparison.
+        self.ngram_size = 4
+        self.max_cached_users = max_cached_users
+        self._fingerprint_key = secrets.token_bytes(16)
+        self._fingerprints = OrderedDict()
+        self._fingerprints_lock = threading.Lock()
+
+    def get_user(self, user_id):
+        # Get the user record for a specific user ID.
+        return self.store.get_user(user_id)
+
+    def add_user(self, user):
+        # Add a new user record.
+        self.store.add_user(user)
+
+    def update_user(self, user_id, changes):
+        # Apply field changes to a user record.
+        if 'currentPassword' in changes or 'history' in changes:
+            with self._fingerprints_lock:
+                self._fingerprints.pop(user_id, None)
+        return self.store.update_user(user_id, changes)
+
+    def rotate_password(self, user_id, new_password, history_size=3, expiration_months=6, password_hash=None):
+        # Move the current password into the history and make new_password current, along with its stored
+        # hash (password_hash) for users whose logins are verified against one.
+        with self.store.transaction() as tx:
+            user = tx.get_user(user_id)
+            if user is None:
+                return False
+            previous_version = self._password_version(user)
+            history = [user['currentPassword']] + user['history'][:history_size - 1]
+            changes = {
+                'history': history,
+                'expirationMonthLeft': expiration_months,
+                'currentPassword': new_password,
+            }
+            if password_hash is not None:
+                changes['passwordHash'] = password_hash
+            updated = tx.update_user(user_id, changes)
+            version = self._password_version(tx.get_user(user_id)) if updated else None
+
+        # Rotate the cached fingerprints the same way: add the new password, drop the oldest history entry. This
+        # only happens once the transaction has committed, so a rolled-back rotation never leaves an entry behind.
+        with self._fingerprints_lock:
+            cached = self._fingerprints.pop(user_id, None)
+            if updated and cached is not None and cached[0] == previous_version:
+                _, counts, entries = cached
+                new_entry = self.password_fingerprints(new_password)
+                counts = counts + Counter(new_entry)
+                for dropped in entries[history_size:]:
+                    counts.subtract(dropped)
+                self._cache_fingerprints(user_id, (version, +counts, [new_entry] + entries[:history_size]))
+        return updated
+
+    def get_totp_secret(self, user_id):
+        # Get the base32 TOTP secret enrolled for a user, or None if the user has none.
+        user = self.store.get_user(user_id)
+        return user.get('totpSecret') if user else None
+
+    def enroll_totp(self, user_id):
+        # Give a user a new random TOTP secret for their authenticator app and return it (None if not found).
+        secret = TOTP().secret
+        return secret if self.store.update_user(user_id, {'totpSecret': secret}) else None
+
+    def get_users_by_status(self, status):
+        # Get the user IDs with a specific account status.
+        return self.store.get_users_by_status(status)
+
+    def get_users_by_expiration(self, months_left):
+        # Get the user IDs whose password expires in exactly months_left months.
+        return self.store.get_users_by_expiration(months_left)
+
+    def get_users_expiring_within(self, months_left):
+        # Get the user IDs whose password expires within months_left months (0 means expired).
+        return self.store.get_users_expiring_within(months_left)
+
+    def count_by_hash_scheme(self):
+        # Get the number of users per stored password hash scheme.
+        return self.store.count_by_hash_scheme()
 
     def get_password_history(self, user_id):
         # Get the password history for a specific user ID.
-        user = next((user for user in self.users_data if user['userID'] == user_id), None)
+        user = self.store.get_user(user_id)
         if user:
             return user['history']
         else:
@@ -21,7 +119,7 @@ class UserManager:
 
     def get_current_password(self, user_id):
         # Get the current password for a specific user ID.
-        user = next((user for user in self.users_data if user['userID'] == user_id), None)
+        user = self.store.get_user(user_id)
         if user:
             return user['currentPassword']
         else:
@@ -37,7 +135,7 @@ class UserManager:
 
     def get_full_name(self, user_id):
         # Get the full name for a specific user ID.
-        user = next((user for user in self.users_data if user['userID'] == user_id), None)
+        user = self.store.get_user(user_id)
         if user:
             return f"{user['firstName']} {user['lastName']}"
         else:
@@ -45,7 +143,7 @@ class UserManager:
 
     def get_expiration_month(self, user_id):
         # Get the expiration month for a specific user ID.
-        user = next((user for user in self.users_data if user['userID'] == user_id), None)
+        user = self.store.get_user(user_id)
         if user:
             return user['expirationMonthLeft']
         else:
@@ -53,7 +151,7 @@ class UserManager:
 
     def get_account_status(self, user_id):
         # Get the account status for a specific user ID.
-        user = next((user for user in self.users_data if user['userID'] == user_id), None)
+        user = self.store.get_user(user_id)
         if user:
             return user['accountStatus']
         else:
@@ -67,44 +165,81 @@ class UserManager:
                 return True
         return False
 
+    def password_fingerprints(self, password):
+        # Get the keyed hashes of every n-gram of a password.
+        key = self._fingerprint_key
+        n = self.ngram_size
+        return frozenset(
+            hashlib.blake2b(password[i:i + n].encode('utf-8'), key=key, digest_size=8).digest()
+            for i in range(len(password) - n + 1)
+        )
+
+    def _password_version(self, user):
+        # Get the store's version stamp of the current password and history that cached fingerprints are tagged with.
+        return user.get('passwordVersion', 0)
+
+    def _cache_fingerprints(self, user_id, cached):
+        # Store a cache entry as the most recently used one and evict the least recently used beyond the limit.
+        self._fingerprints[user_id] = cached
+        self._fingerprints.move_to_end(user_id)
+        while len(self._fingerprints) > self.max_cached_users:
+            self._fingerprints.popitem(last=False)
+
+    def _get_fingerprints(self, user):
+        # Get the n-gram fingerprint counts for a user, building them when they are missing or out of date.
+        user_id = user['userID']
+        version = self._password_version(user)
+        with self._fingerprints_lock:
+            cached = self._fingerprints.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._fingerprints.move_to_end(user_id)
+                return cached[1]
+        entries = [self.password_fingerprints(password) for password in [user['currentPassword']] + user['history']]
+        counts = Counter()
+        for entry in entries:
+            counts.update(entry)
+        with self._fingerprints_lock:
+            self._cache_fingerprints(user_id, (version, counts, entries))
+        return counts
+
     # Check if the new password is similar to history/current.
     def is_password_similar_to_history(self, user_id, new_password):
-        user = next((user for user in self.users_data if user['userID'] == user_id), None)
+        user = self.store.get_user(user_id)
         if user:
-            history = user['history']
-            current_password = user['currentPassword']
-
-            if (
-                self.has_consecutive_characters(new_password, ''.join(history))
-                or self.has_consecutive_characters(new_password, current_password)
-                or self.has_consecutive_characters(current_password, new_password)
-            ):
-                return True  # Password has at least four consecutive characters in common with history or current password
-            else:
-                return False
+            # Password has at least four consecutive characters in common with history or current password
+            fingerprints = self._get_fingerprints(user)
+            if metrics.enabled:
+                metrics.record_examined("password_history.windows", max(0, len(new_password) - self.ngram_size + 1))
+            return any(fingerprint in fingerprints for fingerprint in self.password_fingerprints(new_password))
         else:
             return False
 
+    def is_password_close_to_history(self, user_id, new_password):
+        # Check if the new password is within a few edits of the current password or a history entry, ignoring
+        # case and leetspeak ("Summer2024!" -> "Summr2025!"). The bound is similarity_threshold of the new password.
+        user = self.store.get_user(user_id)
+        if not user:
+            return False
+        entries = [user['currentPassword']] + user['history']
+        if metrics.enabled:
+            metrics.record_examined("password_history.edit_distance_entries", len(entries))
+        candidate = normalize(new_password)
+        max_distance = similarity_threshold(new_password)
+        return any(bounded_edit_distance(candidate, normalize(entry), max_distance) is not None for entry in entries)
+
     def set_new_password(self, user_id, new_password):
         # Set a new password for a specific user ID, considering security checks.
-        if not self.is_password_similar_to_history(user_id, new_password):
-            user = next((user for user in self.users_data if user['userID'] == user_id), None)
-            if user:
-                current_password = user['currentPassword']
-                history = user['history']
-
-                if current_password == new_password:
-                    return "Password cannot be the same as the current password."
-
-                if (
-                    self.has_consecutive_characters(new_password, ''.join(history))
-                    or self.has_consecutive_characters(new_password, current_password)
-                    or self.has_consecutive_characters(current_password, new_password)
-                ):
-                    return "Password cannot be set. It contains at least four consecutive characters shared with the history or current password."
-
-                return f"Password updated successfully for userID {user_id}."
-            else:
-                return f"User with user ID {user_id} not found."
-        else:
+        user = self.store.get_user(user_id)
+        if not user:
+            return f"User with user ID {user_id} not found."
+
+        if self.is_password_similar_to_history(user_id, new_password):
             return "Password cannot be set. It contains at least four consecutive characters shared with the history or current password."
+
+        if user['currentPassword'] == new_password:
+            return "Password cannot be the same as the current password."
+
+        if self.is_password_close_to_history(user_id, new_password):
+            return "Password cannot be set. It is only a few edits away from the history or current password."
+
+        return f"Password updated successfully for userID {user_id}."
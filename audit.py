@@ -0,0 +1,214 @@
+# Bulk password audit
+#
+# Streams passwords (one per line) from a file or stdin through PasswordSecurityChecker on a pool of worker
+# processes and writes one result per password as JSONL or CSV. Input is read and dispatched in fixed-size
+# chunks with a bounded number of chunks in flight, so memory use does not grow with the size of the input.
+#
+# Usage:
+#   python audit.py passwords.txt --corpus common.txt --format csv -o results.csv
+#   cat passwords.txt | python audit.py - --workers 8 --unordered
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from complexity import PasswordSecurityChecker
+from corpus_file import CorpusFile
+from corpus_index import CommonPasswordIndex
+from progress import ProgressCounters, ProgressReporter, count_lines
+
+_worker_checker = None
+_worker_counters = None
+_worker_guesses = False
+
+
+def is_corpus_file(index_path):
+    # Check if an --corpus-index path is a corpus file from corpus_file.py rather than a corpus_index.py index
+    with open(index_path, 'rb') as index_file:
+        return index_file.read(4) == CorpusFile.MAGIC
+
+
+def load_common_passwords(corpus_path=None, index_path=None):
+    # Load the common-password corpus from a text file, a prebuilt index or corpus file, or the built-in sample list
+    if index_path:
+        if is_corpus_file(index_path):
+            return CorpusFile.open(index_path)
+        return CommonPasswordIndex.load(index_path)
+    if corpus_path:
+        with open(corpus_path, encoding='utf-8', errors='replace') as corpus_file:
+            return [line.rstrip('\r\n') for line in corpus_file if line.strip()]
+    from main import common_passwords
+    return common_passwords
+
+
+def _init_worker(corpus_path, index_path, counters=None, guesses=False):
+    # Load the corpus once per worker process and keep a reusable checker
+    global _worker_checker, _worker_counters, _worker_guesses
+    _worker_checker = PasswordSecurityChecker("", load_common_passwords(corpus_path, index_path))
+    _worker_guesses = guesses
+    if counters is not None:
+        counters.claim_slot()
+        _worker_counters = counters
+
+
+def audit_chunk(chunk):
+    # Score a chunk of (line number, password) pairs in a worker process
+    checker = _worker_checker
+    results = []
+    errors = 0
+    for line_no, password in chunk:
+        checker.password = password
+        try:
+            guesses_log10 = round(checker.estimate_guesses().guesses_log10, 2) if _worker_guesses else None
+            results.append((line_no, password, checker.security_level(), checker.feedback_on_improvement(), guesses_log10))
+        except Exception as error:
+            errors += 1
+            results.append((line_no, password, "Error", [f"{type(error).__name__}: {error}"], None))
+    if _worker_counters is not None:
+        _worker_counters.add(done=len(chunk) - errors, errors=errors)
+    return results
+
+
+def read_chunks(lines, chunk_size):
+    # Split an input stream into numbered chunks of passwords
+    numbered = ((line_no, line.rstrip('\r\n')) for line_no, line in enumerate(lines, start=1))
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_audit(lines, corpus_path=None, index_path=None, workers=None, chunk_size=1000, ordered=True, max_pending=None, counters=None,
+              guesses=False):
+    # Yield audit results for every input line, keeping at most max_pending chunks in flight.
+    # Workers report progress into counters, a ProgressCounters with at least workers + 1 slots.
+    # With guesses, each result also carries the log10 guess estimate, otherwise None.
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 2
+    chunks = read_chunks(lines, chunk_size)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(corpus_path, index_path, counters, guesses)) as executor:
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(audit_chunk, chunk))
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        else:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(audit_chunk, chunk))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in pending:
+                yield from future.result()
+
+
+class JSONLWriter:
+    def __init__(self, output, include_password=False):
+        # Initialize the writer with an output stream
+        self.output = output
+        self.include_password = include_password
+
+    def write(self, line_no, password, security_level, feedback, guesses_log10=None):
+        # Write one audit result as a JSON line
+        record = {"line": line_no}
+        if self.include_password:
+            record["password"] = password
+        record["security_level"] = security_level
+        if guesses_log10 is not None:
+            record["guesses_log10"] = guesses_log10
+        record["feedback"] = feedback
+        self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class CSVWriter:
+    def __init__(self, output, include_password=False, include_guesses=False):
+        # Initialize the writer and emit the CSV header
+        self.writer = csv.writer(output)
+        self.include_password = include_password
+        self.include_guesses = include_guesses
+        header = ["line", "password", "security_level", "feedback"] if include_password else ["line", "security_level", "feedback"]
+        if include_guesses:
+            header.insert(-1, "guesses_log10")
+        self.writer.writerow(header)
+
+    def write(self, line_no, password, security_level, feedback, guesses_log10=None):
+        # Write one audit result as a CSV row
+        row = [line_no, password, security_level, " ".join(feedback)] if self.include_password else [line_no, security_level, " ".join(feedback)]
+        if self.include_guesses:
+            row.insert(-1, "" if guesses_log10 is None else guesses_log10)
+        self.writer.writerow(row)
+
+
+def parse_args(argv=None):
+    # Parse command line options for the audit tool
+    parser = argparse.ArgumentParser(description="Audit the security level of passwords in bulk.")
+    parser.add_argument("input", help="File with one password per line, or '-' for stdin.")
+    parser.add_argument("-o", "--output", default="-", help="Output file, or '-' for stdout (default).")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default="jsonl")
+    parser.add_argument("--corpus", help="Common-password list, one per line (default: built-in sample list).")
+    parser.add_argument("--corpus-index", help="Prebuilt index from corpus_index.py or corpus file from corpus_file.py, used instead of --corpus.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count).")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Passwords per batch sent to a worker.")
+    parser.add_argument("--unordered", action="store_true", help="Emit results as soon as they finish instead of in input order.")
+    parser.add_argument("--include-password", action="store_true", help="Include the plaintext password in each result.")
+    parser.add_argument("--guesses", action="store_true", help="Also estimate the log10 guess count of each password.")
+    parser.add_argument("--no-progress", action="store_true", help="Do not report progress on stderr.")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.guesses and args.corpus_index and not is_corpus_file(args.corpus_index):
+        # An n-gram index has no ranked words for the guess estimator to match
+        sys.exit("--guesses needs --corpus or a corpus file from corpus_file.py, not a corpus_index.py index.")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    workers = args.workers or os.cpu_count() or 1
+    counters = None if args.no_progress else ProgressCounters(workers + 1)
+    total = None if counters is None or args.input == "-" else count_lines(args.input)
+    reporter = ProgressReporter("Audited", total=total, counters=counters) if counters is not None else None
+    source = sys.stdin if args.input == "-" else open(args.input, encoding='utf-8', errors='surrogateescape')
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding='utf-8', errors='surrogateescape', newline='')
+    if args.format == "csv":
+        writer = CSVWriter(output, include_password=args.include_password, include_guesses=args.guesses)
+    else:
+        writer = JSONLWriter(output, include_password=args.include_password)
+
+    try:
+        results = run_audit(
+            source,
+            corpus_path=args.corpus,
+            index_path=args.corpus_index,
+            workers=workers,
+            chunk_size=args.chunk_size,
+            ordered=not args.unordered,
+            counters=counters,
+            guesses=args.guesses,
+        )
+        if reporter is not None:
+            reporter.start()
+        for result in results:
+            writer.write(*result)
+    finally:
+        if reporter is not None:
+            reporter.close()
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Vectorized batch scoring of password character classes
+#
+# Packs a batch of ASCII passwords into one offset-indexed byte buffer, maps every byte to a bit mask of its
+# character classes with a lookup table, and ORs the masks per password with np.bitwise_or.reduceat, so the
+# length and character-class checks for the whole batch run as a few NumPy operations. Only passwords that pass
+# both the length and the complexity check can be "Very Strong", so the consecutive-character checks run through
+# the scalar PasswordSecurityChecker for those rows alone. Non-ASCII passwords take the scalar path entirely,
+# because str.isupper()/isdigit() accept characters outside the byte tables. Without NumPy every password is
+# scored by the scalar checker. Results match PasswordSecurityChecker.security_level exactly.
+#
+# Usage:
+#   scorer = BatchScorer(common_passwords)
+#   levels = scorer.security_levels(passwords)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from complexity import PasswordSecurityChecker
+
+UPPER = 1
+LOWER = 2
+DIGIT = 4
+SPECIAL = 8
+ALL_CLASSES = UPPER | LOWER | DIGIT | SPECIAL
+
+LEVELS = ("Weak", "Moderate", "Strong", "Very Strong")
+
+
+def _class_table():
+    # Bit mask of character classes for every byte value
+    table = np.zeros(256, dtype=np.uint8)
+    for code in range(128):
+        char = chr(code)
+        if char.isupper():
+            table[code] |= UPPER
+        if char.islower():
+            table[code] |= LOWER
+        if char.isdigit():
+            table[code] |= DIGIT
+        if char in PasswordSecurityChecker.SPECIAL_CHARACTERS:
+            table[code] |= SPECIAL
+    return table
+
+
+CLASS_TABLE = _class_table() if np is not None else None
+
+
+def _scalar_classes(password):
+    # Character-class mask of one password with the same tests as PasswordSecurityChecker
+    mask = 0
+    if any(char.isupper() for char in password):
+        mask |= UPPER
+    if any(char.islower() for char in password):
+        mask |= LOWER
+    if any(char.isdigit() for char in password):
+        mask |= DIGIT
+    if any(char in PasswordSecurityChecker.SPECIAL_CHARACTERS for char in password):
+        mask |= SPECIAL
+    return mask
+
+
+def character_classes(passwords):
+    # Get (lengths, class masks, ascii) arrays for a list of passwords.
+    # Masks of non-ASCII passwords are computed by the scalar fallback.
+    count = len(passwords)
+    lengths = np.fromiter(map(len, passwords), dtype=np.int64, count=count)
+    ascii_rows = np.fromiter(map(str.isascii, passwords), dtype=bool, count=count)
+    masks = np.zeros(count, dtype=np.uint8)
+    if not count:
+        return lengths, masks, ascii_rows
+
+    all_ascii = bool(ascii_rows.all())
+    packed = passwords if all_ascii else [password for password, ascii_row in zip(passwords, ascii_rows) if ascii_row]
+    if packed:
+        packed_lengths = lengths if all_ascii else lengths[ascii_rows]
+        # One trailing zero byte keeps every offset, including those of empty passwords at the end, in range
+        buffer = np.frombuffer("".join(packed).encode("ascii") + b"\0", dtype=np.uint8)
+        offsets = np.zeros(len(packed), dtype=np.int64)
+        np.cumsum(packed_lengths[:-1], out=offsets[1:])
+        packed_masks = np.bitwise_or.reduceat(CLASS_TABLE[buffer], offsets)
+        # reduceat returns the element at the offset for empty segments; empty passwords have no classes
+        packed_masks[packed_lengths == 0] = 0
+        if all_ascii:
+            masks = packed_masks
+        else:
+            masks[ascii_rows] = packed_masks
+
+    if not all_ascii:
+        for row in np.flatnonzero(~ascii_rows):
+            masks[row] = _scalar_classes(passwords[row])
+    return lengths, masks, ascii_rows
+
+
+class BatchScorer:
+    def __init__(self, common_passwords, min_length=8):
+        # Initialize the scorer with the common passwords used by the consecutive-character checks
+        self.common_passwords = common_passwords
+        self.min_length = min_length
+        self.checker = PasswordSecurityChecker("", common_passwords)
+
+    def _scalar_level(self, password):
+        self.checker.password = password
+        return self.checker.security_level()
+
+    def level_indexes(self, passwords):
+        # Get the index into LEVELS of every password's security level as a NumPy array
+        lengths, masks, _ = character_classes(passwords)
+        length_ok = lengths >= self.min_length
+        complexity_ok = masks == ALL_CLASSES
+
+        # Weak = 0, Moderate = 1, Strong = 2; candidates for Very Strong are settled by the scalar checks
+        indexes = (length_ok | complexity_ok).astype(np.uint8)
+        candidates = length_ok & complexity_ok
+        indexes[candidates] = 2
+        checker = self.checker
+        for row in np.flatnonzero(candidates):
+            checker.password = passwords[row]
+            if checker.analyze().consecutive_characters_ok:
+                indexes[row] = 3
+        return indexes
+
+    def security_levels(self, passwords):
+        # Get the security level of every password, identical to PasswordSecurityChecker.security_level
+        if not isinstance(passwords, list):
+            passwords = list(passwords)
+        if np is None:
+            return [self._scalar_level(password) for password in passwords]
+        return [LEVELS[index] for index in self.level_indexes(passwords).tolist()]
+
+
+if __name__ == "__main__":
+    import sys
+
+    from main import common_passwords
+
+    # Score one password per line from a file (or stdin) and print "level<TAB>password"
+    source = open(sys.argv[1], encoding="utf-8", errors="surrogateescape") if len(sys.argv) > 1 else sys.stdin
+    passwords = [line.rstrip("\r\n") for line in source]
+    for password, level in zip(passwords, BatchScorer(common_passwords).security_levels(passwords)):
+        print(f"{level}\t{password}")
@@ -0,0 +1,253 @@
+# Benchmarks for the password-evaluation hot paths
+#
+# Generates deterministic synthetic datasets (passwords, common-password corpora and user directories) from a
+# fixed seed, times each operation call by call, and reports throughput with p50/p99 latency. A run can be
+# saved as a baseline JSON file and later runs compared against it; the comparison fails when throughput of
+# any benchmark drops by more than the threshold.
+#
+# Usage:
+#   python benchmark.py --save-baseline baseline.json
+#   python benchmark.py --compare baseline.json --threshold 0.2
+#   python benchmark.py --corpus-sizes 100,10000000 --only security_level
+
+import argparse
+import json
+import platform
+import random
+import string
+import sys
+import time
+
+from AESencrypt import AESCipher
+from TOTP import TOTP
+from UserData import UserManager
+from batch_scoring import BatchScorer
+from complexity import PasswordSecurityChecker
+from hashing import SHA256Hasher
+
+SEED = 20240313
+ALPHABET = string.ascii_letters + string.digits + "!@#$%^&*()-_=+"
+SYLLABLES = ["pa", "ss", "wo", "rd", "qw", "er", "ty", "ad", "min", "let", "me", "in", "sun", "shi", "ne", "dra", "gon", "mon", "key"]
+
+
+def generate_passwords(count, length, seed=SEED):
+    # Deterministic random passwords of a fixed length
+    rng = random.Random(f"{seed}-passwords-{count}-{length}")
+    return ["".join(rng.choice(ALPHABET) for _ in range(length)) for _ in range(count)]
+
+
+def generate_corpus(size, seed=SEED):
+    # Deterministic common-password-like corpus built from syllables and digits
+    rng = random.Random(f"{seed}-corpus-{size}")
+    corpus = []
+    for _ in range(size):
+        word = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+        if rng.random() < 0.5:
+            word += str(rng.randint(0, 9999))
+        corpus.append(word)
+    return corpus
+
+
+def generate_users(count, seed=SEED):
+    # Deterministic user directory in the same shape as main.sample_users_data
+    rng = random.Random(f"{seed}-users-{count}")
+    users = []
+    for user_id in range(1, count + 1):
+        passwords = ["".join(rng.choice(ALPHABET) for _ in range(12)) for _ in range(4)]
+        users.append({
+            "userID": user_id,
+            "firstName": f"First{user_id}",
+            "lastName": f"Last{user_id}",
+            "history": passwords[1:],
+            "expirationMonthLeft": rng.randint(0, 6),
+            "currentPassword": passwords[0],
+            "accountStatus": "Active",
+        })
+    return users
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of a sorted list
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(operation, inputs, warmup=50):
+    # Time operation(item) for each input and return throughput and latency percentiles
+    for item in inputs[:warmup]:
+        operation(item)
+    timings = []
+    perf_counter_ns = time.perf_counter_ns
+    start = perf_counter_ns()
+    for item in inputs:
+        t0 = perf_counter_ns()
+        operation(item)
+        timings.append(perf_counter_ns() - t0)
+    total = perf_counter_ns() - start
+    timings.sort()
+    return {
+        "ops": len(inputs),
+        "ops_per_sec": len(inputs) / (total / 1e9),
+        "p50_us": percentile(timings, 0.50) / 1000,
+        "p99_us": percentile(timings, 0.99) / 1000,
+    }
+
+
+def selected(args, *names):
+    # Check if any of the named benchmarks passes the --only filter, so cases can skip building datasets
+    return not args.only or any(pattern in name for name in names for pattern in args.only)
+
+
+def checker_cases(args):
+    # Benchmarks for security_level and feedback_on_improvement over lengths and corpus sizes
+    for corpus_size in args.corpus_sizes:
+        checker_names = {length: (f"security_level[len={length},corpus={corpus_size}]",
+                                  f"feedback_on_improvement[len={length},corpus={corpus_size}]")
+                         for length in args.lengths}
+        batch_name = f"BatchScorer.security_levels[batch=1000,corpus={corpus_size}]"
+        if not selected(args, batch_name, *(name for names in checker_names.values() for name in names)):
+            continue
+        corpus = generate_corpus(corpus_size)
+        checker = PasswordSecurityChecker("", corpus)
+        checker.check_consecutive_letters()  # Build the shared corpus index outside the timed region
+        for length in args.lengths:
+            security_level_name, feedback_name = checker_names[length]
+            if not selected(args, security_level_name, feedback_name):
+                continue
+            passwords = generate_passwords(args.iterations, length)
+
+            def security_level(password):
+                checker.password = password
+                return checker.security_level()
+
+            def feedback_on_improvement(password):
+                checker.password = password
+                return checker.feedback_on_improvement()
+
+            if selected(args, security_level_name):
+                yield security_level_name, security_level, passwords
+            if selected(args, feedback_name):
+                yield feedback_name, feedback_on_improvement, passwords
+
+        # One operation scores a whole batch of 1000 passwords
+        if selected(args, batch_name):
+            scorer = BatchScorer(corpus)
+            batches = [generate_passwords(1000, length, seed=f"{SEED}-{batch}") for length in args.lengths for batch in range(5)]
+            yield batch_name, scorer.security_levels, batches
+
+
+def history_cases(args):
+    # Benchmarks for the password-history similarity check over directory sizes
+    for user_count in args.user_counts:
+        similar_name = f"is_password_similar_to_history[users={user_count}]"
+        close_name = f"is_password_close_to_history[users={user_count}]"
+        if not selected(args, similar_name, close_name):
+            continue
+        manager = UserManager(generate_users(user_count))
+        rng = random.Random(f"{SEED}-history-{user_count}")
+        candidates = generate_passwords(args.iterations, 12)
+        inputs = [(rng.randint(1, user_count), password) for password in candidates]
+        if selected(args, similar_name):
+            yield similar_name, lambda item: manager.is_password_similar_to_history(item[0], item[1]), inputs
+        if selected(args, close_name):
+            yield close_name, lambda item: manager.is_password_close_to_history(item[0], item[1]), inputs
+
+
+def primitive_cases(args):
+    # Benchmarks for TOTP, AES and SHA-256 primitives
+    if selected(args, "TOTP.get_hotp_token"):
+        totp = TOTP()
+        yield "TOTP.get_hotp_token", totp.get_hotp_token, list(range(args.iterations))
+
+    cipher = AESCipher()
+    for size in (64, 4096):
+        name = f"AESCipher.encrypt_bytes[size={size}]"
+        if not selected(args, name):
+            continue
+        rng = random.Random(f"{SEED}-aes-{size}")
+        payloads = [rng.randbytes(size) for _ in range(args.iterations)]
+        yield name, cipher.encrypt_bytes, payloads
+
+    if selected(args, "SHA256Hasher"):
+        hasher = SHA256Hasher()
+
+        def sha256(password):
+            hasher.reset_hasher()
+            hasher.hash_string(password)
+            return hasher.get_hashed_string()
+
+        yield "SHA256Hasher", sha256, generate_passwords(args.iterations, 16)
+
+
+def run_benchmarks(args):
+    # Run every selected benchmark and return {name: result}; the case generators apply the --only filter
+    # before building each dataset
+    results = {}
+    for cases in (checker_cases, history_cases, primitive_cases):
+        for name, operation, inputs in cases(args):
+            results[name] = measure(operation, inputs)
+            result = results[name]
+            print(f"{name:<60} {result['ops_per_sec']:>12,.0f} ops/s  p50 {result['p50_us']:>9.2f} us  p99 {result['p99_us']:>9.2f} us", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # List benchmarks whose throughput fell by more than threshold relative to the baseline
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if previous is None:
+            continue
+        change = result["ops_per_sec"] / previous["ops_per_sec"] - 1
+        if change < -threshold:
+            regressions.append((name, previous["ops_per_sec"], result["ops_per_sec"], change))
+    return regressions
+
+
+def parse_sizes(text):
+    return [int(float(value)) for value in text.split(",") if value]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the password-evaluation hot paths.")
+    parser.add_argument("--iterations", type=int, default=2000, help="Timed operations per benchmark.")
+    parser.add_argument("--lengths", type=parse_sizes, default=[8, 16, 32, 64], help="Comma-separated password lengths.")
+    parser.add_argument("--corpus-sizes", type=parse_sizes, default=[100, 10000, 1000000],
+                        help="Comma-separated common-password corpus sizes (up to 1e7).")
+    parser.add_argument("--user-counts", type=parse_sizes, default=[100, 10000, 100000], help="Comma-separated user directory sizes.")
+    parser.add_argument("--only", action="append", help="Run only benchmarks whose name contains this text (repeatable).")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare against a baseline JSON file and fail on regressions.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative throughput drop (default 0.2 = 20%%).")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as file:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "iterations": args.iterations,
+                "results": results,
+            }, file, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for name, before, after, change in regressions:
+                print(f"- {name}: {before:,.0f} -> {after:,.0f} ops/s ({change:+.1%})")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+# Memory-mapped Bloom filter over SHA-1 digests
+#
+# Most checked passwords are not in the breach corpus, and each exact lookup opens and searches a shard file.
+# A BloomFilter answers "definitely not present" from a few bits of one read-only mmap, so only possible hits
+# go on to the exact lookup. Sized for n entries at false-positive rate p it uses m = -n ln p / (ln 2)^2 bits
+# and k = m/n ln 2 bit positions per key (about 1.2 bytes per entry at 1%, 0.6 at 10%); keys never give false
+# negatives. The keys are SHA-1 digests, which are already uniform, so the k positions are derived from two
+# 64-bit slices of the digest by double hashing instead of hashing again:
+#
+#   header   magic, version, hash count k, bit count m, entries added, target false-positive rate
+#   bits     m bits, little-endian within each byte
+#
+# Entries can be added to an existing filter in place; once it holds more entries than it was sized for the
+# false-positive rate rises above the target and it should be rebuilt larger.
+#
+# Usage:
+#   bloom = BloomFilter.create("breaches.bloom", capacity=10**9, false_positive_rate=0.01)
+#   bloom.add(digest); bloom.close()
+#   BloomFilter.open("breaches.bloom").might_contain(digest)
+#   python bloom_filter.py size 1000000000 --false-positive-rate 0.01
+
+import math
+import mmap
+import os
+import struct
+
+LN2 = math.log(2)
+# Offset of the entry count in the header
+_ENTRIES_OFFSET = 16
+
+
+def parameters(capacity, false_positive_rate):
+    # (bits, hashes) of a filter holding capacity entries at the given false-positive rate
+    if not 0 < false_positive_rate < 1:
+        raise ValueError("false_positive_rate must be between 0 and 1")
+    capacity = max(1, capacity)
+    bits = max(8, math.ceil(-capacity * math.log(false_positive_rate) / (LN2 * LN2)))
+    return bits, max(1, round(bits / capacity * LN2))
+
+
+def expected_false_positive_rate(bits, hashes, entries):
+    # False-positive rate of a filter with the given bits and hashes after entries were added
+    return (1.0 - math.exp(-hashes * entries / bits)) ** hashes
+
+
+class BloomFilter:
+    MAGIC = b"BPWF"
+    VERSION = 1
+    _HEADER = struct.Struct(">4sBBxxQQd")
+
+    def __init__(self, data, file=None, writable=False):
+        # Initialize the filter over a buffer in the BloomFilter format (usually an mmap)
+        magic, version, hashes, bits, entries, false_positive_rate = self._HEADER.unpack_from(data)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError("not a Bloom filter file")
+        if len(data) < self._HEADER.size + (bits + 7) // 8:
+            raise ValueError("truncated Bloom filter file")
+        self.data = data
+        self.file = file
+        self.writable = writable
+        self.hashes = hashes
+        self.bits = bits
+        self.entries = entries
+        self.false_positive_rate = false_positive_rate
+
+    @classmethod
+    def create(cls, path, capacity, false_positive_rate=0.01):
+        # Create an empty filter file sized for capacity entries and map it for writing
+        bits, hashes = parameters(capacity, false_positive_rate)
+        with open(path, "wb") as file:
+            file.write(cls._HEADER.pack(cls.MAGIC, cls.VERSION, hashes, bits, 0, false_positive_rate))
+            file.truncate(cls._HEADER.size + (bits + 7) // 8)
+        return cls.open(path, writable=True)
+
+    @classmethod
+    def open(cls, path, writable=False):
+        # Map a filter file, read-only unless writable
+        file = open(path, "r+b" if writable else "rb")
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except BaseException:
+            file.close()
+            raise
+        return cls(data, file, writable)
+
+    def close(self):
+        # Write back the entry count of a writable filter and unmap it
+        if self.writable:
+            struct.pack_into(">Q", self.data, _ENTRIES_OFFSET, self.entries)
+            self.data.flush()
+            self.writable = False
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __reduce__(self):
+        # Worker processes reopen the same file read-only instead of copying the bits
+        if self.file is None:
+            raise TypeError("only filters opened from a path can be pickled")
+        return BloomFilter.open, (self.file.name,)
+
+    @property
+    def size(self):
+        # Size of the filter in bytes
+        return self._HEADER.size + (self.bits + 7) // 8
+
+    @property
+    def expected_false_positive_rate(self):
+        # False-positive rate expected for the entries added so far
+        return expected_false_positive_rate(self.bits, self.hashes, self.entries)
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[4:12], "little")
+        h2 = int.from_bytes(digest[12:20], "little") | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, digest):
+        # Add a SHA-1 digest; the filter must have been opened writable
+        data = self.data
+        offset = self._HEADER.size
+        for position in self._positions(digest):
+            data[offset + (position >> 3)] |= 1 << (position & 7)
+        self.entries += 1
+
+    def might_contain(self, digest):
+        # False if the digest was never added; True if it may have been
+        data = self.data
+        offset = self._HEADER.size
+        for position in self._positions(digest):
+            if not data[offset + (position >> 3)] & (1 << (position & 7)):
+                return False
+        return True
+
+    __contains__ = might_contain
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Size Bloom filters or inspect a filter file.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    size_parser = commands.add_parser("size", help="Show the size of a filter for a number of entries.")
+    size_parser.add_argument("entries", type=int)
+    size_parser.add_argument("--false-positive-rate", type=float, action="append",
+                             help="Target rate (repeatable; default 0.1, 0.05, 0.01 and 0.001).")
+    info_parser = commands.add_parser("info", help="Show the parameters of a filter file.")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "size":
+        for rate in args.false_positive_rate or [0.1, 0.05, 0.01, 0.001]:
+            bits, hashes = parameters(args.entries, rate)
+            print(f"{args.entries:,} entries at {rate:.2%}: {bits / 8 / 2 ** 20:,.1f} MiB, {bits / args.entries:.2f} bits/entry, {hashes} hashes")
+    else:
+        with BloomFilter.open(args.path) as bloom:
+            print(f"{args.path}: {os.path.getsize(args.path) / 2 ** 20:,.1f} MiB, {bloom.bits:,} bits, {bloom.hashes} hashes, "
+                  f"{bloom.entries:,} entries, target {bloom.false_positive_rate:.2%}, "
+                  f"expected {bloom.expected_false_positive_rate:.3%}")
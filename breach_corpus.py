@@ -0,0 +1,472 @@
+# Breach corpus shards
+#
+# Breach dumps run to billions of lines and do not fit in memory. BreachCorpus.update streams each dump once,
+# normalizes and hashes every line, and counts the SHA-1 hashes in a dict that is sorted and spilled to a run file
+# whenever it reaches the memory cap. The runs are combined with a k-way heap merge that sums the counts of equal
+# hashes, and the merged stream, already in hash order, is split by hash prefix into small shard files:
+#
+#   manifest.json                  format version, prefix length, generation, ingested sources and shard sizes
+#   <prefix>.<generation>.shard    sorted fixed-size records: the SHA-1 without its prefix bytes, uint32 count
+#   filter.bloom                   optional BloomFilter of every hash (see bloom_filter.py)
+#
+# Plain dumps have one password per line; each line loses its line ending, is NFC-normalized if it is valid UTF-8
+# and is hashed with SHA-1. HIBP-style dumps ("SHA1HEX:count" lines) are recognized from their first line and
+# used as they are. Adding new dumps only sorts the new data and rewrites the shards it touches, each merged
+# linearly with its previous version; dumps that were already ingested are skipped. The manifest is replaced
+# last, and generations only grow (a rebuild continues from the one it replaces), so new shard files never
+# overwrite the ones the live manifest names and an interrupted update or rebuild leaves the previous corpus
+# intact. Looking a password up binary searches the
+# single shard named by its hash prefix. With a filter, lookups first ask the filter and only search a shard on
+# a possible hit; updates add the new hashes to the filter in place and rebuild it with twice the capacity once
+# the corpus outgrows it.
+#
+# Usage:
+#   python breach_corpus.py build breaches/ dump1.txt pwned-passwords-sha1.txt --memory-mb 512
+#   python breach_corpus.py filter breaches/ --false-positive-rate 0.01
+#   python breach_corpus.py query breaches/ password123
+#   python breach_corpus.py stats breaches/ --probes 100000
+#   checker.breach_count(BreachCorpus.open("breaches/"))
+
+import argparse
+import hashlib
+import heapq
+import json
+import logging
+import mmap
+import os
+import re
+import struct
+import tempfile
+import time
+import unicodedata
+from itertools import groupby
+
+from bloom_filter import BloomFilter, parameters
+from progress import ProgressReporter
+
+logger = logging.getLogger(__name__)
+
+AUTO = "auto"
+PLAIN = "plain"
+HIBP = "hibp"
+
+HASH_SIZE = 20
+MAX_COUNT = 0xFFFFFFFF
+_RUN_RECORD = struct.Struct(">20sI")
+_HIBP_LINE = re.compile(rb"([0-9A-Fa-f]{40}):(\d+)")
+_SHARD_FILE = re.compile(r"[0-9a-f]+\.\d+\.shard")
+# Rough bytes per entry of the in-memory count dict: the 20-byte key object, the int and the dict slot
+ENTRY_MEMORY = 160
+# Most runs merged at once; more runs are first merged in groups
+MAX_FAN_IN = 64
+WRITE_BATCH = 65536
+
+
+def normalize(password):
+    # Bytes hashed for a password: NFC-normalized UTF-8, or the bytes as they are if they are not valid UTF-8
+    if isinstance(password, str):
+        password = password.encode("utf-8", "surrogateescape")
+    try:
+        text = password.decode("utf-8")
+    except UnicodeDecodeError:
+        return password
+    return unicodedata.normalize("NFC", text).encode("utf-8")
+
+
+def password_hash(password):
+    # SHA-1 digest of a normalized password, as used in the shards
+    return hashlib.sha1(normalize(password)).digest()
+
+
+def sniff_format(path):
+    # HIBP if the first non-empty line is "SHA1HEX:count", otherwise plain
+    with open(path, "rb") as source:
+        for line in source:
+            line = line.rstrip(b"\r\n")
+            if line:
+                return HIBP if _HIBP_LINE.fullmatch(line) else PLAIN
+    return PLAIN
+
+
+def read_records(source, source_format):
+    # (digest, count) for every line of an open binary dump; malformed HIBP lines are skipped
+    for line in source:
+        line = line.rstrip(b"\r\n")
+        if not line:
+            continue
+        if source_format == HIBP:
+            match = _HIBP_LINE.fullmatch(line)
+            if match:
+                yield bytes.fromhex(match.group(1).decode("ascii")), int(match.group(2))
+        else:
+            yield password_hash(line), 1
+
+
+def merge_counts(streams):
+    # Merge (key, count) streams sorted by key, summing the counts of equal keys
+    current = None
+    total = 0
+    for key, count in heapq.merge(*streams):
+        if key == current:
+            total += count
+            continue
+        if current is not None:
+            yield current, min(total, MAX_COUNT)
+        current, total = key, count
+    if current is not None:
+        yield current, min(total, MAX_COUNT)
+
+
+def _write_records(file, records, record):
+    # Write (key, count) records in batches; returns (entries, occurrences)
+    entries = occurrences = 0
+    batch = []
+    for key, count in records:
+        batch.append(record.pack(key, count))
+        entries += 1
+        occurrences += count
+        if len(batch) >= WRITE_BATCH:
+            file.write(b"".join(batch))
+            batch.clear()
+    file.write(b"".join(batch))
+    return entries, occurrences
+
+
+def _read_records(path, record, buffer_size):
+    # (key, count) records of a run or shard file, read buffer_size bytes at a time
+    chunk_size = max(record.size, buffer_size - buffer_size % record.size)
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            yield from record.iter_unpack(chunk)
+
+
+def _spill(counts, directory):
+    # Write the counts to a new sorted run file
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "wb") as run:
+        _write_records(run, ((digest, min(counts[digest], MAX_COUNT)) for digest in sorted(counts)), _RUN_RECORD)
+    return path
+
+
+def _reduce_runs(runs, directory, buffer_size):
+    # Merge runs in groups until at most MAX_FAN_IN are left
+    runs = list(runs)
+    while len(runs) > MAX_FAN_IN:
+        group, runs = runs[:MAX_FAN_IN], runs[MAX_FAN_IN:]
+        fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+        with os.fdopen(fd, "wb") as run:
+            _write_records(run, merge_counts([_read_records(name, _RUN_RECORD, buffer_size) for name in group]), _RUN_RECORD)
+        for name in group:
+            os.remove(name)
+        runs.append(path)
+    return runs
+
+
+def _added_to(bloom, records):
+    # Pass (digest, count) records through, adding each digest to a writable filter
+    for record in records:
+        bloom.add(record[0])
+        yield record
+
+
+class BreachCorpus:
+    MANIFEST = "manifest.json"
+    FILTER = "filter.bloom"
+    VERSION = 1
+
+    def __init__(self, directory, manifest):
+        # Initialize the corpus from its directory and parsed manifest
+        if manifest.get("version") != self.VERSION:
+            raise ValueError("unsupported breach corpus version")
+        self.directory = directory
+        self.manifest = manifest
+        self.prefix_bytes = manifest["prefix_bytes"]
+        self.shards = manifest["shards"]
+        self._record = struct.Struct(f">{HASH_SIZE - self.prefix_bytes}sI")
+        self.bloom = None
+        if manifest.get("filter"):
+            self.bloom = BloomFilter.open(os.path.join(directory, manifest["filter"]["file"]))
+        # Lookup statistics: all lookups, lookups the filter answered, filter hits that were not in the corpus
+        self.lookups = self.filtered = self.false_positives = 0
+
+    @classmethod
+    def empty(cls, directory, prefix_bytes=2, generation=0):
+        # A corpus with no dumps ingested yet; nothing is written until update. A rebuild passes the generation
+        # of the corpus it replaces so its shard file names don't collide with the live ones.
+        if not 1 <= prefix_bytes <= 3:
+            raise ValueError("prefix_bytes must be between 1 and 3")
+        return cls(directory, {"version": cls.VERSION, "prefix_bytes": prefix_bytes, "generation": generation,
+                               "entries": 0, "occurrences": 0, "sources": [], "shards": {}})
+
+    @classmethod
+    def open(cls, directory):
+        # Load the manifest of an existing corpus
+        with open(os.path.join(directory, cls.MANIFEST), encoding="utf-8") as file:
+            return cls(directory, json.load(file))
+
+    def close(self):
+        # Unmap the filter
+        if self.bloom is not None:
+            self.bloom.close()
+            self.bloom = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def entries(self):
+        # Number of distinct hashes
+        return self.manifest["entries"]
+
+    @property
+    def occurrences(self):
+        # Number of lines counted over all dumps
+        return self.manifest["occurrences"]
+
+    def count(self, password):
+        # Number of times the password occurs in the ingested dumps (0 if it never does)
+        return self.count_digest(password_hash(password))
+
+    def count_digest(self, digest):
+        # Number of occurrences of a SHA-1 digest. The filter, if any, rules most absent digests out; the others
+        # are looked up in the one shard of their prefix.
+        self.lookups += 1
+        if self.bloom is not None and not self.bloom.might_contain(digest):
+            self.filtered += 1
+            return 0
+        count = self._exact_count(digest)
+        if count == 0 and self.bloom is not None:
+            self.false_positives += 1
+        return count
+
+    def _exact_count(self, digest):
+        shard = self.shards.get(digest[:self.prefix_bytes].hex())
+        if shard is None:
+            return 0
+        key = digest[self.prefix_bytes:]
+        record = self._record
+        with open(os.path.join(self.directory, shard["file"]), "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                low, high = 0, shard["entries"]
+                while low < high:
+                    middle = (low + high) // 2
+                    suffix, count = record.unpack_from(data, middle * record.size)
+                    if suffix < key:
+                        low = middle + 1
+                    elif suffix > key:
+                        high = middle
+                    else:
+                        return count
+        return 0
+
+    def digests(self):
+        # Every SHA-1 digest in the corpus, in order
+        record = self._record
+        for name in sorted(self.shards):
+            prefix = bytes.fromhex(name)
+            for suffix, _ in _read_records(os.path.join(self.directory, self.shards[name]["file"]), record, 1 << 20):
+                yield prefix + suffix
+
+    def build_filter(self, false_positive_rate=0.01, capacity=None):
+        # Build the Bloom filter of the corpus for at least capacity entries (default: the current entries)
+        capacity = max(capacity or 0, self.entries, 1)
+        path = os.path.join(self.directory, self.FILTER)
+        with BloomFilter.create(path + ".tmp", capacity, false_positive_rate) as bloom:
+            for digest in self.digests():
+                bloom.add(digest)
+        os.replace(path + ".tmp", path)
+        self.close()
+        self.bloom = BloomFilter.open(path)
+        self._write_manifest(dict(self.manifest, filter={"file": self.FILTER, "capacity": capacity,
+                                                         "false_positive_rate": false_positive_rate}))
+
+    @classmethod
+    def update(cls, directory, paths, memory_mb=256, prefix_bytes=2, source_format=AUTO, rebuild=False, progress=None):
+        # Ingest the dumps in paths that are not in the corpus yet and return the updated corpus. Dumps that
+        # changed since they were ingested are an error; pass rebuild=True to start over from the given dumps.
+        os.makedirs(directory, exist_ok=True)
+        rebuilt_filter = None
+        if rebuild or not os.path.exists(os.path.join(directory, cls.MANIFEST)):
+            generation = 0
+            if os.path.exists(os.path.join(directory, cls.MANIFEST)):
+                with cls.open(directory) as previous:
+                    rebuilt_filter = previous.manifest.get("filter")
+                    generation = previous.manifest["generation"]
+            corpus = cls.empty(directory, prefix_bytes, generation)
+        else:
+            corpus = cls.open(directory)
+            if corpus.prefix_bytes != prefix_bytes:
+                raise ValueError(f"corpus uses {corpus.prefix_bytes}-byte prefixes; rebuild to change it")
+
+        ingested = {source["path"]: source for source in corpus.manifest["sources"]}
+        sources = []
+        for path in paths:
+            stat = os.stat(path)
+            source = {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+            previous = ingested.get(source["path"])
+            if previous is not None:
+                if (previous["size"], previous["mtime_ns"]) != (source["size"], source["mtime_ns"]):
+                    raise ValueError(f"{path} changed since it was ingested; rebuild the corpus")
+                logger.info("Skipping %s, already ingested", path)
+                continue
+            source["format"] = sniff_format(path) if source_format == AUTO else source_format
+            ingested[source["path"]] = source
+            sources.append(source)
+        if not sources:
+            return corpus
+
+        memory = memory_mb * 1024 * 1024
+        max_entries = max(1, memory // ENTRY_MEMORY)
+        buffer_size = max(1 << 16, memory // (2 * MAX_FAN_IN))
+        with tempfile.TemporaryDirectory(dir=directory, prefix="runs-") as temp:
+            runs = []
+            counts = {}
+            for source in sources:
+                records = 0
+                with open(source["path"], "rb") as dump:
+                    for digest, count in read_records(dump, source["format"]):
+                        counts[digest] = counts.get(digest, 0) + count
+                        records += 1
+                        if len(counts) >= max_entries:
+                            runs.append(_spill(counts, temp))
+                            counts = {}
+                        if progress is not None and records % WRITE_BATCH == 0:
+                            progress.advance(WRITE_BATCH)
+                if progress is not None:
+                    progress.advance(records % WRITE_BATCH)
+                source["records"] = records
+            if counts:
+                runs.append(_spill(counts, temp))
+            counts = None
+            runs = _reduce_runs(runs, temp, buffer_size)
+            records = merge_counts([_read_records(run, _RUN_RECORD, buffer_size) for run in runs])
+            if corpus.bloom is None:
+                corpus._merge(records, sources, buffer_size)
+            else:
+                # The filter gains the new digests before the manifest that lists them is published
+                with BloomFilter.open(corpus.bloom.file.name, writable=True) as bloom:
+                    corpus._merge(_added_to(bloom, records), sources, buffer_size)
+                    bloom.entries = corpus.bloom.entries = corpus.entries
+
+        settings = rebuilt_filter or corpus.manifest.get("filter")
+        if settings and (rebuilt_filter or corpus.entries > settings["capacity"]):
+            capacity = settings["capacity"] if rebuilt_filter else 2 * corpus.entries
+            corpus.build_filter(settings["false_positive_rate"], capacity)
+        return corpus
+
+    def _write_manifest(self, manifest):
+        # Atomically replace the manifest
+        path = os.path.join(self.directory, self.MANIFEST)
+        with open(path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+        self.manifest = manifest
+        self.shards = manifest["shards"]
+
+    def _merge(self, records, sources, buffer_size):
+        # Merge sorted (digest, count) records into the shards of their prefixes, then publish the new manifest
+        prefix_bytes = self.prefix_bytes
+        generation = self.manifest["generation"] + 1
+        shards = dict(self.shards)
+        for prefix, group in groupby(records, key=lambda record: record[0][:prefix_bytes]):
+            name = prefix.hex()
+            stream = ((digest[prefix_bytes:], count) for digest, count in group)
+            previous = shards.get(name)
+            if previous is not None:
+                old = _read_records(os.path.join(self.directory, previous["file"]), self._record, buffer_size)
+                stream = merge_counts([stream, old])
+            file_name = f"{name}.{generation}.shard"
+            with open(os.path.join(self.directory, file_name), "wb") as shard:
+                entries, occurrences = _write_records(shard, stream, self._record)
+            shards[name] = {"file": file_name, "entries": entries, "occurrences": occurrences}
+
+        manifest = dict(self.manifest, generation=generation, shards=shards,
+                        sources=self.manifest["sources"] + sources,
+                        entries=sum(shard["entries"] for shard in shards.values()),
+                        occurrences=sum(shard["occurrences"] for shard in shards.values()))
+        self._write_manifest(manifest)
+
+        # Shard files replaced by this generation, or left over from an interrupted update
+        referenced = {shard["file"] for shard in shards.values()}
+        for file_name in os.listdir(self.directory):
+            if _SHARD_FILE.fullmatch(file_name) and file_name not in referenced:
+                os.remove(os.path.join(self.directory, file_name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query a sharded breach corpus.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Add breach dumps to a corpus directory, creating it if needed.")
+    build_parser.add_argument("directory")
+    build_parser.add_argument("dumps", nargs="+", help="Files with one password per line or HIBP-style SHA1HEX:count lines.")
+    build_parser.add_argument("--memory-mb", type=int, default=256, help="Memory cap for sorting.")
+    build_parser.add_argument("--prefix-bytes", type=int, default=2, help="Hash prefix bytes per shard (2 = 65536 shards).")
+    build_parser.add_argument("--format", choices=[AUTO, PLAIN, HIBP], default=AUTO)
+    build_parser.add_argument("--rebuild", action="store_true", help="Discard the existing corpus and ingest only the given dumps.")
+    build_parser.add_argument("--no-progress", action="store_true", help="Do not report progress on stderr.")
+    filter_parser = commands.add_parser("filter", help="Build the Bloom filter of a corpus directory.")
+    filter_parser.add_argument("directory")
+    filter_parser.add_argument("--false-positive-rate", type=float, default=0.01)
+    filter_parser.add_argument("--capacity", type=int, default=None, help="Entries to size for (default: the current entries).")
+    query_parser = commands.add_parser("query", help="Look passwords up in a corpus directory.")
+    query_parser.add_argument("directory")
+    query_parser.add_argument("passwords", nargs="+")
+    stats_parser = commands.add_parser("stats", help="Measure the filter on random absent hashes and show its size.")
+    stats_parser.add_argument("directory")
+    stats_parser.add_argument("--probes", type=int, default=100000)
+    stats_parser.add_argument("--size-for", type=int, default=10 ** 9, help="Also show the filter size for this many entries.")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+        progress = None if args.no_progress else ProgressReporter("Read").start()
+        try:
+            corpus = BreachCorpus.update(args.directory, args.dumps, args.memory_mb, args.prefix_bytes, args.format,
+                                         args.rebuild, progress)
+        finally:
+            if progress is not None:
+                progress.close()
+        print(f"{args.directory}: {corpus.entries:,} distinct passwords, {corpus.occurrences:,} occurrences, "
+              f"{len(corpus.shards):,} shards, {len(corpus.manifest['sources'])} dumps")
+    elif args.command == "filter":
+        with BreachCorpus.open(args.directory) as corpus:
+            corpus.build_filter(args.false_positive_rate, args.capacity)
+            print(f"{corpus.FILTER}: {corpus.bloom.size / 2 ** 20:,.1f} MiB for {corpus.entries:,} entries, "
+                  f"expected false-positive rate {corpus.bloom.expected_false_positive_rate:.3%}")
+    elif args.command == "query":
+        with BreachCorpus.open(args.directory) as corpus:
+            for password in args.passwords:
+                print(f"{password}: seen {corpus.count(password):,} times")
+    else:
+        with BreachCorpus.open(args.directory) as corpus:
+            print(f"{args.directory}: {corpus.entries:,} distinct passwords in {len(corpus.shards):,} shards")
+            probes = [os.urandom(HASH_SIZE) for _ in range(args.probes)]
+            timings = {}
+            for label, bloom in (("exact", None), ("filtered", corpus.bloom)):
+                if label == "filtered" and bloom is None:
+                    break
+                corpus.bloom, corpus.lookups, corpus.filtered, corpus.false_positives = bloom, 0, 0, 0
+                start = time.perf_counter()
+                for digest in probes:
+                    corpus.count_digest(digest)
+                timings[label] = (time.perf_counter() - start) / max(1, args.probes)
+            print(f"Exact lookup: {timings['exact'] * 1e6:,.1f} us")
+            if corpus.bloom is None:
+                print("No filter; build one with the filter command.")
+            else:
+                bloom = corpus.bloom
+                rate = bloom.false_positive_rate
+                bits, hashes = parameters(args.size_for, rate)
+                print(f"Filter: {bloom.size / 2 ** 20:,.1f} MiB, {bloom.hashes} hashes, {bloom.entries:,} entries, "
+                      f"target false-positive rate {rate:.3%}, expected {bloom.expected_false_positive_rate:.3%}")
+                print(f"Measured false-positive rate: {corpus.false_positives / max(1, corpus.lookups):.3%} "
+                      f"({corpus.false_positives:,} of {corpus.lookups:,} absent hashes)")
+                print(f"Lookups saved: {corpus.filtered:,} of {corpus.lookups:,}; "
+                      f"lookup with filter: {timings['filtered'] * 1e6:,.1f} us")
+                print(f"Filter for {args.size_for:,} entries at {rate:.3%}: {bits / 8 / 2 ** 20:,.1f} MiB, {hashes} hashes")
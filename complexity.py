@@ -1,12 +1,64 @@
 import re
-import bisect
+import metrics
+from corpus_index import CommonPasswordIndex
+from entropy import GuessEstimator
+from keyboard import LAYOUTS
+from sequences import find_repeats, find_sequences
+
+class PasswordAnalysis:
+    # Result of a single scan over a password, shared by security_level and feedback_on_improvement
+    __slots__ = ('length', 'has_upper', 'has_lower', 'has_digit', 'has_special',
+                 'number_sequence_ok', 'consecutive_letters_ok', 'qwerty_ok', 'sequences', 'repeats')
+
+    def __init__(self, length, has_upper, has_lower, has_digit, has_special,
+                 number_sequence_ok, consecutive_letters_ok, qwerty_ok, sequences=(), repeats=()):
+        self.length = length
+        self.has_upper = has_upper
+        self.has_lower = has_lower
+        self.has_digit = has_digit
+        self.has_special = has_special
+        self.number_sequence_ok = number_sequence_ok
+        self.consecutive_letters_ok = consecutive_letters_ok
+        self.qwerty_ok = qwerty_ok
+        # SequenceSpan and RepeatSpan lists from sequences.py, used for feedback
+        self.sequences = sequences
+        self.repeats = repeats
+
+    @property
+    def complexity_ok(self):
+        # Check if every character class is present
+        return self.has_upper and self.has_lower and self.has_digit and self.has_special
+
+    @property
+    def consecutive_characters_ok(self):
+        # Check if no consecutive character pattern was found
+        return self.number_sequence_ok and self.consecutive_letters_ok and self.qwerty_ok
+
 
 class PasswordSecurityChecker:
+    SPECIAL_CHARACTERS = frozenset("!@#$%^&*()-_=+[]{}|;:'\",.<>/?`~")
+    ASCII_LETTERS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+    KEYBOARD_LAYOUTS = ("qwerty",)
+    NUMBER_RUN = re.compile(r'(\d{3,})')
+    _letter_run_patterns = {}
+
     def __init__(self, password, common_passwords):
         # Initialize PasswordSecurityChecker with the given password and common passwords list
+        self._analysis = None
         self.password = password
         self.common_passwords = common_passwords
 
+    @property
+    def password(self):
+        # Getter for the password being checked
+        return self._password
+
+    @password.setter
+    def password(self, password):
+        # Setter for the password; drops the cached analysis of the previous password
+        self._password = password
+        self._analysis = None
+
     def check_length(self, min_length=8):
         # Check if the password meets the minimum length requirement
         return len(self.password) >= min_length
@@ -25,50 +77,39 @@ class PasswordSecurityChecker:
 
     def check_special_character(self):
         # Check if the password contains at least one special character
-        special_characters = "!@#$%^&*()-_=+[]{}|;:'\",.<>/?`~"
-        return any(char in special_characters for char in self.password)
-
-    def find_next(self, x, a):
-        # Find the next element in the list x greater than a
-        i = bisect.bisect_right(x, a)
-        if i < len(x):
-            return x[i]
-        return None
+        return any(char in self.SPECIAL_CHARACTERS for char in self.password)
 
     def is_sequence(self, x):
-        # Check if the elements in the list x form a sequence (ascending or descending)
-        for i in range(len(x) - 1):
-            next_char = self.find_next(x, x[i])
-            if next_char and ((x[i].isdigit() and next_char.isdigit() and (int(x[i]) + 1 == int(next_char) or int(x[i]) - 1 == int(next_char)))):
-                return False
-        return True
+        # Check if the characters of x form one arithmetic sequence with a fixed step, like "123", "9876" or "135"
+        spans = find_sequences(x)
+        return len(spans) == 1 and spans[0].start == 0 and spans[0].end == len(x)
 
     def extract_consecutive_numbers(self):
         # Extract 3 or more consecutive numbers from the password
-        pattern = re.compile(r'(\d{3,})')
-        matches = re.findall(pattern, self.password)
-        return [match for match in matches]
+        return self.NUMBER_RUN.findall(self.password)
 
     def extract_consecutive_letters(self, min_length):
         # Extract consecutive letters of at least min_length from the password
-        pattern = re.compile(r'([a-zA-Z]{%d,})' % min_length)
-        matches = re.findall(pattern, self.password)
-        return [match.lower() for match in matches]
-
-    def check_number_sequence(self):
-        # Check if the password contains sequences of three or more consecutive numbers
-        extracted_numbers = self.extract_consecutive_numbers()
-
-        if not extracted_numbers:
-            return True
+        pattern = self._letter_run_patterns.get(min_length)
+        if pattern is None:
+            pattern = self._letter_run_patterns[min_length] = re.compile(r'([a-zA-Z]{%d,})' % min_length)
+        return [match.lower() for match in pattern.findall(self.password)]
 
-        results = [self.is_sequence(number) for number in extracted_numbers]
-        return any(results)
+    def _number_sequence_ok(self, extracted_numbers):
+        # Check extracted runs of three or more digits for arithmetic sequences such as "123", "9876" or "135"
+        return not any(find_sequences(number) for number in extracted_numbers)
 
-    def check_consecutive_letters(self, min_length=4):
-        # Check if the password contains sequences of consecutive letters from common passwords
-        extracted_letters = self.extract_consecutive_letters(min_length)
+    def _consecutive_letters_ok(self, extracted_letters, min_length):
+        # Check extracted lowercase letter runs against the common passwords
+        if min_length <= CommonPasswordIndex.MAX_WINDOW:
+            # Look every window up in the prebuilt n-gram index shared by all checkers on this corpus
+            index = CommonPasswordIndex.shared(self.common_passwords, min_length)
+            if metrics.enabled:
+                metrics.record_examined("consecutive_letters.windows", sum(max(0, len(substring) - min_length + 1) for substring in extracted_letters))
+            return not any(index.matches_any_window(substring) for substring in extracted_letters)
 
+        if metrics.enabled:
+            metrics.record_examined("consecutive_letters.corpus_entries", len(self.common_passwords))
         for common_password in self.common_passwords:
             common_password_lower = common_password.lower()
             for substring in extracted_letters:
@@ -79,20 +120,31 @@ class PasswordSecurityChecker:
 
         return True
 
-    def check_consecutive_qwerty(self):
-        # Check if the password contains sequences of consecutive letters from common QWERTY sequences
-        qwerty_sequences = ['qwerty', 'asdfgh', 'zxcvbn', 'poiuyt', 'lkjhgf', 'mnbvcx']
-        extracted_letters = self.extract_consecutive_letters(min_length=3)
+    def _qwerty_ok(self, password):
+        # Check the password for walks of 3 or more adjacent keys along a row, column or diagonal.
+        # Walks that change direction at every key (like "qwa") are not counted.
+        if metrics.enabled:
+            metrics.record_examined("consecutive_qwerty.keys", len(password) * len(self.KEYBOARD_LAYOUTS))
 
-        for sequence in qwerty_sequences:
-            for substring in extracted_letters:
-                # Check if at least 3 consecutive letters match with any part of the QWERTY sequence or its reverse
-                for i in range(len(substring) - 2):
-                    if sequence.lower().find(substring[i:i+3]) != -1 or sequence.lower()[::-1].find(substring[i:i+3]) != -1:
-                        return False
+        for name in self.KEYBOARD_LAYOUTS:
+            for walk in LAYOUTS[name].find_walks(password):
+                if walk.turns <= walk.j - walk.i - 2:
+                    return False
 
         return True
 
+    def check_number_sequence(self):
+        # Check if the password contains sequences of three or more consecutive numbers
+        return self._number_sequence_ok(self.extract_consecutive_numbers())
+
+    def check_consecutive_letters(self, min_length=4):
+        # Check if the password contains sequences of consecutive letters from common passwords
+        return self._consecutive_letters_ok(self.extract_consecutive_letters(min_length), min_length)
+
+    def check_consecutive_qwerty(self):
+        # Check if the password contains sequences of consecutive letters from common QWERTY sequences
+        return self._qwerty_ok(self.password)
+
     def check_complexity(self):
         # Check overall complexity of the password
         return self.check_uppercase() and self.check_lowercase() and self.check_digit() and self.check_special_character()
@@ -105,11 +157,62 @@ class PasswordSecurityChecker:
             and self.check_consecutive_qwerty()
         )
 
+    def analyze(self):
+        # Scan the password once and compute every check together; the result is cached until the password changes
+        if self._analysis is not None:
+            return self._analysis
+
+        password = self._password
+        has_upper = has_lower = has_digit = has_special = False
+        letter_runs = []
+        run_start = None
+
+        for i, char in enumerate(password):
+            if char.isupper():
+                has_upper = True
+            if char.islower():
+                has_lower = True
+            if char.isdigit():
+                has_digit = True
+            if char in self.SPECIAL_CHARACTERS:
+                has_special = True
+
+            # Track maximal runs of ASCII letters
+            if char in self.ASCII_LETTERS:
+                if run_start is None:
+                    run_start = i
+            elif run_start is not None:
+                letter_runs.append(password[run_start:i])
+                run_start = None
+        if run_start is not None:
+            letter_runs.append(password[run_start:])
+
+        letter_runs = [run.lower() for run in letter_runs if len(run) >= 4]
+        sequences = find_sequences(password)
+        self._analysis = PasswordAnalysis(
+            length=len(password),
+            has_upper=has_upper,
+            has_lower=has_lower,
+            has_digit=has_digit,
+            has_special=has_special,
+            number_sequence_ok=not any(span.kind == 'digits' for span in sequences),
+            consecutive_letters_ok=self._consecutive_letters_ok(letter_runs, 4),
+            qwerty_ok=self._qwerty_ok(password),
+            sequences=sequences,
+            repeats=find_repeats(password),
+        )
+        return self._analysis
+
     def security_level(self):
         # Determine the security level of the password based on various checks
-        length_check = self.check_length()
-        complexity_check = self.check_complexity()
-        consecutive_characters_check = self.check_consecutive_characters()
+        return self.level_from_analysis(self.analyze())
+
+    @staticmethod
+    def level_from_analysis(analysis):
+        # Security level for the result of analyze()
+        length_check = analysis.length >= 8
+        complexity_check = analysis.complexity_ok
+        consecutive_characters_check = analysis.consecutive_characters_ok
 
         if length_check and complexity_check and consecutive_characters_check:
             return "Very Strong"
@@ -120,26 +223,56 @@ class PasswordSecurityChecker:
         else:
             return "Weak"
 
+    def estimate_guesses(self):
+        # Estimate how many guesses an attacker needs for the password (see entropy.GuessEstimate)
+        return GuessEstimator.shared(self.common_passwords).estimate(self.password)
+
+    def breach_count(self, breach_corpus):
+        # Number of times the password occurs in a breach corpus (see breach_corpus.BreachCorpus); 0 if never.
+        # A corpus with a Bloom filter asks the filter first and only searches a shard on a possible hit.
+        return breach_corpus.count(self.password)
+
     def feedback_on_improvement(self):
         # Provide feedback on how to improve the password strength
+        return self.feedback_from_analysis(self.analyze())
+
+    @staticmethod
+    def feedback_from_analysis(analysis):
+        # Improvement feedback for the result of analyze()
+        if PasswordSecurityChecker.level_from_analysis(analysis) == "Very Strong":
+            return []
+
         feedback = []
 
-        if not self.check_uppercase():
+        if not analysis.has_upper:
             feedback.append("Add an uppercase letter.")
-        if not self.check_lowercase():
+        if not analysis.has_lower:
             feedback.append("Add a lowercase letter.")
-        if not self.check_digit():
+        if not analysis.has_digit:
             feedback.append("Add a digit.")
-        if not self.check_special_character():
+        if not analysis.has_special:
             feedback.append("Add a special character.")
-        if not self.check_number_sequence():
-            feedback.append("Avoid using 3 consecutive numbers.")
-        if not self.check_consecutive_letters():
+        if not analysis.number_sequence_ok:
+            feedback.append(f"Avoid using 3 consecutive numbers such as {_quoted(analysis.sequences, 'digits')}.")
+        if any(span.kind == 'letters' for span in analysis.sequences):
+            feedback.append(f"Avoid letter sequences such as {_quoted(analysis.sequences, 'letters')}.")
+        if analysis.repeats:
+            feedback.append(f"Avoid repeated characters or blocks such as {_quoted(analysis.repeats)}.")
+        if not analysis.consecutive_letters_ok:
             feedback.append("Avoid using 4 consecutive letters from common passwords.")
-        if not self.check_consecutive_qwerty():
-            feedback.append("Avoid using 3 consecutive letters from the QWERTY keyboard.")
+        if not analysis.qwerty_ok:
+            feedback.append("Avoid keyboard walks of 3 or more adjacent keys, such as \"qwe\", \"1qaz\" or \"!@#\".")
+
+        return feedback
 
-        return feedback if self.security_level() != "Very Strong" else []
+
+def _quoted(spans, kind=None):
+    # Distinct span tokens as a quoted, comma-separated list
+    tokens = []
+    for span in spans:
+        if (kind is None or span.kind == kind) and span.token not in tokens:
+            tokens.append(span.token)
+    return ", ".join(f'"{token}"' for token in tokens)
 
 if __name__ == "__main__":
     test_password = "asdfg123"
@@ -155,19 +288,7 @@ if __name__ == "__main__":
         "abc123def",
         "!@#$%^&*",
     ]
-    common_passwords = [
-        "password", "123456", "qwerty", "admin", "letmein",
-        "welcome", "1234", "12345", "abc123", "123abc",
-        "password1", "password123", "123qwe", "qwerty123",
-        "iloveyou", "sunshine", "123321", "qwertyuiop", "admin123",
-        "password!", "123!abc", "passw0rd", "secret", "football",
-        "qwerty12345", "123!@#qwe", "test123", "123qwe!@#",
-        "trustno1", "hello123", "monkey", "superman", "letmein123",
-        "123!@#qweQAZ", "asdfgh", "123abc!", "welcome123", "pass123",
-        "qazwsx", "letmein!", "1q2w3e", "1234abcd", "abc123!",
-        "password12", "pass1234", "adminadmin", "12345qwert", "qwert12345",
-        "abcdef", "password1234", "password12345", "admin1234", "password!",
-    ]
+    from main import common_passwords
 
     checker = PasswordSecurityChecker(test_password, common_passwords)
 
@@ -177,6 +298,8 @@ if __name__ == "__main__":
     print(f"Consecutive Letters Check: {checker.check_consecutive_letters()}")
     print(f"Consecutive QWERTY Check: {checker.check_consecutive_qwerty()}")
     print(f"\nOverall Security Level: {checker.security_level()}")
+    estimate = checker.estimate_guesses()
+    print(f"Estimated Guesses: 10^{estimate.guesses_log10:.1f} (score {estimate.score}/4)")
 
     if not checker.check_complexity():
         improvement_feedback = checker.feedback_on_improvement()
@@ -0,0 +1,271 @@
+# Memory-mapped common-password corpus
+#
+# A Python list of millions of short strings costs well over a gigabyte per process and takes seconds to load.
+# CorpusFile stores the corpus once on disk in a compact read-only format that is opened with mmap, so every
+# worker process shares the same page-cache pages and opening it costs nothing up front:
+#
+#   header   magic, version, n-gram window, entry count, blob size, longest entry
+#   offsets  (count + 1) little-endian uint64 offsets of the entries in the blob
+#   ranks    count little-endian uint32 ranks (1 = most common), in blob order
+#   directory 65537 little-endian uint32 indexes of the first entry whose first two bytes (a one-byte entry is
+#            padded with a zero byte) are at least each 16-bit value
+#   blob     the distinct lowercased entries, UTF-8 encoded and sorted bytewise
+#   bitmap   the CommonPasswordIndex n-gram bitmap of the corpus
+#
+# Entries are lowercased when the file is built, each keeping the best rank of its case variants, so lookups are
+# case-insensitive like the rank table the guess estimator builds from a list. Exact membership and prefix
+# queries start from the directory range of their first two bytes and binary search the sorted blob from there;
+# letter-window queries go through the embedded n-gram bitmap. A CorpusFile can be passed to
+# PasswordSecurityChecker in place of the common password list.
+#
+# Usage:
+#   python corpus_file.py build common.txt common.cpf
+#   python corpus_file.py query common.cpf password --prefix pass
+#   checker = PasswordSecurityChecker(password, CorpusFile.open("common.cpf"))
+
+import mmap
+import os
+import struct
+
+from corpus_index import CommonPasswordIndex
+
+_OFFSET = struct.Struct("<Q")
+_SPAN = struct.Struct("<QQ")
+_RANK = struct.Struct("<I")
+DIRECTORY_SIZE = 65537
+
+
+def _directory_key(entry):
+    # 16-bit directory slot of the first two bytes of an entry
+    if not entry:
+        return 0
+    return (entry[0] << 8) | (entry[1] if len(entry) > 1 else 0)
+
+
+class CorpusFile:
+    MAGIC = b"CPWF"
+    VERSION = 2
+    _HEADER = struct.Struct(">4sBBxxQQQ")
+
+    def __init__(self, data, file=None):
+        # Initialize the corpus over a buffer in the CorpusFile format (usually an mmap)
+        magic, version, window, count, blob_size, max_length = self._HEADER.unpack_from(data)
+        if magic != self.MAGIC:
+            raise ValueError("not a common-password corpus file")
+        if version != self.VERSION:
+            raise ValueError(f"corpus file version {version} is not supported; rebuild it with corpus_file.py build")
+        self.data = data
+        self.file = file
+        self.count = count
+        self.max_length = max_length
+        self._offsets = self._HEADER.size
+        self._ranks = self._offsets + (count + 1) * _OFFSET.size
+        self._directory = self._ranks + count * _RANK.size
+        self._blob = self._directory + DIRECTORY_SIZE * _RANK.size
+        bitmap_start = self._blob + blob_size
+        bitmap_size = CommonPasswordIndex.bitmap_size(window)
+        if len(data) < bitmap_start + bitmap_size:
+            raise ValueError("truncated common-password corpus file")
+        # The n-gram index reads its bits straight from the mapping
+        self._view = memoryview(data)
+        self.ngram_index = CommonPasswordIndex(window, self._view[bitmap_start:bitmap_start + bitmap_size])
+
+    @classmethod
+    def build(cls, passwords, path, window=4):
+        # Write the passwords (most common first) to path, lowercased; duplicates keep their first rank
+        ranks = {}
+        for rank, password in enumerate(passwords, start=1):
+            ranks.setdefault(password.lower().encode("utf-8", "surrogateescape"), rank)
+        entries = sorted(ranks)
+        index = CommonPasswordIndex.build((entry.decode("utf-8", "surrogateescape") for entry in entries), window)
+
+        offsets = bytearray()
+        position = 0
+        for entry in entries:
+            offsets += _OFFSET.pack(position)
+            position += len(entry)
+        offsets += _OFFSET.pack(position)
+        max_length = max((len(entry.decode("utf-8", "surrogateescape")) for entry in entries), default=0)
+        directory = [0] * DIRECTORY_SIZE
+        for entry in entries:
+            directory[_directory_key(entry) + 1] += 1
+        for key in range(1, DIRECTORY_SIZE):
+            directory[key] += directory[key - 1]
+
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(cls._HEADER.pack(cls.MAGIC, cls.VERSION, window, len(entries), position, max_length))
+            file.write(offsets)
+            file.write(b"".join(_RANK.pack(ranks[entry]) for entry in entries))
+            file.write(struct.pack(f"<{DIRECTORY_SIZE}I", *directory))
+            for entry in entries:
+                file.write(entry)
+            file.write(bytes(index.bitmap))
+        os.replace(temp_path, path)
+        return len(entries)
+
+    @classmethod
+    def open(cls, path):
+        # Map a corpus file read-only
+        file = open(path, "rb")
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            file.close()
+            raise
+        return cls(data, file)
+
+    def close(self):
+        # Unmap the file; the corpus cannot be used afterwards
+        self.ngram_index.bitmap.release()
+        self._view.release()
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __reduce__(self):
+        # Worker processes reopen the same file instead of copying the corpus
+        if self.file is None:
+            raise TypeError("only corpus files opened from a path can be pickled")
+        return CorpusFile.open, (self.file.name,)
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        # UTF-8 bytes of the i-th entry in sorted order
+        start, end = _SPAN.unpack_from(self.data, self._offsets + i * _OFFSET.size)
+        return self.data[self._blob + start:self._blob + end]
+
+    def _rank(self, i):
+        return _RANK.unpack_from(self.data, self._ranks + i * _RANK.size)[0]
+
+    def _directory_range(self, key):
+        # [low, high) of the entries whose first one or two bytes equal those of key
+        first = _directory_key(key)
+        last = first + (256 if len(key) == 1 else 1)
+        low = _RANK.unpack_from(self.data, self._directory + first * _RANK.size)[0]
+        high = _RANK.unpack_from(self.data, self._directory + last * _RANK.size)[0]
+        return low, high
+
+    def _search_range(self, key, low, high):
+        # [low, high) of the entries in [low, high) that start with key
+        if len(key) == 1 or (len(key) == 2 and key[1] != 0):
+            # The directory range is exact for one or two bytes (a second zero byte also matches one-byte entries)
+            return self._directory_range(key)
+        if key and low == 0 and high == self.count:
+            low, high = self._directory_range(key[:2])
+        low = self._lower_bound(key, low, high)
+        return low, self._prefix_end(key, low, high)
+
+    def _lower_bound(self, key, low=0, high=None):
+        # Index of the first entry in [low, high) not less than key
+        high = self.count if high is None else high
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _prefix_end(self, key, low, high):
+        # Index of the first entry in [low, high) after every entry that starts with key
+        size = len(key)
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[:size] <= key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __getitem__(self, i):
+        # The i-th (lowercased) entry in sorted order
+        if not 0 <= i < self.count:
+            raise IndexError("corpus index out of range")
+        return self._entry(i).decode("utf-8", "surrogateescape")
+
+    def __iter__(self):
+        # Every entry in sorted order
+        for i in range(self.count):
+            yield self._entry(i).decode("utf-8", "surrogateescape")
+
+    def get(self, password, default=None):
+        # Rank of an entry equal to the password ignoring case (1 = most common), or default
+        key = password.lower().encode("utf-8", "surrogateescape")
+        i, end = self._search_range(key, 0, self.count)
+        if i < end and self._entry(i) == key:
+            return self._rank(i)
+        return default
+
+    def __contains__(self, password):
+        # Check if the password is an entry of the corpus, ignoring case
+        return self.get(password) is not None
+
+    def prefix(self, prefix, limit=None):
+        # Entries starting with prefix (ignoring case), in sorted order, at most limit of them
+        key = prefix.lower().encode("utf-8", "surrogateescape")
+        i, end = self._search_range(key, 0, self.count)
+        found = 0
+        while i < end and (limit is None or found < limit):
+            yield self._entry(i).decode("utf-8", "surrogateescape")
+            found += 1
+            i += 1
+
+    def prefix_matches(self, text, start=0, max_length=None):
+        # (end, rank) for every entry equal to text[start:end]; text must already be lowercase, as it is in the
+        # guess estimator. The range of entries sharing the growing prefix narrows with each character, and the
+        # search stops as soon as it is empty.
+        matches = []
+        low, high = 0, self.count
+        stop = len(text) if max_length is None else min(len(text), start + max_length)
+        for end in range(start + 1, stop + 1):
+            key = text[start:end].encode("utf-8", "surrogateescape")
+            low, high = self._search_range(key, low, high)
+            if low >= high:
+                break
+            if self._entry(low) == key:
+                matches.append((end, self._rank(low)))
+        return matches
+
+    def contains_window(self, letters):
+        # Check if any window of a lowercase letter run occurs inside some entry
+        return self.ngram_index.matches_any_window(letters)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or query a memory-mapped common-password corpus.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Build a corpus file from a list with one password per line, most common first.")
+    build_parser.add_argument("input")
+    build_parser.add_argument("output")
+    build_parser.add_argument("--window", type=int, default=4, help="Letter n-gram length of the embedded window index.")
+    query_parser = commands.add_parser("query", help="Look passwords up in a corpus file.")
+    query_parser.add_argument("corpus")
+    query_parser.add_argument("passwords", nargs="*")
+    query_parser.add_argument("--prefix", action="append", default=[], help="List entries starting with this text.")
+    query_parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        with open(args.input, encoding="utf-8", errors="surrogateescape") as source:
+            count = CorpusFile.build((line.rstrip("\r\n") for line in source if line.strip()), args.output, args.window)
+        print(f"Wrote {count} entries to {args.output} ({os.path.getsize(args.output)} bytes)")
+    else:
+        with CorpusFile.open(args.corpus) as corpus:
+            for password in args.passwords:
+                rank = corpus.get(password)
+                print(f"{password}: {'rank ' + str(rank) if rank else 'not found'}")
+            for prefix in args.prefix:
+                print(f"{prefix}*: {', '.join(corpus.prefix(prefix, args.limit))}")
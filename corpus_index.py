@@ -0,0 +1,138 @@
+import re
+import struct
+
+class CommonPasswordIndex:
+    # Precomputed window matcher for the common-password substring check.
+    #
+    # check_consecutive_letters only ever asks one question: "does this lowercase
+    # letter window of length n occur anywhere inside any common password?".
+    # The answer depends on the window alone, so the corpus is compiled once into
+    # a table of every letter n-gram that occurs in it. Each window is encoded in
+    # base 26 and looked up in a bitmap, which makes the check linear in the
+    # password length no matter how many common passwords there are.
+
+    MAGIC = b"CPIX"
+    VERSION = 1
+    MAX_WINDOW = 6
+    _HEADER = struct.Struct(">4sBBxxQ")
+
+    # Indexes shared by every checker built on the same corpus object.
+    _shared = {}
+
+    def __init__(self, window, bitmap):
+        # Initialize the index from a window length and an n-gram bitmap
+        if not 1 <= window <= self.MAX_WINDOW:
+            raise ValueError(f"window must be between 1 and {self.MAX_WINDOW}")
+        if len(bitmap) != self.bitmap_size(window):
+            raise ValueError("bitmap size does not match window length")
+        self.window = window
+        self.bitmap = bitmap
+
+    @staticmethod
+    def bitmap_size(window):
+        # Number of bytes needed to hold one bit per possible letter n-gram
+        return (26 ** window + 7) // 8
+
+    @staticmethod
+    def encode(window_text):
+        # Encode a lowercase a-z window as its base-26 integer code
+        code = 0
+        for char in window_text:
+            code = code * 26 + (ord(char) - 97)
+        return code
+
+    @classmethod
+    def build(cls, common_passwords, window=4):
+        # Compile a corpus of common passwords into an n-gram bitmap
+        bitmap = bytearray(cls.bitmap_size(window))
+        pattern = re.compile(r'[a-z]{%d,}' % window)
+        for common_password in common_passwords:
+            for run in pattern.findall(common_password.lower()):
+                for i in range(len(run) - window + 1):
+                    code = cls.encode(run[i:i + window])
+                    bitmap[code >> 3] |= 1 << (code & 7)
+        return cls(window, bitmap)
+
+    @classmethod
+    def shared(cls, common_passwords, window=4):
+        # Return the index for a corpus, building it only the first time it is requested
+        if isinstance(common_passwords, cls):
+            if common_passwords.window != window:
+                raise ValueError("prebuilt index was compiled for a different window length")
+            return common_passwords
+        # Corpus files (corpus_file.CorpusFile) carry a prebuilt index
+        prebuilt = getattr(common_passwords, "ngram_index", None)
+        if prebuilt is not None and prebuilt.window == window:
+            return prebuilt
+        key = (id(common_passwords), window)
+        entry = cls._shared.get(key)
+        # The corpus object is kept alive in the cache so its id cannot be reused.
+        if entry is None or entry[0] is not common_passwords:
+            entry = (common_passwords, cls.build(common_passwords, window))
+            cls._shared[key] = entry
+        return entry[1]
+
+    @classmethod
+    def clear_shared(cls):
+        # Drop every cached index, e.g. after a corpus list has been modified in place
+        cls._shared.clear()
+
+    def __contains__(self, window_text):
+        # Check if a lowercase letter window occurs in any common password
+        code = self.encode(window_text)
+        return bool(self.bitmap[code >> 3] & (1 << (code & 7)))
+
+    def matches_any_window(self, letters):
+        # Check if any window of a lowercase letter run occurs in the corpus
+        window = self.window
+        if len(letters) < window:
+            return False
+        modulus = 26 ** (window - 1)
+        bitmap = self.bitmap
+        code = self.encode(letters[:window - 1])
+        for char in letters[window - 1:]:
+            code = (code % modulus) * 26 + (ord(char) - 97)
+            if bitmap[code >> 3] & (1 << (code & 7)):
+                return True
+        return False
+
+    def to_bytes(self):
+        # Serialize the index into a compact binary blob
+        return self._HEADER.pack(self.MAGIC, self.VERSION, self.window, len(self.bitmap)) + bytes(self.bitmap)
+
+    @classmethod
+    def from_bytes(cls, data):
+        # Rebuild an index from a blob produced by to_bytes
+        magic, version, window, size = cls._HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("not a common-password index")
+        start = cls._HEADER.size
+        bitmap = data[start:start + size]
+        if len(bitmap) != size:
+            raise ValueError("truncated common-password index")
+        return cls(window, bitmap)
+
+    def save(self, path):
+        # Write the index to a file so worker processes can load it without rebuilding
+        with open(path, 'wb') as file:
+            file.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        # Load an index written by save
+        with open(path, 'rb') as file:
+            return cls.from_bytes(file.read())
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Build an index from a corpus file (one password per line) and save it
+    if len(sys.argv) != 3:
+        print("Usage: python corpus_index.py <common_passwords.txt> <output.idx>")
+        sys.exit(1)
+
+    with open(sys.argv[1], encoding='utf-8', errors='replace') as corpus_file:
+        index = CommonPasswordIndex.build(line.rstrip('\r\n') for line in corpus_file)
+    index.save(sys.argv[2])
+    print(f"Saved {len(index.bitmap)}-byte index for window length {index.window} to {sys.argv[2]}")
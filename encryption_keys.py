@@ -0,0 +1,300 @@
+# Versioned encryption keys and key rotation
+#
+# KeyRing holds numbered AES keys, one of which is active for new encryptions. Every record it encrypts
+# starts with the ID of the key that sealed it, so old records stay readable after the active key changes:
+#
+#   version (1 byte, 0x01) | key ID (uint32, big-endian) | nonce (12 bytes) | ciphertext | GCM tag (16 bytes)
+#
+# The version byte and key ID are authenticated as associated data. KeyRotationJob re-encrypts one field of
+# every user record under a new key: it streams users from a store in userID order, re-encrypts on a process
+# pool, commits each batch in one transaction and records a checkpoint after every commit, so an interrupted
+# rotation resumes where it stopped. Records already under the target key are skipped, which keeps reruns
+# idempotent. A record that cannot be decrypted (corrupt, or sealed by a key missing from the keyring) does not
+# stop the rotation: it is logged, left as it is, and its userID is kept in the checkpoint and listed under
+# failed_user_ids in the summary. A run that resumes from the checkpoint retries those records before
+# continuing, so records repaired in the meantime are re-encrypted even when the scan itself has finished.
+#
+# Usage:
+#   python encryption_keys.py rotate users.db keys.json --checkpoint rotation.json
+
+import base64
+import json
+import logging
+import os
+import struct
+from collections import deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+
+RECORD_VERSION = 1
+RECORD_HEADER = struct.Struct(">BI")
+NONCE_SIZE = 12
+TAG_SIZE = 16
+# Errors raised by KeyRing.decrypt_string for records that are corrupt or sealed by an unknown key
+RECORD_ERRORS = (ValueError, KeyError, struct.error)
+
+logger = logging.getLogger(__name__)
+
+
+class KeyRing:
+    def __init__(self, keys=None, active_key_id=None):
+        # Initialize the keyring with a {key_id: key} mapping and the ID of the active key
+        self.keys = dict(keys or {})
+        self.active_key_id = active_key_id
+
+    def add_key(self, key_id, key, activate=False):
+        # Add a key under a new ID
+        if key_id in self.keys:
+            raise ValueError(f"Key ID {key_id} already exists.")
+        if len(key) not in (16, 24, 32):
+            raise ValueError("AES keys must be 16, 24 or 32 bytes long.")
+        self.keys[key_id] = key
+        if activate or self.active_key_id is None:
+            self.active_key_id = key_id
+
+    def generate_key(self, activate=True, key_size=32):
+        # Generate a random key with the next free ID and return its ID
+        key_id = max(self.keys, default=0) + 1
+        self.add_key(key_id, get_random_bytes(key_size), activate=activate)
+        return key_id
+
+    @staticmethod
+    def key_id_of(record):
+        # Get the ID of the key that encrypted a record
+        version, key_id = RECORD_HEADER.unpack_from(record)
+        if version != RECORD_VERSION:
+            raise ValueError("Unsupported encrypted record version.")
+        return key_id
+
+    def encrypt(self, plaintext, key_id=None):
+        # Encrypt bytes under the active key (or key_id) and return a self-describing record
+        key_id = self.active_key_id if key_id is None else key_id
+        header = RECORD_HEADER.pack(RECORD_VERSION, key_id)
+        nonce = get_random_bytes(NONCE_SIZE)
+        cipher = AES.new(self.keys[key_id], AES.MODE_GCM, nonce=nonce)
+        cipher.update(header)
+        ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+        return header + nonce + ciphertext + tag
+
+    def decrypt(self, record):
+        # Decrypt a record with whichever key it names
+        key_id = self.key_id_of(record)
+        key = self.keys.get(key_id)
+        if key is None:
+            raise KeyError(f"Key ID {key_id} is not in the keyring.")
+        start = RECORD_HEADER.size
+        nonce = record[start:start + NONCE_SIZE]
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(record[:start])
+        return cipher.decrypt_and_verify(record[start + NONCE_SIZE:-TAG_SIZE], record[-TAG_SIZE:])
+
+    def encrypt_string(self, plaintext_string):
+        # Encrypt a string into a base64 record, for storing in user records
+        return base64.b64encode(self.encrypt(plaintext_string.encode('utf-8'))).decode('ascii')
+
+    def decrypt_string(self, record_string):
+        # Decrypt a base64 record produced by encrypt_string
+        return self.decrypt(base64.b64decode(record_string)).decode('utf-8')
+
+    def save(self, path):
+        # Write the keyring to a file readable only by its owner
+        data = {
+            "active_key_id": self.active_key_id,
+            "keys": {str(key_id): base64.b64encode(key).decode('ascii') for key_id, key in self.keys.items()},
+        }
+        temp_path = path + ".tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # Load a keyring written by save
+        with open(path) as file:
+            data = json.load(file)
+        keys = {int(key_id): base64.b64decode(key) for key_id, key in data["keys"].items()}
+        return cls(keys, data["active_key_id"])
+
+
+_worker_keyring = None
+
+
+def _init_worker(keys, active_key_id):
+    global _worker_keyring
+    _worker_keyring = KeyRing(keys, active_key_id)
+
+
+def _reencrypt_chunk(items):
+    # Re-encrypt (user_id, record_string) pairs under the worker keyring's active key and return
+    # ([(user_id, old, new)], [(user_id, error)]) so one unreadable record doesn't fail the whole chunk
+    results, failures = [], []
+    for user_id, old in items:
+        try:
+            results.append((user_id, old, _worker_keyring.encrypt_string(_worker_keyring.decrypt_string(old))))
+        except RECORD_ERRORS as exc:
+            failures.append((user_id, f"{type(exc).__name__}: {exc}"))
+    return results, failures
+
+
+class KeyRotationJob:
+    def __init__(self, store, keyring, field='encryptedPassword', batch_size=1000, workers=None, checkpoint_path=None, progress=None):
+        # Initialize a job that re-encrypts field of every user under the keyring's active key.
+        # An optional ProgressReporter counts scanned users, with conflicts and failures reported as errors.
+        self.store = store
+        self.keyring = keyring
+        self.field = field
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.checkpoint_path = checkpoint_path
+        self.progress = progress
+        self.reencrypted = 0
+        self.skipped = 0
+        self.conflicts = 0
+        self.failed_user_ids = []
+
+    def load_checkpoint(self):
+        # Get the last committed userID for the current target key, or None to start from the beginning.
+        # Records that failed before the checkpoint are carried over into failed_user_ids.
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path) as file:
+            checkpoint = json.load(file)
+        if checkpoint.get("target_key_id") != self.keyring.active_key_id:
+            return None
+        self.failed_user_ids = list(checkpoint.get("failed_user_ids", []))
+        return checkpoint.get("last_user_id")
+
+    def save_checkpoint(self, last_user_id):
+        # Atomically record the last userID whose batch has been committed
+        if not self.checkpoint_path:
+            return
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump({"target_key_id": self.keyring.active_key_id, "last_user_id": last_user_id,
+                       "failed_user_ids": self.failed_user_ids}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _batches(self, users, checkpoint_id=None):
+        # Group users into batches of records that still need re-encryption, along with the records whose
+        # header can't even be read. Each batch comes with the userID to checkpoint once it is committed: the
+        # last one scanned, or checkpoint_id for users retried from an earlier run.
+        target = self.keyring.active_key_id
+        batch, failures, last_id, scanned = [], [], None, 0
+        for user in users:
+            last_id = user['userID']
+            scanned += 1
+            record = user.get(self.field)
+            try:
+                key_id = KeyRing.key_id_of(base64.b64decode(record)) if record else target
+            except RECORD_ERRORS as exc:
+                failures.append((last_id, f"{type(exc).__name__}: {exc}"))
+            else:
+                if key_id != target:
+                    batch.append((last_id, record))
+                else:
+                    self.skipped += 1
+            # Long runs of skipped users still advance the checkpoint
+            if scanned >= self.batch_size:
+                yield last_id if checkpoint_id is None else checkpoint_id, scanned, batch, failures
+                batch, failures, scanned = [], [], 0
+        if scanned:
+            yield last_id if checkpoint_id is None else checkpoint_id, scanned, batch, failures
+
+    def _commit(self, last_id, scanned, results, failures):
+        # Write one batch in a single transaction; records changed since they were read are left alone,
+        # and records that failed to re-encrypt are logged and remembered in the checkpoint
+        for user_id, error in failures:
+            logger.warning("Could not re-encrypt %s of user %s: %s", self.field, user_id, error)
+            self.failed_user_ids.append(user_id)
+        reencrypted = conflicts = 0
+        with self.store.transaction() as tx:
+            for user_id, old, new in results:
+                user = tx.get_user(user_id)
+                if user is None or user.get(self.field) != old:
+                    conflicts += 1
+                    continue
+                tx.update_user(user_id, {self.field: new})
+                reencrypted += 1
+        self.save_checkpoint(last_id)
+        self.reencrypted += reencrypted
+        self.conflicts += conflicts
+        if self.progress is not None:
+            errors = conflicts + len(failures)
+            self.progress.advance(scanned - errors, errors)
+
+    def run(self):
+        # Re-encrypt every record, resuming from the checkpoint, and return a summary
+        after_id = self.load_checkpoint()
+        # Records that failed in an earlier run are retried first; they are recorded again if still unreadable
+        retry_ids, self.failed_user_ids = self.failed_user_ids, []
+        retried = (user for user in map(self.store.get_user, retry_ids) if user is not None)
+        batches = chain(self._batches(retried, after_id),
+                        self._batches(self.store.iter_users(after_id=after_id, batch_size=self.batch_size)))
+        chunk_size = max(1, self.batch_size // self.workers)
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                 initargs=(self.keyring.keys, self.keyring.active_key_id)) as executor:
+            for last_id, scanned, batch, failures in batches:
+                futures = [executor.submit(_reencrypt_chunk, batch[i:i + chunk_size]) for i in range(0, len(batch), chunk_size)]
+                pending.append((last_id, scanned, futures, failures))
+                # Keep one batch in flight while the previous one commits
+                if len(pending) > 1:
+                    self._commit_pending(pending.popleft())
+            while pending:
+                self._commit_pending(pending.popleft())
+        return {"reencrypted": self.reencrypted, "skipped": self.skipped, "conflicts": self.conflicts,
+                "failed": len(self.failed_user_ids), "failed_user_ids": self.failed_user_ids}
+
+    def _commit_pending(self, pending):
+        # Collect the worker results of one submitted batch and commit them
+        last_id, scanned, futures, failures = pending
+        results = []
+        for future in futures:
+            chunk_results, chunk_failures = future.result()
+            results.extend(chunk_results)
+            failures.extend(chunk_failures)
+        self._commit(last_id, scanned, results, failures)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from progress import ProgressReporter
+    from storage import SQLiteUserStore
+
+    parser = argparse.ArgumentParser(description="Re-encrypt user records under a new key.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rotate_parser = commands.add_parser("rotate", help="Generate a new active key (unless resuming) and re-encrypt every record.")
+    rotate_parser.add_argument("database")
+    rotate_parser.add_argument("keyring")
+    rotate_parser.add_argument("--field", default="encryptedPassword")
+    rotate_parser.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted rotation.")
+    rotate_parser.add_argument("--batch-size", type=int, default=1000)
+    rotate_parser.add_argument("--workers", type=int, default=None)
+    rotate_parser.add_argument("--resume", action="store_true", help="Continue with the current active key instead of generating one.")
+    args = parser.parse_args()
+
+    keyring = KeyRing.load(args.keyring) if os.path.exists(args.keyring) else KeyRing()
+    if not args.resume or keyring.active_key_id is None:
+        keyring.generate_key(activate=True)
+        keyring.save(args.keyring)
+    print(f"Rotating records to key ID {keyring.active_key_id}")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    store = SQLiteUserStore(args.database)
+    # The per-scheme counts are kept by triggers, so their sum is the user count without a table scan
+    total = sum(store.count_by_hash_scheme().values())
+    with ProgressReporter("Re-encrypted", total=total) as progress:
+        job = KeyRotationJob(store, keyring, field=args.field, batch_size=args.batch_size, workers=args.workers,
+                             checkpoint_path=args.checkpoint, progress=progress)
+        summary = job.run()
+    print(summary)
+    store.close()
@@ -0,0 +1,405 @@
+# Guess-count strength estimation
+#
+# Estimates how many guesses an attacker needs for a password by splitting it into the patterns cracking tools
+# try first: common passwords (with case and l33t variations, forwards or reversed), keyboard walks, arithmetic
+# sequences, repeats, dates and years, plus brute force for whatever is left. Every candidate match gets a guess
+# count, and a dynamic program over the password finds the decomposition with the fewest total guesses, the
+# same model as zxcvbn: l! * product(match guesses) + 10000^(l - 1) for a sequence of l matches.
+#
+# Everything that does not depend on the password is built when the estimator is created: the corpus rank
+# table and a walk guess table for every keyboard layout in keyboard.py. Guess counts of case and l33t
+# variations and of repeated blocks are memoized. Guess counts are tracked as log10 values, so long passwords
+# never overflow.
+#
+# Usage:
+#   estimator = GuessEstimator(common_passwords)
+#   estimate = estimator.estimate("Summer2024!")
+#   estimate.guesses_log10, estimate.score, [match.pattern for match in estimate.sequence]
+
+import math
+import re
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+from corpus_file import CorpusFile
+from corpus_index import CommonPasswordIndex
+from keyboard import LAYOUTS
+from sequences import find_repeats, find_sequences
+
+BRUTEFORCE_CARDINALITY = 10
+MIN_GUESSES_BEFORE_GROWING_SEQUENCE = 10000
+MIN_SUBMATCH_GUESSES_SINGLE_CHAR = 10
+MIN_SUBMATCH_GUESSES_MULTI_CHAR = 50
+MIN_YEAR_SPACE = 20
+REFERENCE_YEAR = date.today().year
+MAX_WORD_LENGTH = 32
+MAX_SPATIAL_LENGTH = 64
+
+# log10 guess thresholds of the 0-4 scores
+SCORE_THRESHOLDS = (3, 6, 8, 10)
+
+L33T_TABLE = str.maketrans({
+    "4": "a", "@": "a", "8": "b", "(": "c", "{": "c", "3": "e", "6": "g", "9": "g",
+    "1": "i", "!": "i", "|": "l", "0": "o", "$": "s", "5": "s", "7": "t", "+": "t", "2": "z", "%": "x",
+})
+
+Match = namedtuple("Match", ("pattern", "i", "j", "token", "guesses_log10"))
+
+
+class GuessEstimate:
+    # Guess count and cheapest decomposition of one password
+    __slots__ = ("guesses_log10", "sequence")
+
+    def __init__(self, guesses_log10, sequence):
+        self.guesses_log10 = guesses_log10
+        self.sequence = sequence
+
+    @property
+    def guesses(self):
+        # Estimated number of guesses (inf beyond the float range)
+        return 10.0 ** self.guesses_log10 if self.guesses_log10 < 308 else math.inf
+
+    @property
+    def score(self):
+        # 0 (too guessable) to 4 (very unguessable)
+        for score, threshold in enumerate(SCORE_THRESHOLDS):
+            if self.guesses_log10 < threshold:
+                return score
+        return len(SCORE_THRESHOLDS)
+
+
+def _log10_sum(a, b):
+    # log10(10^a + 10^b)
+    high, low = (a, b) if a >= b else (b, a)
+    return high + math.log10(1.0 + 10.0 ** (low - high))
+
+
+@lru_cache(maxsize=None)
+def _log10_binomial_sum(total, limit):
+    # log10 of sum(C(total, i) for i in 1..limit)
+    return math.log10(sum(math.comb(total, i) for i in range(1, limit + 1)))
+
+
+@lru_cache(maxsize=65536)
+def uppercase_variations_log10(token):
+    # log10 of the guesses needed to find the capitalization of a word
+    if token.islower() or not any(char.isupper() for char in token):
+        return 0.0
+    if token.isupper() or (token[0].isupper() and token[1:].islower()) or (token[-1].isupper() and token[:-1].islower()):
+        return math.log10(2)
+    upper = sum(1 for char in token if char.isupper())
+    lower = sum(1 for char in token if char.islower())
+    return _log10_binomial_sum(upper + lower, min(upper, lower))
+
+
+@lru_cache(maxsize=65536)
+def l33t_variations_log10(token, word):
+    # log10 of the guesses needed to find which letters of word were substituted in token
+    total = 0.0
+    for letter in set(word):
+        subbed = unsubbed = 0
+        for char, plain in zip(token, word):
+            if plain == letter:
+                if char.lower() == letter:
+                    unsubbed += 1
+                else:
+                    subbed += 1
+        if subbed:
+            total += math.log10(2) if not unsubbed else _log10_binomial_sum(subbed + unsubbed, min(subbed, unsubbed))
+    return total
+
+
+def spatial_guesses_table(layout, max_length=MAX_SPATIAL_LENGTH):
+    # log10 guesses of a walk by (length, turns), precomputed for a keyboard layout
+    starts = layout.starting_positions
+    degree = layout.average_degree
+    table = [[0.0] * (max_length + 1) for _ in range(max_length + 1)]
+    for length in range(2, max_length + 1):
+        for turns in range(1, length):
+            guesses = 0
+            for i in range(2, length + 1):
+                for j in range(1, min(turns, i - 1) + 1):
+                    guesses += math.comb(i - 1, j - 1) * starts * degree ** j
+            table[length][turns] = math.log10(guesses)
+    return table
+
+
+def _date_splits(length):
+    # Ways to split a run of digits into three date parts, as (first end, second end)
+    return {
+        4: ((1, 2), (2, 3)),
+        5: ((1, 3), (2, 3)),
+        6: ((1, 2), (2, 4), (4, 5)),
+        7: ((1, 3), (2, 3), (4, 5), (4, 6)),
+        8: ((2, 4), (4, 6)),
+    }.get(length, ())
+
+
+def _two_digit_year(year):
+    return year + (1900 if year > 50 else 2000) if year < 100 else year
+
+
+def _valid_date(parts):
+    # Interpret three numbers as (year, month, day) in any of the usual orders; returns the year or None
+    for year, month_day in ((parts[2], parts[:2]), (parts[0], parts[1:])):
+        if not (year < 100 or 1000 <= year <= 2050):
+            continue
+        for month, day in (month_day, month_day[::-1]):
+            if 1 <= month <= 12 and 1 <= day <= 31:
+                return _two_digit_year(year)
+    return None
+
+
+def _year_space_log10(year):
+    return math.log10(max(abs(REFERENCE_YEAR - year), MIN_YEAR_SPACE))
+
+
+class GuessEstimator:
+    SEQUENCE_MAX_STEP = 5
+    DATE_WITH_SEPARATOR = re.compile(r"(\d{1,4})([\s/\\_.-])(\d{1,2})\2(\d{1,4})")
+    YEAR = re.compile(r"19\d\d|20\d\d")
+    MAX_REPEAT_BLOCK = 16
+
+    # Estimators shared by every checker built on the same corpus object.
+    _shared = {}
+
+    def __init__(self, common_passwords=(), layouts=tuple(LAYOUTS.values())):
+        # Precompute the corpus rank table and the keyboard tables. The corpus is a CorpusFile or any iterable of
+        # words in rank order; a set has no order, so each of its words gets the rank of the last entry.
+        self.ranks = {}
+        if isinstance(common_passwords, CorpusFile):
+            # Ranks are looked up in the mapped file instead of being copied into a dict
+            self.ranks = common_passwords
+            self.max_word_length = min(MAX_WORD_LENGTH, common_passwords.max_length)
+        else:
+            if isinstance(common_passwords, (CommonPasswordIndex, str, bytes)) or not hasattr(common_passwords, "__iter__"):
+                raise TypeError(f"Cannot rank words from a {type(common_passwords).__name__} corpus; "
+                                "pass an iterable of words or a CorpusFile (corpus_file.py)")
+            if isinstance(common_passwords, (set, frozenset)):
+                ranks = ((len(common_passwords), word) for word in common_passwords)
+            else:
+                ranks = enumerate(common_passwords, start=1)
+            for rank, word in ranks:
+                self.ranks.setdefault(word.lower(), rank)
+            self.max_word_length = min(MAX_WORD_LENGTH, max(map(len, self.ranks), default=0))
+        self.layouts = layouts
+        self.spatial_tables = {layout.name: spatial_guesses_table(layout) for layout in layouts}
+        self._repeat_base = lru_cache(maxsize=65536)(self._estimate_log10)
+
+    @classmethod
+    def shared(cls, common_passwords):
+        # Return the estimator for a corpus, building it only the first time it is requested
+        key = id(common_passwords)
+        entry = cls._shared.get(key)
+        # The corpus object is kept alive in the cache so its id cannot be reused.
+        if entry is None or entry[0] is not common_passwords:
+            entry = (common_passwords, cls(common_passwords))
+            cls._shared[key] = entry
+        return entry[1]
+
+    @classmethod
+    def clear_shared(cls):
+        # Drop every cached estimator, e.g. after a corpus list has been modified in place
+        cls._shared.clear()
+
+    def _word_matches(self, text):
+        # (i, j, rank) for every substring text[i:j] that is a corpus entry
+        ranks = self.ranks
+        n = len(text)
+        if isinstance(ranks, CorpusFile):
+            for i in range(n):
+                for j, rank in ranks.prefix_matches(text, i, self.max_word_length):
+                    yield i, j, rank
+            return
+        for i in range(n):
+            for j in range(i + 1, min(n, i + self.max_word_length) + 1):
+                rank = ranks.get(text[i:j])
+                if rank is not None:
+                    yield i, j, rank
+
+    def dictionary_matches(self, password):
+        # Common passwords inside the password, also reversed and with l33t substitutions undone
+        matches = []
+        if not self.ranks:
+            return matches
+        lower = password.lower()
+        if len(lower) != len(password):
+            # Some characters lowercase to several; keep those as they are so positions still line up
+            lower = "".join(char if len(char.lower()) != 1 else char.lower() for char in password)
+        n = len(password)
+
+        for i, j, rank in self._word_matches(lower):
+            token = password[i:j]
+            matches.append(Match("dictionary", i, j, token, math.log10(rank) + uppercase_variations_log10(token)))
+        for i, j, rank in self._word_matches(lower[::-1]):
+            if j - i > 1:
+                token = password[n - j:n - i]
+                matches.append(Match("reversed", n - j, n - i, token, math.log10(rank * 2) + uppercase_variations_log10(token)))
+        unleet = lower.translate(L33T_TABLE)
+        if unleet != lower:
+            for i, j, rank in self._word_matches(unleet):
+                plain = unleet[i:j]
+                if plain != lower[i:j]:
+                    token = password[i:j]
+                    guesses = math.log10(rank) + uppercase_variations_log10(token) + l33t_variations_log10(token, plain)
+                    matches.append(Match("l33t", i, j, token, guesses))
+        return matches
+
+    def spatial_matches(self, password):
+        # Keyboard walks of three or more keys on every layout, priced by length, turns and shifted keys
+        matches = []
+        for layout in self.layouts:
+            table = self.spatial_tables[layout.name]
+            for walk in layout.find_walks(password):
+                length = min(walk.j - walk.i, MAX_SPATIAL_LENGTH)
+                guesses = table[length][min(walk.turns, length - 1)]
+                unshifted = (walk.j - walk.i) - walk.shifted
+                if walk.shifted:
+                    guesses += math.log10(2) if not unshifted else _log10_binomial_sum(walk.shifted + unshifted, min(walk.shifted, unshifted))
+                matches.append(Match("spatial", walk.i, walk.j, walk.token, guesses))
+        return matches
+
+    def sequence_matches(self, password):
+        # Arithmetic runs of three or more digits or letters with a small step, like "abc", "9753" or "acegi"
+        matches = []
+        for span in find_sequences(password):
+            if abs(span.step) > self.SEQUENCE_MAX_STEP:
+                continue
+            first = span.token[0]
+            if first in "az09" or first in "AZ1":
+                base = 4
+            elif first.isdigit():
+                base = 10
+            elif first.islower():
+                base = 26
+            else:
+                base = 52
+            if span.step < 0:
+                base *= 2
+            matches.append(Match("sequence", span.start, span.end, span.token, math.log10(base * len(span.token))))
+        return matches
+
+    def repeat_matches(self, password):
+        # Repeated characters or blocks such as "aaaa" or "abcabc"
+        matches = []
+        for span in find_repeats(password, min_length=2, max_block=self.MAX_REPEAT_BLOCK):
+            guesses = self._repeat_base(span.block) + math.log10(span.count)
+            matches.append(Match("repeat", span.start, span.end, span.token, guesses))
+        return matches
+
+    def date_matches(self, password):
+        # Dates with or without separators, and years from 1900 to 2099
+        matches = []
+        n = len(password)
+        for i in range(n):
+            for j in range(i + 4, min(n, i + 8) + 1):
+                token = password[i:j]
+                if not token.isdigit() or not token.isascii():
+                    continue
+                for first, second in _date_splits(len(token)):
+                    year = _valid_date((int(token[:first]), int(token[first:second]), int(token[second:])))
+                    if year is not None:
+                        matches.append(Match("date", i, j, token, math.log10(365) + _year_space_log10(year)))
+                        break
+        for match in self.DATE_WITH_SEPARATOR.finditer(password):
+            year = _valid_date((int(match.group(1)), int(match.group(3)), int(match.group(4))))
+            if year is not None:
+                guesses = math.log10(365 * 4) + _year_space_log10(year)
+                matches.append(Match("date", match.start(), match.end(), match.group(0), guesses))
+        for match in self.YEAR.finditer(password):
+            matches.append(Match("year", match.start(), match.end(), match.group(0), _year_space_log10(int(match.group(0)))))
+        return matches
+
+    def matches(self, password):
+        # Every candidate pattern match in the password
+        return (
+            self.dictionary_matches(password)
+            + self.spatial_matches(password)
+            + self.sequence_matches(password)
+            + self.repeat_matches(password)
+            + self.date_matches(password)
+        )
+
+    def _search(self, password):
+        # Find the cheapest sequence of matches covering the password.
+        # state[(l, bruteforce)] at position k holds (log10 product of match guesses, previous state, match).
+        n = len(password)
+        starting = [[] for _ in range(n)]
+        single = math.log10(MIN_SUBMATCH_GUESSES_SINGLE_CHAR)
+        multi = math.log10(MIN_SUBMATCH_GUESSES_MULTI_CHAR)
+        for match in self.matches(password):
+            floor = single if match.j - match.i == 1 else multi
+            if match.guesses_log10 < floor:
+                match = match._replace(guesses_log10=floor)
+            starting[match.i].append(match)
+
+        bruteforce = math.log10(BRUTEFORCE_CARDINALITY)
+        states = [dict() for _ in range(n + 1)]
+        states[0][(0, False)] = (0.0, None, None)
+        for k in range(n):
+            for key, (product, _, _) in states[k].items():
+                count, in_bruteforce = key
+                for match in starting[k]:
+                    _relax(states[match.j], (count + 1, False), product + match.guesses_log10, (k, key), match)
+                # Brute force one more character, extending the previous brute-force match if there is one
+                next_key = (count, True) if in_bruteforce else (count + 1, True)
+                _relax(states[k + 1], next_key, product + bruteforce, (k, key), None)
+
+        best_key, best_guesses = None, math.inf
+        growing = math.log10(MIN_GUESSES_BEFORE_GROWING_SEQUENCE)
+        for key, (product, _, _) in states[n].items():
+            count = key[0]
+            guesses = _log10_sum(math.lgamma(count + 1) / math.log(10) + product, (count - 1) * growing)
+            if guesses < best_guesses:
+                best_key, best_guesses = key, guesses
+        return best_guesses, self._unwind(password, states, best_key)
+
+    def _unwind(self, password, states, key):
+        # Rebuild the chosen sequence of matches, merging brute-forced characters into single matches
+        sequence = []
+        position = len(password)
+        bruteforce_end = None
+        while position > 0:
+            _, (previous, previous_key), match = states[position][key]
+            if match is None:
+                if bruteforce_end is None:
+                    bruteforce_end = position
+                if not previous_key[1]:
+                    length = bruteforce_end - previous
+                    sequence.append(Match("bruteforce", previous, bruteforce_end, password[previous:bruteforce_end],
+                                          length * math.log10(BRUTEFORCE_CARDINALITY)))
+                    bruteforce_end = None
+            else:
+                sequence.append(match)
+            position, key = previous, previous_key
+        sequence.reverse()
+        return sequence
+
+    def _estimate_log10(self, password):
+        return self._search(password)[0] if password else 0.0
+
+    def estimate(self, password):
+        # Estimate the guesses needed for a password and the decomposition behind it
+        if not password:
+            return GuessEstimate(0.0, [])
+        guesses_log10, sequence = self._search(password)
+        return GuessEstimate(guesses_log10, sequence)
+
+
+def _relax(states, key, product, previous, match):
+    current = states.get(key)
+    if current is None or product < current[0]:
+        states[key] = (product, previous, match)
+
+
+if __name__ == "__main__":
+    import sys
+
+    from main import common_passwords
+
+    estimator = GuessEstimator(common_passwords)
+    for password in sys.argv[1:] or ["password", "P@ssw0rd2024", "qwerty12345", "correcthorsebatterystaple", "Xk9!mPq2Lz"]:
+        estimate = estimator.estimate(password)
+        patterns = " + ".join(f"{match.pattern}({match.token})" for match in estimate.sequence)
+        print(f"{password}: 10^{estimate.guesses_log10:.1f} guesses, score {estimate.score}: {patterns}")
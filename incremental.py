@@ -0,0 +1,224 @@
+# Incremental as-you-type password scoring
+#
+# Every check behind PasswordSecurityChecker.security_level looks at a few neighboring characters at a time:
+# three digits with a constant step, four letters that occur in a common password, three keys walked in one
+# direction. ScoringSession keeps one small immutable state entry per typed character, so appending a character
+# only inspects the last few characters and deleting one pops the last entry; both are O(1) no matter how large
+# the corpus is, since the letter windows are looked up in the shared CommonPasswordIndex. The open sequence
+# run, the per-block repeat counters and the spans closed so far are part of each entry (closed spans as
+# persistent linked lists), so the feedback is rebuilt from them without rescanning the password.
+#
+# Usage:
+#   session = ScoringSession(common_passwords)
+#   session.append("P")                 # on each keystroke
+#   session.delete()                    # on backspace
+#   session.update(field_value)         # or pass the whole field value; only the changed tail is rescored
+#   session.security_level(), session.feedback_on_improvement()
+
+from complexity import PasswordAnalysis, PasswordSecurityChecker
+from corpus_index import CommonPasswordIndex
+from keyboard import LAYOUTS
+from sequences import SequenceSpan, char_kind, repeat_candidate, select_repeats, sequence_step
+
+UPPER = 1
+LOWER = 2
+DIGIT = 4
+SPECIAL = 8
+
+MAX_REPEAT_BLOCK = 8
+NO_MATCHES = (0,) * MAX_REPEAT_BLOCK
+
+
+class _Entry:
+    # Scoring state after one typed character
+    __slots__ = ('classes', 'number_sequence', 'common_letters', 'walk', 'letter_run',
+                 'run_start', 'run_step', 'run_kind', 'sequences', 'matched', 'repeats')
+
+    def __init__(self, classes, number_sequence, common_letters, walk, letter_run,
+                 run_start, run_step, run_kind, sequences, matched, repeats):
+        self.classes = classes
+        self.number_sequence = number_sequence
+        self.common_letters = common_letters
+        self.walk = walk
+        self.letter_run = letter_run
+        # Open arithmetic run and the closed SequenceSpans as a (span, rest) linked list
+        self.run_start = run_start
+        self.run_step = run_step
+        self.run_kind = run_kind
+        self.sequences = sequences
+        # Characters equal to the one block positions earlier, per block length, and closed repeat candidates
+        self.matched = matched
+        self.repeats = repeats
+
+
+class ScoringSession:
+    def __init__(self, common_passwords, password=""):
+        # Initialize the session with the common passwords used by the consecutive-letters check
+        self.common_passwords = common_passwords
+        self.index = CommonPasswordIndex.shared(common_passwords, 4)
+        self.layouts = [LAYOUTS[name] for name in PasswordSecurityChecker.KEYBOARD_LAYOUTS]
+        self._chars = []
+        self._entries = []
+        self._analysis = None
+        self.update(password)
+
+    @property
+    def password(self):
+        # The text scored so far
+        return "".join(self._chars)
+
+    def __len__(self):
+        return len(self._chars)
+
+    def append(self, char):
+        # Score one more character typed at the end
+        chars = self._chars
+        i = len(chars)
+        chars.append(char)
+        previous = self._entries[-1] if self._entries else None
+        self._analysis = None
+
+        classes = previous.classes if previous else 0
+        if char.isupper():
+            classes |= UPPER
+        if char.islower():
+            classes |= LOWER
+        if char.isdigit():
+            classes |= DIGIT
+        if char in PasswordSecurityChecker.SPECIAL_CHARACTERS:
+            classes |= SPECIAL
+
+        if char in PasswordSecurityChecker.ASCII_LETTERS:
+            letter_run = previous.letter_run + 1 if previous else 1
+        else:
+            letter_run = 0
+        number_sequence = previous.number_sequence if previous else False
+        common_letters = previous.common_letters if previous else False
+        walk = previous.walk if previous else False
+
+        if i >= 2:
+            a, b = chars[i - 2], chars[i - 1]
+            if not number_sequence and a.isdecimal() and b.isdecimal() and char.isdecimal():
+                step = ord(b) - ord(a)
+                number_sequence = step != 0 and ord(char) - ord(b) == step
+            if not walk:
+                for layout in self.layouts:
+                    direction = layout.direction(a, b)
+                    if direction is not None and direction == layout.direction(b, char):
+                        walk = True
+                        break
+        if not common_letters and letter_run >= 4:
+            common_letters = "".join(chars[i - 3:]).lower() in self.index
+
+        run_start, run_step, run_kind, sequences = self._next_run(previous, chars, i, char)
+        matched, repeats = self._next_repeats(previous, chars, i, char)
+        self._entries.append(_Entry(classes, number_sequence, common_letters, walk, letter_run,
+                                    run_start, run_step, run_kind, sequences, matched, repeats))
+
+    def _next_run(self, previous, chars, i, char):
+        # Advance the open arithmetic run by one character, the same way sequences.find_sequences does
+        kind = char_kind(char)
+        if previous is None:
+            return 0, None, kind, None
+        start, step, run_kind, sequences = previous.run_start, previous.run_step, previous.run_kind, previous.sequences
+        difference = None
+        if kind is not None and kind == run_kind:
+            difference = sequence_step(chars[i - 1], char)
+            if difference != 0 and (step is None or difference == step):
+                return start, difference, run_kind, sequences
+        sequences = self._close_run(chars, i, start, step, run_kind, sequences)
+        if difference is not None and difference != 0:
+            return i - 1, difference, kind, sequences
+        return i, None, kind, sequences
+
+    @staticmethod
+    def _close_run(chars, i, start, step, kind, sequences):
+        if step is not None and i - start >= 3:
+            return SequenceSpan(start, i, "".join(chars[start:i]), step, kind), sequences
+        return sequences
+
+    @staticmethod
+    def _next_repeats(previous, chars, i, char):
+        # Advance the per-block match counters, the same way sequences.find_repeats does
+        previous_matched = previous.matched if previous else NO_MATCHES
+        repeats = previous.repeats if previous else None
+        matched = []
+        for block, count in enumerate(previous_matched, start=1):
+            if i >= block and chars[i - block] == char:
+                matched.append(count + 1)
+                continue
+            if count >= block:
+                repeats = repeat_candidate(i, count, block), repeats
+            matched.append(0)
+        return tuple(matched), repeats
+
+    def delete(self):
+        # Remove the last character; returns it, or None if the session is empty
+        if not self._chars:
+            return None
+        self._entries.pop()
+        self._analysis = None
+        return self._chars.pop()
+
+    def update(self, text):
+        # Rescore after the field changed to text, keeping the state of the unchanged prefix
+        chars = self._chars
+        common = 0
+        limit = min(len(chars), len(text))
+        while common < limit and chars[common] == text[common]:
+            common += 1
+        while len(chars) > common:
+            self.delete()
+        for char in text[common:]:
+            self.append(char)
+
+    def _analysis_of(self, sequences=(), repeats=()):
+        entry = self._entries[-1] if self._entries else None
+        classes = entry.classes if entry else 0
+        return PasswordAnalysis(
+            length=len(self._chars),
+            has_upper=bool(classes & UPPER),
+            has_lower=bool(classes & LOWER),
+            has_digit=bool(classes & DIGIT),
+            has_special=bool(classes & SPECIAL),
+            number_sequence_ok=not (entry and entry.number_sequence),
+            consecutive_letters_ok=not (entry and entry.common_letters),
+            qwerty_ok=not (entry and entry.walk),
+            sequences=sequences,
+            repeats=repeats,
+        )
+
+    def analyze(self):
+        # PasswordAnalysis of the current text, with the same sequence and repeat spans as a full analyze()
+        if self._analysis is not None:
+            return self._analysis
+        chars = self._chars
+        n = len(chars)
+        entry = self._entries[-1] if self._entries else None
+        sequences, candidates = [], []
+        if entry is not None:
+            node = self._close_run(chars, n, entry.run_start, entry.run_step, entry.run_kind, entry.sequences)
+            while node is not None:
+                sequences.append(node[0])
+                node = node[1]
+            sequences.reverse()
+            node = entry.repeats
+            while node is not None:
+                candidates.append(node[0])
+                node = node[1]
+            for block, count in enumerate(entry.matched, start=1):
+                if count >= block:
+                    candidates.append(repeat_candidate(n, count, block))
+
+        repeats = select_repeats("".join(chars), candidates) if candidates else []
+        self._analysis = self._analysis_of(sequences, repeats)
+        return self._analysis
+
+    def security_level(self):
+        # Same result as PasswordSecurityChecker.security_level for the current text; needs no spans
+        analysis = self._analysis if self._analysis is not None else self._analysis_of()
+        return PasswordSecurityChecker.level_from_analysis(analysis)
+
+    def feedback_on_improvement(self):
+        # Same result as PasswordSecurityChecker.feedback_on_improvement for the current text
+        return PasswordSecurityChecker.feedback_from_analysis(self.analyze())
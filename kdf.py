@@ -0,0 +1,275 @@
+# Password key derivation
+#
+# Memory-hard password hashing built on hashlib's scrypt and PBKDF2-HMAC-SHA256. Every hash is stored in a
+# self-describing string that carries its own scheme, cost parameters and salt, so parameters can be raised
+# over time without losing the ability to verify older hashes:
+#
+#   $scrypt$ln=15,r=8,p=1$<salt>$<hash>
+#   $pbkdf2-sha256$i=600000$<salt>$<hash>
+#
+# Salt and hash are unpadded base64. The calibrate command benchmarks this machine and picks cost parameters
+# for a target latency and memory budget; the hash-batch command hashes a file of passwords on a process pool.
+#
+# Usage:
+#   python kdf.py calibrate --target-ms 250 --max-memory-mb 64
+#   python kdf.py hash-batch passwords.txt hashes.txt --workers 8
+
+import argparse
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from progress import ProgressReporter, count_lines
+
+SCRYPT = "scrypt"
+PBKDF2_SHA256 = "pbkdf2-sha256"
+# Unsalted SHA-256 hex digests, as produced by hashing.SHA256Hasher
+LEGACY_SHA256 = "sha256"
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+# hashlib.scrypt rejects a maxmem above INT_MAX
+SCRYPT_MAX_MEMORY = 2 ** 31 - 1
+
+
+def _b64encode(data):
+    return base64.b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text):
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def identify_scheme(stored_hash):
+    # Identify the scheme of a stored password hash; None when no hash is stored
+    if not stored_hash:
+        return None
+    if stored_hash.startswith("$"):
+        scheme = stored_hash.split("$", 2)[1]
+        return scheme if scheme in (SCRYPT, PBKDF2_SHA256) else "unknown"
+    if len(stored_hash) == 64 and _HEX_DIGITS.issuperset(stored_hash):
+        return LEGACY_SHA256
+    return "unknown"
+
+
+def scrypt_memory(n, r, p=1):
+    # Approximate memory used by one scrypt call, in bytes
+    return 128 * r * n + 128 * r * p
+
+
+def scrypt_maxmem(n, r, p=1):
+    # maxmem argument for hashlib.scrypt: the memory needed plus slack, below the C int limit hashlib enforces
+    return min(scrypt_memory(n, r, p) + 1024 * 1024, SCRYPT_MAX_MEMORY)
+
+
+class PasswordKDF:
+    def __init__(self, scheme=SCRYPT, log_n=15, r=8, p=1, iterations=600000, salt_size=16, key_size=32):
+        # Initialize the KDF with the scheme and cost parameters used for new hashes
+        if scheme not in (SCRYPT, PBKDF2_SHA256):
+            raise ValueError(f"Unsupported KDF scheme: {scheme}")
+        self.scheme = scheme
+        self.log_n = log_n
+        self.r = r
+        self.p = p
+        self.iterations = iterations
+        self.salt_size = salt_size
+        self.key_size = key_size
+
+    def __repr__(self):
+        if self.scheme == SCRYPT:
+            return f"PasswordKDF(scheme={self.scheme!r}, log_n={self.log_n}, r={self.r}, p={self.p})"
+        return f"PasswordKDF(scheme={self.scheme!r}, iterations={self.iterations})"
+
+    @staticmethod
+    def parse(encoded):
+        # Split an encoded hash into (scheme, params, salt, key). Anything malformed, including missing or
+        # out-of-range cost parameters, raises ValueError, so a corrupt stored hash never gets as far as hashlib.
+        try:
+            _, scheme, param_text, salt, key = encoded.split("$")
+            params = dict(item.split("=", 1) for item in param_text.split(","))
+            params = {name: int(value) for name, value in params.items()}
+            salt, key = _b64decode(salt), _b64decode(key)
+        except (ValueError, TypeError):
+            raise ValueError("Not a recognised password hash.") from None
+        if scheme == SCRYPT:
+            if params.keys() != {"ln", "r", "p"}:
+                raise ValueError("scrypt hashes need the ln, r and p parameters.")
+            if not (1 <= params["ln"] <= 62 and params["r"] >= 1 and params["p"] >= 1
+                    and scrypt_memory(1 << params["ln"], params["r"], params["p"]) + 1024 * 1024 <= SCRYPT_MAX_MEMORY):
+                raise ValueError("scrypt parameters out of range.")
+        elif scheme == PBKDF2_SHA256:
+            if params.keys() != {"i"}:
+                raise ValueError("pbkdf2-sha256 hashes need the i parameter.")
+            if not 1 <= params["i"] < 2 ** 31:
+                raise ValueError("pbkdf2-sha256 iteration count out of range.")
+        if not key:
+            raise ValueError("Password hash has no key.")
+        return scheme, params, salt, key
+
+    @staticmethod
+    def derive(scheme, params, password, salt, key_size):
+        # Derive a key for a password with explicit scheme parameters
+        password_bytes = password.encode("utf-8", "surrogateescape") if isinstance(password, str) else password
+        if scheme == SCRYPT:
+            n, r, p = 1 << params["ln"], params["r"], params["p"]
+            return hashlib.scrypt(password_bytes, salt=salt, n=n, r=r, p=p,
+                                  maxmem=scrypt_maxmem(n, r, p), dklen=key_size)
+        if scheme == PBKDF2_SHA256:
+            return hashlib.pbkdf2_hmac("sha256", password_bytes, salt, params["i"], dklen=key_size)
+        raise ValueError(f"Unsupported KDF scheme: {scheme}")
+
+    def params(self):
+        # Cost parameters of the current configuration, as stored in the encoded hash
+        if self.scheme == SCRYPT:
+            return {"ln": self.log_n, "r": self.r, "p": self.p}
+        return {"i": self.iterations}
+
+    def hash(self, password):
+        # Hash a password with a fresh random salt and return the encoded hash
+        salt = os.urandom(self.salt_size)
+        params = self.params()
+        key = self.derive(self.scheme, params, password, salt, self.key_size)
+        param_text = ",".join(f"{name}={value}" for name, value in params.items())
+        return f"${self.scheme}${param_text}${_b64encode(salt)}${_b64encode(key)}"
+
+    def verify(self, password, encoded):
+        # Check a password against an encoded hash in constant time
+        scheme, params, salt, key = self.parse(encoded)
+        return hmac.compare_digest(self.derive(scheme, params, password, salt, len(key)), key)
+
+    def needs_rehash(self, encoded):
+        # Check if an encoded hash was made with a different scheme, different cost parameters or a different key
+        # size than the current configuration; any difference, stronger or weaker, moves it to the current one
+        try:
+            scheme, params, salt, key = self.parse(encoded)
+        except ValueError:
+            return True
+        return scheme != self.scheme or params != self.params() or len(key) != self.key_size
+
+
+def _time_call(func, repeat=3):
+    # Best-of-N wall time of a call, in seconds
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def calibrate(target_ms=250, max_memory_mb=64, scheme=SCRYPT, r=8):
+    # Benchmark this machine and return a PasswordKDF whose hashes take about target_ms
+    target = target_ms / 1000.0
+    salt = os.urandom(16)
+
+    if scheme == PBKDF2_SHA256:
+        probe = 20000
+        elapsed = _time_call(lambda: hashlib.pbkdf2_hmac("sha256", b"calibration", salt, probe))
+        iterations = max(1000, int(probe * target / elapsed) // 1000 * 1000)
+        return PasswordKDF(scheme=PBKDF2_SHA256, iterations=iterations)
+
+    # Largest N that fits the memory budget and does not exceed the latency target on its own
+    budget = min(max_memory_mb * 1024 * 1024, SCRYPT_MAX_MEMORY - 1024 * 1024)
+    log_n = 10
+    elapsed = _time_call(lambda: PasswordKDF.derive(SCRYPT, {"ln": log_n, "r": r, "p": 1}, "calibration", salt, 32))
+    while scrypt_memory(1 << (log_n + 1), r) <= budget and elapsed * 2 <= target:
+        log_n += 1
+        elapsed = _time_call(lambda: PasswordKDF.derive(SCRYPT, {"ln": log_n, "r": r, "p": 1}, "calibration", salt, 32))
+
+    # Spend any remaining latency budget on p, which adds time without adding memory
+    p = max(1, int(target / elapsed))
+    return PasswordKDF(scheme=SCRYPT, log_n=log_n, r=r, p=p)
+
+
+_worker_kdf = None
+
+
+def _init_worker(kdf):
+    global _worker_kdf
+    _worker_kdf = kdf
+
+
+def _hash_chunk(passwords):
+    return [_worker_kdf.hash(password) for password in passwords]
+
+
+def hash_batch(passwords, kdf, workers=None, chunk_size=16, progress=None):
+    # Hash an iterable of passwords on a process pool, yielding encoded hashes in input order.
+    # Only a bounded number of chunks is in flight, so arbitrarily long inputs use constant memory.
+    # An optional ProgressReporter is advanced as each chunk completes.
+    workers = workers or os.cpu_count() or 1
+    passwords = iter(passwords)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(kdf,)) as executor:
+        while True:
+            chunk = list(islice(passwords, chunk_size))
+            if chunk:
+                pending.append(executor.submit(_hash_chunk, chunk))
+            if pending and (not chunk or len(pending) >= workers * 2):
+                hashes = pending.popleft().result()
+                if progress is not None:
+                    progress.advance(len(hashes))
+                yield from hashes
+            if not chunk and not pending:
+                return
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Password KDF tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    calibrate_parser = commands.add_parser("calibrate", help="Pick cost parameters for this machine.")
+    calibrate_parser.add_argument("--target-ms", type=float, default=250)
+    calibrate_parser.add_argument("--max-memory-mb", type=int, default=64)
+    calibrate_parser.add_argument("--scheme", choices=[SCRYPT, PBKDF2_SHA256], default=SCRYPT)
+
+    batch_parser = commands.add_parser("hash-batch", help="Hash a file of passwords (one per line) on a process pool.")
+    batch_parser.add_argument("input", help="File with one password per line, or '-' for stdin.")
+    batch_parser.add_argument("output", help="File for the encoded hashes, or '-' for stdout.")
+    batch_parser.add_argument("--workers", type=int, default=None)
+    batch_parser.add_argument("--scheme", choices=[SCRYPT, PBKDF2_SHA256], default=SCRYPT)
+    batch_parser.add_argument("--log-n", type=int, default=15)
+    batch_parser.add_argument("--r", type=int, default=8)
+    batch_parser.add_argument("--p", type=int, default=1)
+    batch_parser.add_argument("--iterations", type=int, default=600000)
+    batch_parser.add_argument("--no-progress", action="store_true", help="Do not report progress on stderr.")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "calibrate":
+        kdf = calibrate(args.target_ms, args.max_memory_mb, args.scheme)
+        sample = kdf.hash("calibration")
+        elapsed = _time_call(lambda: kdf.verify("calibration", sample), repeat=1)
+        print(f"Selected parameters: {kdf}")
+        if kdf.scheme == SCRYPT:
+            print(f"Memory per hash: {scrypt_memory(1 << kdf.log_n, kdf.r, kdf.p) / (1024 * 1024):.1f} MiB")
+        print(f"Measured hash time: {elapsed * 1000:.0f} ms")
+        print(f"Example hash: {sample}")
+        return
+
+    kdf = PasswordKDF(scheme=args.scheme, log_n=args.log_n, r=args.r, p=args.p, iterations=args.iterations)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    total = None if args.no_progress or args.input == "-" else count_lines(args.input)
+    progress = None if args.no_progress else ProgressReporter("Hashed", total=total).start()
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8", errors="surrogateescape")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    try:
+        passwords = (line.rstrip("\r\n") for line in source)
+        for encoded in hash_batch(passwords, kdf, workers=args.workers, progress=progress):
+            output.write(encoded + "\n")
+    finally:
+        if progress is not None:
+            progress.close()
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
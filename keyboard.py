@@ -0,0 +1,115 @@
+# Keyboard layouts and walk detection
+#
+# Every layout is a list of rows of keys, each key written as its (unshifted, shifted) characters, plus how far
+# each row sits to the right in a slanted grid where every key has up to six neighbors: left, right, the two keys
+# above and the two keys below. The adjacency graph is precomputed as {character: {neighbor character: direction}},
+# so checking whether two typed characters are adjacent, and in which direction, is two dict lookups.
+#
+# find_walks makes one pass over a password and reports every maximal run of adjacent keys with its length, the
+# number of straight segments it is made of (turns: 1 for "qwer", 2 for "qwsx"; one more than the number of
+# direction changes) and how many characters needed shift. Rows, columns, diagonals and shifted symbols
+# ("!@#$") are all walks.
+#
+# Usage:
+#   from keyboard import QWERTY
+#   for walk in QWERTY.find_walks("1qaz2wsx"):
+#       print(walk.token, walk.turns, walk.shifted)
+
+from collections import namedtuple
+
+# Neighbor directions in the slanted grid, as (dx, dy)
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (1, -1), (-1, 1), (0, 1))
+
+Walk = namedtuple("Walk", ("i", "j", "token", "turns", "shifted", "layout"))
+
+_NO_NEIGHBORS = {}
+
+
+class KeyboardLayout:
+    def __init__(self, name, rows, offsets=(0, 1, 1, 1)):
+        # Precompute the adjacency graph of a layout
+        self.name = name
+        positions = {}
+        for y, (row, offset) in enumerate(zip(rows, offsets)):
+            for x, key in enumerate(row.split()):
+                positions[(x + offset, y)] = key
+
+        self.graph = {}
+        self.shifted_keys = frozenset(key[1] for key in positions.values() if len(key) > 1)
+        degrees = 0
+        for (x, y), key in positions.items():
+            neighbors = {}
+            for direction, (dx, dy) in enumerate(DIRECTIONS):
+                neighbor = positions.get((x + dx, y + dy))
+                if neighbor is not None:
+                    degrees += 1
+                    for char in neighbor:
+                        neighbors[char] = direction
+            for char in key:
+                self.graph[char] = neighbors
+        self.starting_positions = len(positions)
+        self.average_degree = degrees / len(positions)
+
+    def direction(self, a, b):
+        # Direction index from the key of a to the key of b, or None if they are not adjacent
+        return self.graph.get(a, _NO_NEIGHBORS).get(b)
+
+    def find_walks(self, password, min_length=3):
+        # Find every maximal run of at least min_length adjacent keys in one pass
+        walks = []
+        graph = self.graph
+        shifted_keys = self.shifted_keys
+        n = len(password)
+        start = 0
+        turns = 0
+        shifted = 1 if n and password[0] in shifted_keys else 0
+        last_direction = None
+        for j in range(1, n + 1):
+            direction = graph.get(password[j - 1], _NO_NEIGHBORS).get(password[j]) if j < n else None
+            if direction is not None:
+                if direction != last_direction:
+                    turns += 1
+                    last_direction = direction
+                if password[j] in shifted_keys:
+                    shifted += 1
+                continue
+            if j - start >= min_length:
+                walks.append(Walk(start, j, password[start:j], turns, shifted, self.name))
+            start = j
+            turns = 0
+            shifted = 1 if j < n and password[j] in shifted_keys else 0
+            last_direction = None
+        return walks
+
+
+QWERTY = KeyboardLayout("qwerty", (
+    "`~ 1! 2@ 3# 4$ 5% 6^ 7& 8* 9( 0) -_ =+",
+    "qQ wW eE rR tT yY uU iI oO pP [{ ]} \\|",
+    "aA sS dD fF gG hH jJ kK lL ;: '\"",
+    "zZ xX cC vV bB nN mM ,< .> /?",
+))
+
+AZERTY = KeyboardLayout("azerty", (
+    "&1 é2 \"3 '4 (5 -6 è7 _8 ç9 à0 )° =+",
+    "aA zZ eE rR tT yY uU iI oO pP ^¨ $£",
+    "qQ sS dD fF gG hH jJ kK lL mM ù% *µ",
+    "<> wW xX cC vV bB nN ,? ;. :/ !§",
+), offsets=(1, 1, 1, 0))
+
+DVORAK = KeyboardLayout("dvorak", (
+    "`~ 1! 2@ 3# 4$ 5% 6^ 7& 8* 9( 0) [{ ]}",
+    "'\" ,< .> pP yY fF gG cC rR lL /? =+ \\|",
+    "aA oO eE uU iI dD hH tT nN sS -_",
+    ";: qQ jJ kK xX bB mM wW vV zZ",
+))
+
+LAYOUTS = {layout.name: layout for layout in (QWERTY, AZERTY, DVORAK)}
+
+
+if __name__ == "__main__":
+    import sys
+
+    for password in sys.argv[1:] or ["qwerty", "1qaz2wsx", "!@#$%", "zxcvfr", "azerty", "aoeuid"]:
+        for layout in LAYOUTS.values():
+            for walk in layout.find_walks(password):
+                print(f"{password}: {layout.name} walk {walk.token!r} length {len(walk.token)}, {walk.turns} turns, {walk.shifted} shifted")
@@ -3,8 +3,9 @@ from threading import Event
 import time
 
 class TermLoading():
-    def __init__(self):
-        # Initialize class attributes
+    def __init__(self, no_delay=False):
+        # Initialize class attributes; with no_delay the messages are printed once, without the animation thread
+        self.no_delay = no_delay
         self.message = ""
         self.finish_message = ""
         self.__failed = False
@@ -24,7 +25,9 @@ class TermLoading():
         # Setter for finished attribute
         if isinstance(finished, bool):
             self.__finished = finished
-            if finished:
+            if finished and self.no_delay:
+                print(self.finish_message, flush=True)
+            elif finished:
                 self.__threadEvent.set()
                 time.sleep(0.1)
         else:
@@ -40,7 +43,9 @@ class TermLoading():
         # Setter for failed attribute
         if isinstance(failed, bool):
             self.__failed = failed
-            if failed:
+            if failed and self.no_delay:
+                print(self.failed_message, flush=True)
+            elif failed:
                 self.__threadEvent.set()
                 time.sleep(0.1)
         else:
@@ -57,6 +62,9 @@ class TermLoading():
         # Show loading animation
         self.finished = False
         self.failed = False
+        if self.no_delay:
+            print(self.message, flush=True)
+            return
         self.__threadEvent.clear()
         if not self.__thread.is_alive():
             self.__thread.start()
@@ -0,0 +1,349 @@
+# Asynchronous login service
+#
+# Serves the interactive login flow from main.py (password check with a 5-attempt lockout, TOTP step, forced
+# rotation of expired passwords and a security report) to many concurrent sessions over a local socket.
+# The protocol is one JSON object per line in each direction; every connection is one login session.
+# Malformed messages and fields of the wrong type get {"status": "error", "message": ...} in reply.
+#
+#   -> {"action": "login", "user_id": 1, "password": "..."}
+#   <- {"status": "totp_required"}                            (plus "totp_secret" on enrollment, see below)
+#   -> {"action": "totp", "code": "123456"}
+#   <- {"status": "password_expired"}                         (or "authenticated" with the security report)
+#   -> {"action": "change_password", "new_password": "..."}
+#   <- {"status": "authenticated", "security_level": "...", "feedback": [...]}
+#
+# Codes come from the user's own TOTP secret, kept in the user store (UserManager.enroll_totp). A user without
+# one is enrolled after their first correct password when enroll_totp is set: the new base32 secret is sent
+# once, as "totp_secret", for the client to add to an authenticator app. Deployments that enroll users out of
+# band turn enroll_totp off, and those users are refused until they have a secret. reveal_totp also sends the
+# current code, for demos only.
+#
+# Passwords of users with a stored hash (passwordHash) are verified through migration.HashMigrator, which also
+# rehashes legacy or outdated hashes on a successful login; only records without a hash fall back to the
+# plaintext currentPassword field. A password change stores the new hash with the rotated password.
+#
+# Each session allows max_totp_attempts invalid codes, and every invalid code counts as a failed login for the
+# user and the client address in the rate limiter, so the 10^6 codes cannot be tried within the drift window.
+# Store access and password evaluation run on an executor so the event loop only handles I/O.
+#
+# Usage:
+#   python login_service.py --port 8765
+#   python login_service.py --reveal-totp     # demo mode: the TOTP code is sent back with totp_required
+
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+from functools import partial
+
+from TOTP import TOTPVerifier
+from migration import HashMigrator
+from ratelimit import LoginRateLimiter
+from UserData import UserManager
+from main import PasswordSecurityManager
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE_BYTES = 64 * 1024
+
+# Required fields and their types per action
+FIELDS = {
+    "login": (("user_id", int), ("password", str)),
+    "totp": (("code", str),),
+    "change_password": (("new_password", str),),
+}
+
+
+def validate_message(message):
+    # Get an error message for a request with missing or mistyped fields, or None if it is well-formed
+    action = message.get("action")
+    if action not in FIELDS:
+        return f"Unknown action {action!r}."
+    for name, expected in FIELDS[action]:
+        value = message.get(name)
+        # bool is a subclass of int but never a user ID
+        if not isinstance(value, expected) or isinstance(value, bool):
+            return f"Field {name!r} must be {'an integer' if expected is int else 'a string'}."
+    return None
+
+
+class LoginService:
+    def __init__(self, user_manager, common_passwords, max_attempts=5, reveal_totp=False, totp_verifier=None, executor=None,
+                 rate_limiter=None, max_totp_attempts=3, enroll_totp=True, migrator=None):
+        # Initialize the service with a shared UserManager and common passwords list.
+        # Pass a LoginRateLimiter on a SQLiteRateStore to share failure counts between worker processes.
+        # enroll_totp gives users without a TOTP secret one on their first login; reveal_totp sends the
+        # current code back to the client and is only meant for demos. migrator (default: a HashMigrator on the
+        # manager's store with the default KDF) verifies and upgrades stored password hashes.
+        self.user_manager = user_manager
+        self.common_passwords = common_passwords
+        self.max_attempts = max_attempts
+        self.max_totp_attempts = max_totp_attempts
+        self.enroll_totp = enroll_totp
+        self.reveal_totp = reveal_totp
+        self.totp = totp_verifier if totp_verifier is not None else TOTPVerifier(step=30, drift=1)
+        self.executor = executor
+        self.rate_limiter = rate_limiter if rate_limiter is not None else LoginRateLimiter(user_limit=max_attempts)
+        self.migrator = migrator if migrator is not None else HashMigrator(user_manager.store)
+        self.server = None
+
+    async def _run(self, func, *args):
+        # Run blocking or CPU-heavy work off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, partial(func, *args))
+
+    def _check_password(self, user_id, password, address=None):
+        # Verify the password of a user and return (status, attempts)
+        if self.rate_limiter.is_blocked(user_id, address):
+            return "locked", self.max_attempts
+        user = self.user_manager.get_user(user_id)
+        if user is None:
+            self.rate_limiter.record_failure(user_id, address)
+            return "unknown_user", 0
+        if user['accountStatus'] == 'Disabled':
+            return "locked", self.max_attempts
+        if user.get('passwordHash'):
+            valid = self.migrator.login(user_id, password)
+        else:
+            # Records without a stored hash only have the legacy plaintext field
+            valid = hmac.compare_digest(password.encode('utf-8', 'surrogatepass'), user['currentPassword'].encode('utf-8', 'surrogatepass'))
+        if not valid:
+            state = self.rate_limiter.record_failure(user_id, address)
+            if state["locked"]:
+                # Disable the account once max_attempts is reached, as main.py does
+                self.user_manager.update_user(user_id, {'accountStatus': 'Disabled'})
+                return "locked", self.max_attempts
+            return "failed", self.max_attempts - state["remaining"]
+        self.rate_limiter.record_success(user_id)
+        return "ok", 0
+
+    def _prepare_totp(self, user_id):
+        # Register the user's enrolled TOTP secret with the verifier, enrolling one if allowed.
+        # Returns (registered, new secret or None).
+        secret, enrolled = self.user_manager.get_totp_secret(user_id), None
+        if secret is None:
+            if not self.enroll_totp:
+                return False, None
+            secret = enrolled = self.user_manager.enroll_totp(user_id)
+        self.totp.register(user_id, secret)
+        return True, enrolled
+
+    def _check_totp(self, session, code):
+        # Verify a TOTP code for a session and return "ok", "invalid" or "locked"
+        user_id, address = session["user_id"], session["address"]
+        if self.rate_limiter.is_blocked(user_id, address):
+            return "locked"
+        if self.totp.verify(user_id, code):
+            return "ok"
+        session["totp_failures"] += 1
+        state = self.rate_limiter.record_failure(user_id, address)
+        if state["locked"] or session["totp_failures"] >= self.max_totp_attempts:
+            return "locked"
+        return "invalid"
+
+    def _change_password(self, manager, new_password):
+        # Apply the password change of main.py, keeping a stored password hash in step with the new password
+        result = self.user_manager.set_new_password(manager.user_id, new_password)
+        if "successfully" in result:
+            user = self.user_manager.get_user(manager.user_id)
+            password_hash = self.migrator.kdf.hash(new_password) if user.get('passwordHash') else None
+            self.user_manager.rotate_password(manager.user_id, new_password, password_hash=password_hash)
+        return result
+
+    def _security_report(self, manager):
+        # Evaluate the security level and feedback for the current password of a session
+        password = manager.get_user_password()
+        return {
+            "status": "authenticated",
+            "security_level": manager.check_password_security(password),
+            "feedback": manager.provide_password_feedback(),
+        }
+
+    async def _after_totp(self, manager):
+        # Continue the flow after a successful TOTP step
+        if await self._run(manager.check_password_age) == 0:
+            return "change_password", {"status": "password_expired"}
+        return "done", await self._run(self._security_report, manager)
+
+    async def handle_message(self, session, message):
+        # Advance one session by one message and return the response
+        action = message.get("action")
+        state = session["state"]
+        error = validate_message(message)
+        if error is not None:
+            return {"status": "error", "message": error}
+
+        if action == "login" and state == "password":
+            user_id = message.get("user_id")
+            status, attempts = await self._run(self._check_password, user_id, message["password"], session["address"])
+            if status == "ok":
+                registered, enrolled = await self._run(self._prepare_totp, user_id)
+                if not registered:
+                    return {"status": "failed", "message": "TOTP is not set up for this account."}
+                session["user_id"] = user_id
+                session["manager"] = PasswordSecurityManager(user_id, None, self.common_passwords, user_manager=self.user_manager)
+                session["state"] = "totp"
+                response = {"status": "totp_required"}
+                if enrolled is not None:
+                    response["totp_secret"] = enrolled
+                if self.reveal_totp:
+                    response["totp"] = self.totp.generate(user_id)
+                return response
+            if status == "locked":
+                return {"status": "locked", "message": f"Account is Disabled due to {self.max_attempts} failed login attempts."}
+            if status == "unknown_user":
+                return {"status": "failed", "message": f"User with user ID {user_id} not found."}
+            return {"status": "failed", "attempts": attempts}
+
+        if action == "totp" and state == "totp":
+            manager = session["manager"]
+            status = await self._run(self._check_totp, session, message["code"])
+            if status == "locked":
+                return {"status": "locked", "message": "Too many invalid TOTP codes."}
+            if status == "invalid":
+                return {"status": "invalid_totp", "attempts_left": self.max_totp_attempts - session["totp_failures"]}
+            session["state"], response = await self._after_totp(manager)
+            return response
+
+        if action == "change_password" and state == "change_password":
+            manager = session["manager"]
+            result = await self._run(self._change_password, manager, message["new_password"])
+            if "successfully" not in result:
+                return {"status": "rejected", "message": result}
+            session["state"] = "done"
+            return await self._run(self._security_report, manager)
+
+        return {"status": "error", "message": f"Unexpected action {action!r} in state {state!r}."}
+
+    async def handle_connection(self, reader, writer):
+        # Serve one login session over a stream connection
+        peer = writer.get_extra_info("peername")
+        address = peer[0] if isinstance(peer, tuple) else None
+        session = {"state": "password", "manager": None, "address": address, "user_id": None, "totp_failures": 0}
+        try:
+            while session["state"] != "done":
+                close = False
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # The line is over MAX_LINE_BYTES; the rest of the stream cannot be framed any more
+                    line, close = None, True
+                    response = {"status": "error", "message": "Message too long."}
+                else:
+                    if not line:
+                        break
+                    try:
+                        message = json.loads(line)
+                        if not isinstance(message, dict):
+                            raise ValueError
+                    except ValueError:
+                        response = {"status": "error", "message": "Invalid JSON message."}
+                    else:
+                        try:
+                            response = await self.handle_message(session, message)
+                        except Exception:
+                            logger.exception("Login session from %s failed", address)
+                            response, close = {"status": "error", "message": "Internal error."}, True
+                writer.write(json.dumps(response).encode('utf-8') + b"\n")
+                await writer.drain()
+                if close or response["status"] == "locked":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def start(self, host="127.0.0.1", port=0):
+        # Start listening on a TCP port (0 picks a free port) and return the bound address
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_LINE_BYTES)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path):
+        # Start listening on a Unix domain socket
+        self.server = await asyncio.start_unix_server(self.handle_connection, path, limit=MAX_LINE_BYTES)
+        return path
+
+    async def close(self):
+        # Stop accepting connections and wait for the server to close
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+
+class LoginClient:
+    # Minimal loopback client for the login service
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        # Open a session over TCP
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @classmethod
+    async def connect_unix(cls, path):
+        # Open a session over a Unix domain socket
+        reader, writer = await asyncio.open_unix_connection(path)
+        return cls(reader, writer)
+
+    async def request(self, **message):
+        # Send one message and wait for the response
+        self.writer.write(json.dumps(message).encode('utf-8') + b"\n")
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Login service closed the connection.")
+        return json.loads(line)
+
+    async def login(self, user_id, password):
+        return await self.request(action="login", user_id=user_id, password=password)
+
+    async def submit_totp(self, code):
+        return await self.request(action="totp", code=code)
+
+    async def change_password(self, new_password):
+        return await self.request(action="change_password", new_password=new_password)
+
+    async def close(self):
+        # Close the session
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(host, port, unix_path=None, reveal_totp=False):
+    # Run the service on the sample user data until interrupted
+    from main import common_passwords, sample_users_data
+
+    service = LoginService(UserManager(sample_users_data), common_passwords, reveal_totp=reveal_totp)
+    if unix_path:
+        address = await service.start_unix(unix_path)
+    else:
+        address = await service.start(host, port)
+    print(f"Login service listening on {address}")
+    async with service.server:
+        await service.server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the asynchronous login service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="Listen on a Unix domain socket instead of TCP.")
+    parser.add_argument("--reveal-totp", action="store_true", help="Demo only: send the TOTP code back to the client.")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.reveal_totp))
+    except KeyboardInterrupt:
+        pass
@@ -94,14 +94,15 @@ common_passwords = [
 
 # A class that contains multiple functions regarding user password security
 class PasswordSecurityManager:
-    def __init__(self, user_id, data, common_passwords):
+    def __init__(self, user_id, data, common_passwords, user_manager=None):
         self.user_id = user_id
         self.common_passwords = common_passwords
         self.encryption = AESCipher()
         self.salter = Salt()
         self.totp = TOTP()
         self.hash = SHA256Hasher()
-        self.user_manager = UserManager(data)
+        # A shared UserManager can be passed in so many sessions reuse the same indexes and caches.
+        self.user_manager = user_manager if user_manager is not None else UserManager(data)
         self.password_checker = PasswordSecurityChecker("", self.common_passwords)
         self.users_data = sample_users_data
 
@@ -118,20 +119,17 @@ class PasswordSecurityManager:
         expiration_month = self.check_password_age()
         if expiration_month == 0:
             new_password = input("\nYour password has expired. Enter a new password: ")
+            print(self.change_password(new_password))
 
-            current_password_at_start = self.get_user_password()
-            result = self.user_manager.set_new_password(self.user_id, new_password)
-            
-            # Update the user data in sample_users_data.
-            if "successfully" in result:            
-                for user in self.user_manager.users_data:
-                    if user['userID'] == self.user_id:
-                        user['history'] = [current_password_at_start] + user['history'][:2]
-                        user['expirationMonthLeft'] = 6
-                        user['currentPassword'] = new_password
-                        break
+    def change_password(self, new_password):
+        # Replace the current password if it passes the history checks, and return the result message.
+        result = self.user_manager.set_new_password(self.user_id, new_password)
 
-            print(result)
+        # Store the new password through the user manager, whichever store it is configured with.
+        if "successfully" in result:
+            self.user_manager.rotate_password(self.user_id, new_password)
+
+        return result
 
     def encrypt_bytes(self, plaintext):
         # Encrypt bytes.
@@ -146,11 +144,13 @@ class PasswordSecurityManager:
         return self.salter.salt_password(get_user_password)
     
     def hash_bytes(self, get_user_password_hash):
-        # Hash bytes.
+        # Hash bytes. The hasher is reset first so earlier input is not part of this digest.
+        self.hash.reset_hasher()
         return self.hash.hash_byte(get_user_password_hash)
         
     def hash_string(self, get_user_password):
-        # Hash string.
+        # Hash string. The hasher is reset first so earlier input is not part of this digest.
+        self.hash.reset_hasher()
         return self.hash.hash_string(get_user_password)
     
     def get_hashed_password(self):
@@ -173,6 +173,12 @@ class PasswordSecurityManager:
 
 
 
+def pause(seconds, no_delay=False):
+    # Wait between interactive steps unless no_delay is set (the --no-delay option)
+    if not no_delay:
+        time.sleep(seconds)
+
+
 def get_user_id():
     # Get valid input for user ID.
     while True:
@@ -185,12 +191,18 @@ def get_user_id():
 
 
 if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Interactive password security demo.")
+    parser.add_argument("--no-delay", action="store_true", help="Skip the artificial pauses and the loading animation between the interactive steps.")
+    args = parser.parse_args()
+
     user_id = get_user_id()
 
     # Create a new class instance with user ID input.
     password_manager = PasswordSecurityManager(user_id, sample_users_data, common_passwords)
     password = password_manager.get_user_password()
-    animation = TermLoading()
+    animation = TermLoading(args.no_delay)
     # print(password)
 
     # Ask the user to type in the current password.
@@ -203,7 +215,7 @@ if __name__ == '__main__':
    
         if user_pw == password:
             animation.show('Verifying Login Account Information...', failed_message='', finish_message="Login success!")
-            time.sleep(3)
+            pause(3, args.no_delay)
             animation.finished = True
 
             # A user has to enter TOTP generated by the program within 180 seconds.
@@ -225,7 +237,7 @@ if __name__ == '__main__':
     password = password_manager.get_user_password()
 
     animation.show('Evaluating Security Level for your Current Password...', failed_message='', finish_message="")
-    time.sleep(3)
+    pause(3, args.no_delay)
     animation.finished = True
 
     # Evaluate the security level and provide feedback for the current user password 
@@ -251,28 +263,28 @@ if __name__ == '__main__':
 
     # An option to apply salting before encrypting the password to slow down the brute force process.
     animation.show('Applying Security to Password...', failed_message='')
-    time.sleep(3)
+    pause(3, args.no_delay)
     animation.finished = True
     if salt_request == "y":
         salted_password = password_manager.salt_and_store_password(password)
         print(f"\nYour password has been successfully salted!")
-        time.sleep(2)
+        pause(2, args.no_delay)
         print(f"\nSalted Password: {salted_password}")    
         # Encrypt the password using AES for confidentiality.
         cipher = password_manager.encrypt_bytes(salted_password)
-        time.sleep(2)
+        pause(2, args.no_delay)
         print(f"Encrypted Password: {cipher}")
 
     elif salt_request == "n":
         # An option to encrypt the password without applying salting.
         cipher = password_manager.encrypt_strings(password)
-        time.sleep(2)
+        pause(2, args.no_delay)
         print(f"\nEncrypted Password: {cipher}")
 
     # Store hash value for encrpyted user password.
     password_manager.hash_bytes(cipher)
     hashed_encrypted_password = password_manager.get_hashed_password()
-    time.sleep(2)
+    pause(2, args.no_delay)
     print(f"Raw Password Hash: {hashed_password}")
-    time.sleep(2)
+    pause(2, args.no_delay)
     print(f"Encrypted Password Hash: {hashed_encrypted_password}")
@@ -0,0 +1,203 @@
+# Timing instrumentation with Prometheus text export
+#
+# Records call counts and latency histograms per operation for PasswordSecurityChecker, UserManager, TOTP,
+# AESCipher and PasswordSecurityManager, plus how many corpus entries or windows each check examined.
+# Nothing is wrapped until enable() is called: it replaces the listed methods with timing wrappers and
+# disable() puts the originals back, so disabled instrumentation costs nothing on the timed calls. The
+# examined-item counters in the checks are guarded by a single `metrics.enabled` test.
+#
+# Usage:
+#   import metrics
+#   metrics.enable()
+#   metrics.start_http_server(9100)          # or metrics.write_prometheus("metrics.prom")
+
+import functools
+import importlib
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# (module, class, methods) instrumented by enable()
+TARGETS = (
+    ("complexity", "PasswordSecurityChecker", (
+        "analyze", "security_level", "feedback_on_improvement", "check_length", "check_complexity",
+        "check_number_sequence", "check_consecutive_letters", "check_consecutive_qwerty", "estimate_guesses",
+    )),
+    ("UserData", "UserManager", (
+        "get_user", "is_password_similar_to_history", "is_password_close_to_history", "set_new_password",
+        "rotate_password", "update_user",
+    )),
+    ("TOTP", "TOTP", ("get_hotp_token", "get_totp_token", "check_totp_expiration")),
+    ("TOTP", "TOTPVerifier", ("verify",)),
+    ("AESencrypt", "AESCipher", (
+        "encrypt_bytes", "decrypt_bytes", "encrypt_string", "decrypt_string", "encrypt_stream", "decrypt_stream",
+    )),
+    ("main", "PasswordSecurityManager", (
+        "update_password_if_expired", "change_password", "generate_totp", "check_password_security",
+        "provide_password_feedback", "encrypt_bytes", "encrypt_strings", "hash_string", "hash_bytes",
+    )),
+)
+
+enabled = False
+_lock = threading.Lock()
+_histograms = {}
+_examined = {}
+_originals = []
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        # Record one duration
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += seconds
+        self.count += 1
+
+
+def observe(operation, seconds):
+    # Record the duration of one call of an operation
+    with _lock:
+        histogram = _histograms.get(operation)
+        if histogram is None:
+            histogram = _histograms[operation] = Histogram()
+        histogram.observe(seconds)
+
+
+def record_examined(check, count):
+    # Add to the number of corpus entries or windows a check examined
+    with _lock:
+        _examined[check] = _examined.get(check, 0) + count
+
+
+def _timed(operation, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            observe(operation, time.perf_counter() - start)
+    return wrapper
+
+
+def instrument(cls, methods, prefix=None):
+    # Replace methods of a class with timing wrappers until disable() is called
+    prefix = prefix or cls.__name__
+    for name in methods:
+        original = cls.__dict__.get(name)
+        if original is None or getattr(original, "__wrapped__", None) is not None:
+            continue
+        _originals.append((cls, name, original))
+        setattr(cls, name, _timed(f"{prefix}.{name}", original))
+
+
+def enable(targets=TARGETS):
+    # Start recording metrics for every target class
+    global enabled
+    if enabled:
+        return
+    for module_name, class_name, methods in targets:
+        modules = []
+        try:
+            modules.append(importlib.import_module(module_name))
+        except ImportError:
+            pass
+        # main.py run as a script defines its classes in __main__ rather than in the main module
+        if module_name == "main" and hasattr(sys.modules.get("__main__"), class_name):
+            modules.append(sys.modules["__main__"])
+        for module in modules:
+            cls = getattr(module, class_name, None)
+            if cls is not None:
+                instrument(cls, methods, prefix=class_name)
+    enabled = True
+
+
+def disable():
+    # Stop recording and restore the original methods
+    global enabled
+    enabled = False
+    while _originals:
+        cls, name, original = _originals.pop()
+        setattr(cls, name, original)
+
+
+def reset():
+    # Clear every recorded metric
+    with _lock:
+        _histograms.clear()
+        _examined.clear()
+
+
+def snapshot():
+    # Get {operation: (count, total_seconds)} and {check: examined} copies of the current metrics
+    with _lock:
+        timings = {operation: (histogram.count, histogram.total) for operation, histogram in _histograms.items()}
+        return timings, dict(_examined)
+
+
+def render_prometheus():
+    # Render every metric in the Prometheus text exposition format
+    lines = [
+        "# HELP password_security_operation_seconds Latency of instrumented operations.",
+        "# TYPE password_security_operation_seconds histogram",
+    ]
+    with _lock:
+        for operation in sorted(_histograms):
+            histogram = _histograms[operation]
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'password_security_operation_seconds_bucket{{operation="{operation}",le="{bound}"}} {cumulative}')
+            lines.append(f'password_security_operation_seconds_bucket{{operation="{operation}",le="+Inf"}} {histogram.count}')
+            lines.append(f'password_security_operation_seconds_sum{{operation="{operation}"}} {histogram.total}')
+            lines.append(f'password_security_operation_seconds_count{{operation="{operation}"}} {histogram.count}')
+        lines.append("# HELP password_security_examined_total Corpus entries or windows examined by each check.")
+        lines.append("# TYPE password_security_examined_total counter")
+        for check in sorted(_examined):
+            lines.append(f'password_security_examined_total{{check="{check}"}} {_examined[check]}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path):
+    # Atomically write the metrics to a file, e.g. for the node_exporter textfile collector
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as file:
+        file.write(render_prometheus())
+    os.replace(temp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=9100, host="127.0.0.1"):
+    # Serve /metrics on a local port from a daemon thread and return the server
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,174 @@
+# Lazy password hash migration
+#
+# Users stored with the legacy unsalted SHA-256 hex digest (hashing.SHA256Hasher) cannot be rehashed without
+# their password, so they are migrated when they next log in: a successful login against a hash that the
+# current PasswordKDF would not produce is rehashed with the current parameters and written back, guarded by
+# a compare-and-swap inside a store transaction so concurrent logins or password changes are never
+# overwritten. Rehashing is rate limited so a login burst does not turn into a KDF burst, and
+# MigrationMonitor reports progress from the store's per-scheme counters instead of scanning every user.
+#
+# Usage:
+#   python migration.py status users.db
+
+import hmac
+import logging
+import sys
+import threading
+import time
+
+from hashing import SHA256Hasher
+from kdf import LEGACY_SHA256, PasswordKDF, identify_scheme
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_hash(password):
+    # Compute the legacy unsalted SHA-256 hex digest of a password
+    hasher = SHA256Hasher()
+    hasher.hash_string(password)
+    return hasher.get_hashed_string()
+
+
+class RehashThrottle:
+    # Token bucket limiting how many rehashes run per second
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        # Take one token if available
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class HashMigrator:
+    def __init__(self, store, kdf=None, max_rehashes_per_second=None):
+        # Initialize the migrator with a user store and the KDF used for new hashes
+        self.store = store
+        self.kdf = kdf if kdf is not None else PasswordKDF()
+        self.throttle = RehashThrottle(max_rehashes_per_second) if max_rehashes_per_second else None
+        self.rehashed = 0
+        self.deferred = 0
+        self.lock = threading.Lock()
+
+    def verify(self, password, stored_hash):
+        # Check a password against a stored hash of any supported scheme
+        scheme = identify_scheme(stored_hash)
+        if scheme == LEGACY_SHA256:
+            return hmac.compare_digest(legacy_hash(password), stored_hash.lower())
+        if scheme is None or scheme == "unknown":
+            return False
+        try:
+            return self.kdf.verify(password, stored_hash)
+        except ValueError:
+            # A corrupt stored hash fails the login instead of raising out of it; the hash itself is not logged
+            logger.warning("Malformed %s password hash; treating the login as failed", scheme)
+            return False
+
+    def login(self, user_id, password):
+        # Verify a login and upgrade the stored hash if it uses a legacy scheme or outdated parameters
+        user = self.store.get_user(user_id)
+        stored_hash = user.get('passwordHash') if user else None
+        if not stored_hash or not self.verify(password, stored_hash):
+            return False
+
+        if self.kdf.needs_rehash(stored_hash):
+            if self.throttle is not None and not self.throttle.try_acquire():
+                # Leave this user for a later login instead of delaying the current one
+                with self.lock:
+                    self.deferred += 1
+                return True
+            new_hash = self.kdf.hash(password)
+            with self.store.transaction() as tx:
+                current = tx.get_user(user_id)
+                if current is not None and current.get('passwordHash') == stored_hash:
+                    tx.update_user(user_id, {'passwordHash': new_hash})
+                    with self.lock:
+                        self.rehashed += 1
+        return True
+
+    def set_password(self, user_id, password):
+        # Store a hash of a new password with the current parameters
+        return self.store.update_user(user_id, {'passwordHash': self.kdf.hash(password)})
+
+
+class MigrationMonitor:
+    # Background reporter of how many legacy hashes remain
+
+    def __init__(self, store, migrator=None, interval=60.0):
+        self.store = store
+        self.migrator = migrator
+        self.interval = interval
+        self._last = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def progress(self):
+        # Get a snapshot of the migration state from the store's per-scheme counters
+        counts = self.store.count_by_hash_scheme()
+        legacy = counts.get(LEGACY_SHA256, 0)
+        total = sum(count for scheme, count in counts.items() if scheme is not None)
+        now = time.monotonic()
+        rate = None
+        if self._last is not None and now > self._last[0]:
+            rate = (self._last[1] - legacy) / (now - self._last[0])
+        self._last = (now, legacy)
+
+        report = {
+            "counts": counts,
+            "legacy": legacy,
+            "total": total,
+            "migrated_percent": 100.0 * (total - legacy) / total if total else 100.0,
+            "legacy_per_second": rate,
+            "eta_seconds": legacy / rate if rate else None,
+        }
+        if self.migrator is not None:
+            report["rehashed"] = self.migrator.rehashed
+            report["deferred"] = self.migrator.deferred
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            report = self.progress()
+            logger.info(
+                "Hash migration: %d of %d hashes still legacy (%.1f%% migrated)",
+                report["legacy"], report["total"], report["migrated_percent"],
+            )
+
+    def start(self):
+        # Start logging progress every interval seconds on a daemon thread
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Stop the background reporter
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    from storage import SQLiteUserStore
+
+    if len(sys.argv) != 3 or sys.argv[1] != "status":
+        print("Usage: python migration.py status <users.db>")
+        sys.exit(1)
+
+    store = SQLiteUserStore(sys.argv[2])
+    report = MigrationMonitor(store).progress()
+    for scheme, count in sorted(report["counts"].items(), key=lambda item: str(item[0])):
+        print(f"{scheme or 'no hash'}: {count}")
+    print(f"Migrated: {report['migrated_percent']:.1f}%")
+    store.close()
@@ -0,0 +1,138 @@
+# Progress reporting for long batch jobs
+#
+# ProgressCounters lives in shared memory with one (done, errors) slot per process, so a worker process bumps
+# its own slot with a plain integer add and no lock. ProgressReporter sums the slots from a background thread.
+# On a terminal it redraws a single status line (items/sec, ETA, errors) at most a few times per second.
+# Otherwise it writes one log line per log_interval, and the thread sleeps in between.
+#
+# Usage:
+#   counters = ProgressCounters(workers + 1)
+#   with ProgressReporter("Auditing", total=None, counters=counters):
+#       ...  # workers call counters.add(done=1) after each item; the parent may use slot 0
+#   ProgressReporter("Hashed", total=count_lines("passwords.txt"))
+
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_worker_slot = 0
+
+
+def count_lines(path, block_size=1 << 20):
+    # Count the lines of a file in binary blocks, to give a reporter its total before a line-per-item job
+    lines, last = 0, b"\n"
+    with open(path, "rb") as file:
+        while block := file.read(block_size):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return lines + (last != b"\n")
+
+
+class ProgressCounters:
+    def __init__(self, slots=1):
+        # Allocate shared (done, errors) counters; slot 0 is for the parent process
+        self.slots = slots
+        self.values = multiprocessing.RawArray('q', 2 * slots)
+        self.next_slot = multiprocessing.Value('i', 1)
+
+    def claim_slot(self):
+        # Give the calling worker process its own slot; call once from a pool initializer
+        global _worker_slot
+        with self.next_slot.get_lock():
+            slot = self.next_slot.value
+            self.next_slot.value += 1
+        if slot >= self.slots:
+            raise ValueError("More workers than progress counter slots.")
+        _worker_slot = slot
+        return slot
+
+    def add(self, done=0, errors=0, slot=None):
+        # Add to this process's counters
+        index = 2 * (_worker_slot if slot is None else slot)
+        if done:
+            self.values[index] += done
+        if errors:
+            self.values[index + 1] += errors
+
+    def totals(self):
+        # Sum every slot into (done, errors)
+        values = self.values[:]
+        return sum(values[0::2]), sum(values[1::2])
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:d}:{seconds:02d}"
+
+
+class ProgressReporter:
+    def __init__(self, label, total=None, counters=None, stream=None, refresh_interval=0.25, log_interval=10.0):
+        # Initialize the reporter; without counters it uses a private single-slot ProgressCounters
+        self.label = label
+        self.total = total
+        self.counters = counters if counters is not None else ProgressCounters(1)
+        self.stream = stream if stream is not None else sys.stderr
+        self.interactive = hasattr(self.stream, "isatty") and self.stream.isatty()
+        self.interval = refresh_interval if self.interactive else log_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def advance(self, done=1, errors=0):
+        # Count items finished by the parent process
+        self.counters.add(done, errors, slot=0)
+
+    def status(self):
+        # Get the current status line
+        done, errors = self.counters.totals()
+        elapsed = max(time.monotonic() - self._started, 1e-9) if self._started else 0.0
+        rate = done / elapsed if elapsed else 0.0
+        parts = [f"{self.label}: {done:,}"]
+        if self.total:
+            parts[0] += f"/{self.total:,} ({100.0 * done / self.total:.1f}%)"
+        parts.append(f"{rate:,.0f} items/s")
+        if self.total and rate:
+            parts.append(f"ETA {_format_duration(max(0, self.total - done) / rate)}")
+        parts.append(f"elapsed {_format_duration(elapsed)}")
+        if errors:
+            parts.append(f"{errors:,} errors")
+        return "  ".join(parts)
+
+    def _render(self, final=False):
+        if self.interactive:
+            self.stream.write("\r\033[K" + self.status() + ("\n" if final else ""))
+            self.stream.flush()
+        else:
+            logger.info(self.status())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._render()
+
+    def start(self):
+        # Start rendering from a daemon thread
+        self._started = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        # Stop rendering and report the final status
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+            self._render(final=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,239 @@
+# Sliding-window rate limiting and lockout
+#
+# Counts attempts per key (e.g. "user:42" or "addr:203.0.113.7") with a sliding-window counter: each key keeps
+# the count of the current fixed window and of the previous one, and the estimate weights the previous count
+# by how much of it still overlaps the sliding window. Once the estimate reaches the limit the key is locked
+# for the lockout period. That is three numbers per key, so memory is bounded by the number of active keys.
+#
+# InMemoryRateStore shards keys over independently locked LRU maps with TTL eviction and a per-shard cap, so a
+# credential-stuffing burst over millions of keys evicts idle keys instead of growing without bound. Locked keys
+# are never evicted, so spraying new keys cannot lift an existing lockout; a shard full of locked keys grows
+# past the cap instead.
+# SQLiteRateStore keeps the same state in a SQLite table so several worker processes share the counts.
+
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+def _advance(entry, now, window):
+    # Move an entry [window_start, current, previous, locked_until] forward to the window containing now
+    window_start = now - (now % window)
+    if window_start != entry[0]:
+        entry[2] = entry[1] if window_start - entry[0] == window else 0
+        entry[1] = 0
+        entry[0] = window_start
+    return entry
+
+
+def _estimate(entry, now, window):
+    # Sliding-window estimate of the attempts made in the last window seconds
+    overlap = 1.0 - (now - entry[0]) / window
+    return entry[2] * overlap + entry[1]
+
+
+class InMemoryRateStore:
+    def __init__(self, shards=64, max_keys_per_shard=100000):
+        # Initialize the sharded in-memory store
+        self.shards = [OrderedDict() for _ in range(shards)]
+        self.locks = [threading.Lock() for _ in range(shards)]
+        self.max_keys_per_shard = max_keys_per_shard
+
+    def _shard(self, key):
+        index = zlib.crc32(key.encode('utf-8')) % len(self.shards)
+        return self.shards[index], self.locks[index]
+
+    def _evict(self, shard, now, window):
+        # Drop unlocked keys from the least recently used end while they are idle or the shard is over its cap.
+        # Locked keys are moved to the most recently used end and looked at again once the others have passed.
+        for _ in range(len(shard)):
+            key, entry = next(iter(shard.items()))
+            if entry[3] > now:
+                shard.move_to_end(key)
+                continue
+            if entry[0] + 2 * window > now and len(shard) <= self.max_keys_per_shard:
+                break
+            del shard[key]
+
+    def update(self, key, now, window, func):
+        # Apply func to the entry of key under the shard lock and return its result
+        shard, lock = self._shard(key)
+        with lock:
+            entry = shard.get(key)
+            if entry is None:
+                entry = shard[key] = [now - (now % window), 0, 0, 0.0]
+            else:
+                shard.move_to_end(key)
+            result = func(_advance(entry, now, window))
+            self._evict(shard, now, window)
+            return result
+
+    def get(self, key, now, window):
+        # Get a copy of the entry of key, or None
+        shard, lock = self._shard(key)
+        with lock:
+            entry = shard.get(key)
+            return list(_advance(entry, now, window)) if entry is not None else None
+
+    def delete(self, key):
+        # Forget a key
+        shard, lock = self._shard(key)
+        with lock:
+            shard.pop(key, None)
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.shards)
+
+
+class SQLiteRateStore:
+    def __init__(self, path, purge_every=1000, timeout=30.0):
+        # Initialize the store on a SQLite file shared by every worker process
+        self.path = path
+        self.purge_every = purge_every
+        self.timeout = timeout
+        self._local = threading.local()
+        self._updates = 0
+        self._updates_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits ("
+                " key TEXT PRIMARY KEY, window_start REAL NOT NULL, current INTEGER NOT NULL,"
+                " previous INTEGER NOT NULL, locked_until REAL NOT NULL) WITHOUT ROWID"
+            )
+
+    def _connection(self):
+        # One connection per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def update(self, key, now, window, func):
+        # Apply func to the entry of key in a write transaction and return its result
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT window_start, current, previous, locked_until FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            entry = list(row) if row is not None else [now - (now % window), 0, 0, 0.0]
+            result = func(_advance(entry, now, window))
+            conn.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?)", (key, *entry))
+            with self._updates_lock:
+                self._updates += 1
+                purge = self._updates % self.purge_every == 0
+            if purge:
+                # Idle, unlocked keys carry no state worth keeping
+                conn.execute("DELETE FROM rate_limits WHERE window_start + 2 * ? <= ? AND locked_until <= ?", (window, now, now))
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def get(self, key, now, window):
+        # Get a copy of the entry of key, or None
+        row = self._connection().execute(
+            "SELECT window_start, current, previous, locked_until FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        return _advance(list(row), now, window) if row is not None else None
+
+    def delete(self, key):
+        # Forget a key
+        self._connection().execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM rate_limits").fetchone()[0]
+
+
+class RateLimiter:
+    def __init__(self, limit=5, window=900.0, lockout=None, store=None):
+        # Allow limit attempts per sliding window of window seconds; lock keys for lockout seconds after that
+        self.limit = limit
+        self.window = window
+        self.lockout = window if lockout is None else lockout
+        self.store = store if store is not None else InMemoryRateStore()
+
+    def _state(self, entry, now):
+        if entry is None:
+            return {"attempts": 0.0, "remaining": self.limit, "locked": False, "locked_until": None}
+        attempts = _estimate(entry, now, self.window)
+        locked = entry[3] > now
+        return {
+            "attempts": attempts,
+            "remaining": max(0, int(self.limit - attempts)),
+            "locked": locked,
+            "locked_until": entry[3] if locked else None,
+        }
+
+    def hit(self, key, now=None):
+        # Record one attempt for key and return its state afterwards
+        now = time.time() if now is None else now
+
+        def record(entry):
+            if entry[3] <= now:
+                entry[1] += 1
+                if _estimate(entry, now, self.window) >= self.limit:
+                    entry[3] = now + self.lockout
+            return self._state(entry, now)
+
+        return self.store.update(key, now, self.window, record)
+
+    def state(self, key, now=None):
+        # Get the current attempts estimate and lock state of key
+        now = time.time() if now is None else now
+        return self._state(self.store.get(key, now, self.window), now)
+
+    def is_locked(self, key, now=None):
+        # Check if key is currently locked
+        return self.state(key, now)["locked"]
+
+    def lock(self, key, duration=None, now=None):
+        # Lock key for duration seconds (default: the lockout period)
+        now = time.time() if now is None else now
+        until = now + (self.lockout if duration is None else duration)
+
+        def set_lock(entry):
+            entry[3] = until
+            return self._state(entry, now)
+
+        return self.store.update(key, now, self.window, set_lock)
+
+    def unlock(self, key):
+        # Clear the lock and the attempt counts of key
+        self.store.delete(key)
+
+
+class LoginRateLimiter:
+    # Separate limits for failed logins per user ID and per client address
+
+    def __init__(self, user_limit=5, address_limit=100, window=900.0, lockout=None, store=None):
+        store = store if store is not None else InMemoryRateStore()
+        self.users = RateLimiter(user_limit, window, lockout, store)
+        self.addresses = RateLimiter(address_limit, window, lockout, store)
+
+    @staticmethod
+    def user_key(user_id):
+        return f"user:{user_id}"
+
+    @staticmethod
+    def address_key(address):
+        return f"addr:{address}"
+
+    def is_blocked(self, user_id, address=None, now=None):
+        # Check if either the user or the client address is locked
+        if self.users.is_locked(self.user_key(user_id), now):
+            return True
+        return address is not None and self.addresses.is_locked(self.address_key(address), now)
+
+    def record_failure(self, user_id, address=None, now=None):
+        # Count a failed login against the user and the address; returns the user's state
+        if address is not None:
+            self.addresses.hit(self.address_key(address), now)
+        return self.users.hit(self.user_key(user_id), now)
+
+    def record_success(self, user_id):
+        # Reset the failure count of a user after a successful login
+        self.users.unlock(self.user_key(user_id))
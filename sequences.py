@@ -0,0 +1,99 @@
+# Sequence and repeat detection
+#
+# find_sequences makes one pass over a string and reports every maximal arithmetic run of at least min_length
+# digits or letters: ascending or descending, with any fixed step ("1234", "9876", "135", "aceg"). Letters are
+# compared case-insensitively and a run never mixes digits with letters. find_repeats reports repeated
+# characters ("aaa") and repeated blocks ("abcabc"), trying each block length up to max_block with one pass per
+# length, so both detectors are linear in the length of the string and never sort.
+#
+# Usage:
+#   from sequences import find_sequences, find_repeats
+#   find_sequences("x1357y")   # [SequenceSpan(start=1, end=5, token='1357', step=2, kind='digits')]
+#   find_repeats("abcabc!")    # [RepeatSpan(start=0, end=6, token='abcabc', block='abc', count=2)]
+
+from collections import namedtuple
+
+SequenceSpan = namedtuple("SequenceSpan", ("start", "end", "token", "step", "kind"))
+RepeatSpan = namedtuple("RepeatSpan", ("start", "end", "token", "block", "count"))
+
+ASCII_LETTERS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+
+def char_kind(char):
+    # 'digits' for decimal digits, 'letters' for ASCII letters, otherwise None
+    if char.isdecimal():
+        return "digits"
+    if char in ASCII_LETTERS:
+        return "letters"
+    return None
+
+
+def sequence_step(a, b):
+    # Code-point step from a to b, ignoring the case of ASCII letters
+    return ord(b.lower()) - ord(a.lower())
+
+
+def find_sequences(text, min_length=3):
+    # Find maximal arithmetic runs of digits or letters with a nonzero step
+    spans = []
+    n = len(text)
+    start = 0
+    step = None
+    kind = char_kind(text[0]) if n else None
+    for i in range(1, n + 1):
+        next_kind = char_kind(text[i]) if i < n else None
+        if i < n and next_kind is not None and next_kind == kind:
+            difference = sequence_step(text[i - 1], text[i])
+            if difference != 0 and (step is None or difference == step):
+                step = difference
+                continue
+        else:
+            difference = None
+        if step is not None and i - start >= min_length:
+            spans.append(SequenceSpan(start, i, text[start:i], step, kind))
+        # The last character of a broken run can start the next one, as in "1235" -> "35..."
+        if difference is not None and difference != 0:
+            start, step = i - 1, difference
+        else:
+            start, step = i, None
+        kind = next_kind
+    return spans
+
+
+def repeat_candidate(i, matched, block):
+    # (block, start, end) of the repeat that ends where a run of matched characters equal to the one block
+    # characters earlier stops at index i, trimmed to whole blocks
+    start = i - matched - block
+    return block, start, start + (matched + block) // block * block
+
+
+def select_repeats(text, candidates, min_length=3):
+    # Turn (block, start, end) candidates into RepeatSpans, skipping short ones and ones covered by a repeat of a
+    # shorter block ("aaaa" is not also reported as "aa" twice)
+    spans = []
+    # reach[i] is the furthest end of any reported span that covers position i
+    reach = [0] * len(text)
+    for block, start, end in sorted(candidates):
+        if end - start >= min_length and reach[start] < end:
+            spans.append(RepeatSpan(start, end, text[start:end], text[start:start + block], (end - start) // block))
+            for k in range(start, end):
+                if reach[k] < end:
+                    reach[k] = end
+    spans.sort()
+    return spans
+
+
+def find_repeats(text, min_length=3, max_block=8):
+    # Find repeated characters and blocks of up to max_block characters covering at least min_length characters
+    candidates = []
+    n = len(text)
+    for block in range(1, min(max_block, n // 2) + 1):
+        matched = 0
+        for i in range(block, n + 1):
+            if i < n and text[i] == text[i - block]:
+                matched += 1
+                continue
+            if matched >= block:
+                candidates.append(repeat_candidate(i, matched, block))
+            matched = 0
+    return select_repeats(text, candidates, min_length)
@@ -0,0 +1,75 @@
+# Bounded edit distance between passwords
+#
+# bounded_edit_distance computes the Levenshtein distance with the bit-parallel algorithm of Myers, in Hyyrö's
+# formulation: one column of the dynamic-programming table is kept as two bit vectors of vertical +1/-1 deltas
+# (one bit per character of the shorter string, held in a Python int, so there is no 64-character limit) and
+# each character of the longer string updates the whole column with a handful of integer operations. The
+# search gives up as soon as the distance is certain to exceed the bound: immediately if the lengths differ by
+# more, and otherwise once the distance so far minus the characters still to come is over it.
+#
+# normalize lowercases a password and undoes common leetspeak substitutions ("P@55w0rd" -> "password"), so
+# "Summer2024!" and "summr2025!" are two edits apart rather than four.
+#
+# Usage:
+#   from similarity import bounded_edit_distance, is_similar
+#   bounded_edit_distance("kitten", "sitting", 3)    # 3
+#   bounded_edit_distance("kitten", "sitting", 2)    # None
+#   is_similar("Summer2024!", "Summr2025!")           # True
+
+from entropy import L33T_TABLE
+
+
+def normalize(password):
+    # Lowercase the password and replace leetspeak characters with the letters they stand for
+    return password.lower().translate(L33T_TABLE)
+
+
+def similarity_threshold(password):
+    # Largest edit distance at which a password counts as similar: a quarter of its length, at least 2
+    return max(2, len(password) // 4)
+
+
+def bounded_edit_distance(a, b, max_distance):
+    # Levenshtein distance between a and b if it is at most max_distance, otherwise None
+    if len(a) > len(b):
+        a, b = b, a
+    m, n = len(a), len(b)
+    if n - m > max_distance:
+        return None
+    if m == 0:
+        return n
+
+    # peq[c] has bit i set where a[i] == c
+    peq = {}
+    for i, char in enumerate(a):
+        peq[char] = peq.get(char, 0) | (1 << i)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    positive, negative = full, 0
+    distance = m
+    for j, char in enumerate(b):
+        eq = peq.get(char, 0)
+        vertical = eq | negative
+        horizontal = (((eq & positive) + positive) ^ positive) | eq
+        horizontal_positive = negative | ~(horizontal | positive)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        # Each of the n - j - 1 remaining characters can lower the distance by at most one
+        if distance - (n - j - 1) > max_distance:
+            return None
+        horizontal_positive = (horizontal_positive << 1) | 1
+        horizontal_negative <<= 1
+        positive = (horizontal_negative | ~(vertical | horizontal_positive)) & full
+        negative = horizontal_positive & vertical & full
+    return distance if distance <= max_distance else None
+
+
+def is_similar(password, other, max_distance=None):
+    # Check if two passwords are within max_distance edits (default: similarity_threshold of password) after
+    # normalizing case and leetspeak
+    if max_distance is None:
+        max_distance = similarity_threshold(password)
+    return bounded_edit_distance(normalize(password), normalize(other), max_distance) is not None
@@ -0,0 +1,550 @@
+import copy
+import json
+import queue
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from kdf import identify_scheme
+
+# Record keys understood by every user store. Any other key is kept as extra data.
+USER_FIELDS = ('userID', 'firstName', 'lastName', 'history', 'expirationMonthLeft', 'currentPassword', 'accountStatus', 'passwordHash',
+               'passwordVersion')
+# Changes to these keys bump passwordVersion, a counter caches of password-derived data compare instead of the passwords
+PASSWORD_FIELDS = ('currentPassword', 'history')
+
+
+def bumps_password_version(changes):
+    # Check if a set of changes replaces the passwords without setting passwordVersion itself
+    return 'passwordVersion' not in changes and any(key in changes for key in PASSWORD_FIELDS)
+
+
+class InMemoryUserStore:
+    # User store backed by a plain list of dicts, used by the sample data set and tests.
+
+    def __init__(self, data):
+        # Initialize the store with a list of user records and build its indexes
+        self.users_data = data
+        self.lock = threading.RLock()
+        self.users_by_id = {}
+        self.users_by_status = {}
+        self.users_by_expiration = {}
+        # Number of users per stored password hash scheme (None for users without a hash)
+        self.hash_scheme_counts = Counter()
+        # Undo actions of the open transaction, run in reverse if it fails; None outside a transaction
+        self._undo = None
+        for user in data:
+            self._index_user(user)
+
+    def _index_user(self, user):
+        # Add a user record to every index
+        self.users_by_id[user['userID']] = user
+        self.users_by_status.setdefault(user['accountStatus'], set()).add(user['userID'])
+        self.users_by_expiration.setdefault(user['expirationMonthLeft'], set()).add(user['userID'])
+        self.hash_scheme_counts[identify_scheme(user.get('passwordHash'))] += 1
+
+    def _unindex_secondary(self, user):
+        # Remove a user record from the secondary indexes
+        scheme = identify_scheme(user.get('passwordHash'))
+        self.hash_scheme_counts[scheme] -= 1
+        if not self.hash_scheme_counts[scheme]:
+            del self.hash_scheme_counts[scheme]
+        for index, key in ((self.users_by_status, user['accountStatus']), (self.users_by_expiration, user['expirationMonthLeft'])):
+            user_ids = index.get(key)
+            if user_ids is not None:
+                user_ids.discard(user['userID'])
+                if not user_ids:
+                    del index[key]
+
+    @contextmanager
+    def transaction(self):
+        # Run several reads and writes atomically with respect to other threads. If the block raises, every
+        # change it made is undone, as a SQLite transaction is rolled back; nested transactions join the outer one.
+        with self.lock:
+            if self._undo is not None:
+                yield self
+                return
+            self._undo = []
+            try:
+                yield self
+            except BaseException:
+                for undo in reversed(self._undo):
+                    undo()
+                raise
+            finally:
+                self._undo = None
+
+    def _restore_user(self, user, saved):
+        # Undo action of update_user: put the saved fields back into the same record object. passwordVersion
+        # keeps counting up instead, so a version seen during the transaction is never reused for other passwords.
+        version = user.get('passwordVersion', 0)
+        self._unindex_secondary(user)
+        user.clear()
+        user.update(saved)
+        if version != saved.get('passwordVersion', 0):
+            user['passwordVersion'] = version + 1
+        self._index_user(user)
+
+    def _remove_user(self, user):
+        # Undo action of add_user
+        self._unindex_secondary(user)
+        del self.users_by_id[user['userID']]
+        # Find the record by identity from the end, where add_user put it; list.remove would compare records
+        for i in range(len(self.users_data) - 1, -1, -1):
+            if self.users_data[i] is user:
+                del self.users_data[i]
+                break
+
+    def get_user(self, user_id):
+        # Get the user record for a specific user ID
+        return self.users_by_id.get(user_id)
+
+    def add_user(self, user):
+        # Add a new user record and index it
+        with self.lock:
+            if user['userID'] in self.users_by_id:
+                raise ValueError(f"User with user ID {user['userID']} already exists.")
+            self.users_data.append(user)
+            self._index_user(user)
+            if self._undo is not None:
+                self._undo.append(lambda: self._remove_user(user))
+
+    def update_user(self, user_id, changes):
+        # Apply field changes to a user record while keeping every index consistent
+        with self.lock:
+            user = self.users_by_id.get(user_id)
+            if user is None:
+                return False
+            if 'userID' in changes and changes['userID'] != user_id:
+                raise ValueError("userID cannot be changed.")
+            if self._undo is not None:
+                saved = copy.deepcopy(user)
+                self._undo.append(lambda: self._restore_user(user, saved))
+            self._unindex_secondary(user)
+            user.update(changes)
+            if bumps_password_version(changes):
+                user['passwordVersion'] = user.get('passwordVersion', 0) + 1
+            self._index_user(user)
+            return True
+
+    def update_users(self, updates):
+        # Apply a batch of (user_id, changes) pairs in one transaction and return how many users were updated
+        with self.transaction():
+            return sum(1 for user_id, changes in updates if self.update_user(user_id, changes))
+
+    def iter_users(self, after_id=None, batch_size=1000):
+        # Yield user records in userID order, starting after after_id
+        with self.lock:
+            user_ids = sorted(user_id for user_id in self.users_by_id if after_id is None or user_id > after_id)
+        for user_id in user_ids:
+            user = self.users_by_id.get(user_id)
+            if user is not None:
+                yield user
+
+    def get_users_by_status(self, status):
+        # Get the user IDs with a specific account status; the indexes are only read under the lock, since
+        # writers change them in place
+        with self.lock:
+            return set(self.users_by_status.get(status, ()))
+
+    def get_users_by_expiration(self, months_left):
+        # Get the user IDs whose password expires in exactly months_left months
+        with self.lock:
+            return set(self.users_by_expiration.get(months_left, ()))
+
+    def get_users_expiring_within(self, months_left):
+        # Get the user IDs whose password expires within months_left months
+        user_ids = set()
+        with self.lock:
+            for months, ids in self.users_by_expiration.items():
+                if months <= months_left:
+                    user_ids |= ids
+        return user_ids
+
+    def count_by_hash_scheme(self):
+        # Get the number of users per password hash scheme without scanning the users
+        with self.lock:
+            return dict(self.hash_scheme_counts)
+
+    def close(self):
+        # Nothing to release for the in-memory store
+        pass
+
+
+class SQLiteConnectionPool:
+    # Thread-safe pool of SQLite connections to a single database file.
+
+    def __init__(self, path, max_connections=8, timeout=30.0):
+        # Initialize the pool; connections are opened lazily up to max_connections
+        self.path = path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        # Open a connection tuned for many small transactions
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None, cached_statements=256)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        return conn
+
+    def acquire(self):
+        # Take an idle connection, opening a new one if the pool is not full
+        if self._closed:
+            raise RuntimeError("Connection pool is closed.")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.max_connections:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        return self._idle.get(timeout=self.timeout)
+
+    def release(self, conn):
+        # Return a connection to the pool
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        # Borrow a connection for the duration of a with-block
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        # Close every idle connection; busy ones are closed when released
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class SQLiteTransaction:
+    # Store operations bound to one connection inside an open transaction.
+
+    def __init__(self, store, conn):
+        self.store = store
+        self.conn = conn
+
+    def get_user(self, user_id):
+        return self.store._get_user(self.conn, user_id)
+
+    def add_user(self, user):
+        self.store._add_user(self.conn, user)
+
+    def update_user(self, user_id, changes):
+        return self.store._update_user(self.conn, user_id, changes)
+
+
+class SQLiteBatchWriter:
+    # Buffers user updates and commits them in one transaction per batch.
+
+    def __init__(self, store, batch_size=500):
+        self.store = store
+        self.batch_size = batch_size
+        self.pending = []
+        self.written = 0
+
+    def update_user(self, user_id, changes):
+        # Queue an update, flushing when the batch is full
+        self.pending.append((user_id, changes))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Commit every queued update in a single transaction
+        if self.pending:
+            self.written += self.store.update_users(self.pending)
+            self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+
+class SQLiteUserStore:
+    # Durable user store backed by SQLite, shareable between threads and processes.
+
+    # Record keys mapped to table columns
+    COLUMNS = {
+        'firstName': 'first_name',
+        'lastName': 'last_name',
+        'history': 'history',
+        'expirationMonthLeft': 'expiration_month_left',
+        'currentPassword': 'current_password',
+        'accountStatus': 'account_status',
+        'passwordHash': 'password_hash',
+        'passwordVersion': 'password_version',
+    }
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            first_name TEXT NOT NULL,
+            last_name TEXT NOT NULL,
+            history TEXT NOT NULL,
+            expiration_month_left INTEGER NOT NULL,
+            current_password TEXT NOT NULL,
+            account_status TEXT NOT NULL,
+            extra TEXT NOT NULL DEFAULT '{}',
+            password_hash TEXT,
+            hash_scheme TEXT,
+            password_version INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS users_account_status ON users (account_status);
+        CREATE INDEX IF NOT EXISTS users_expiration_month_left ON users (expiration_month_left);
+    """
+
+    # Per-scheme user counts kept up to date by triggers, so progress queries never scan the users table.
+    # Users without a stored hash are counted under the empty string.
+    HASH_SCHEME_SCHEMA = (
+        "CREATE INDEX IF NOT EXISTS users_hash_scheme ON users (hash_scheme)",
+        "CREATE TABLE IF NOT EXISTS hash_scheme_counts (scheme TEXT PRIMARY KEY, count INTEGER NOT NULL)",
+        """CREATE TRIGGER IF NOT EXISTS users_hash_scheme_insert AFTER INSERT ON users BEGIN
+            INSERT INTO hash_scheme_counts (scheme, count) VALUES (coalesce(NEW.hash_scheme, ''), 1)
+                ON CONFLICT (scheme) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS users_hash_scheme_update AFTER UPDATE OF hash_scheme ON users
+        WHEN coalesce(OLD.hash_scheme, '') != coalesce(NEW.hash_scheme, '') BEGIN
+            UPDATE hash_scheme_counts SET count = count - 1 WHERE scheme = coalesce(OLD.hash_scheme, '');
+            INSERT INTO hash_scheme_counts (scheme, count) VALUES (coalesce(NEW.hash_scheme, ''), 1)
+                ON CONFLICT (scheme) DO UPDATE SET count = count + 1;
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS users_hash_scheme_delete AFTER DELETE ON users BEGIN
+            UPDATE hash_scheme_counts SET count = count - 1 WHERE scheme = coalesce(OLD.hash_scheme, '');
+        END""",
+    )
+
+    SELECT_USER = "SELECT * FROM users WHERE user_id = ?"
+    INSERT_USER = (
+        "INSERT INTO users (user_id, first_name, last_name, history, expiration_month_left, current_password, account_status, extra,"
+        " password_hash, hash_scheme, password_version) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    )
+
+    def __init__(self, path, max_connections=8):
+        # Initialize the store and create the schema if it does not exist yet
+        self.pool = SQLiteConnectionPool(path, max_connections=max_connections)
+        self._update_statements = {}
+        with self.pool.connection() as conn:
+            conn.executescript(self.SCHEMA)
+            self._upgrade_schema(conn)
+
+    def _upgrade_schema(self, conn):
+        # Add the password hash and version columns and scheme counts to databases created before they existed
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(users)")}
+            if 'password_version' not in columns:
+                conn.execute("ALTER TABLE users ADD COLUMN password_version INTEGER NOT NULL DEFAULT 0")
+            if 'password_hash' not in columns:
+                conn.execute("ALTER TABLE users ADD COLUMN password_hash TEXT")
+                conn.execute("ALTER TABLE users ADD COLUMN hash_scheme TEXT")
+                rows = conn.execute("SELECT user_id, json_extract(extra, '$.passwordHash') FROM users WHERE json_extract(extra, '$.passwordHash') IS NOT NULL").fetchall()
+                conn.executemany(
+                    "UPDATE users SET password_hash = ?, hash_scheme = ?, extra = json_remove(extra, '$.passwordHash') WHERE user_id = ?",
+                    [(stored_hash, identify_scheme(stored_hash), user_id) for user_id, stored_hash in rows],
+                )
+            has_counts = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'hash_scheme_counts'").fetchone()
+            for statement in self.HASH_SCHEME_SCHEMA:
+                conn.execute(statement)
+            if not has_counts:
+                conn.execute(
+                    "INSERT INTO hash_scheme_counts (scheme, count)"
+                    " SELECT coalesce(hash_scheme, ''), count(*) FROM users GROUP BY coalesce(hash_scheme, '')"
+                )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @classmethod
+    def from_records(cls, path, records, max_connections=8):
+        # Create a store and load a list of user records into it in one transaction
+        store = cls(path, max_connections=max_connections)
+        with store.transaction() as tx:
+            for user in records:
+                tx.add_user(user)
+        return store
+
+    def _row_to_user(self, row):
+        # Convert a table row into a user record dict
+        user = {
+            'userID': row['user_id'],
+            'firstName': row['first_name'],
+            'lastName': row['last_name'],
+            'history': json.loads(row['history']),
+            'expirationMonthLeft': row['expiration_month_left'],
+            'currentPassword': row['current_password'],
+            'accountStatus': row['account_status'],
+            'passwordVersion': row['password_version'],
+        }
+        if row['password_hash'] is not None:
+            user['passwordHash'] = row['password_hash']
+        user.update(json.loads(row['extra']))
+        return user
+
+    def _get_user(self, conn, user_id):
+        row = conn.execute(self.SELECT_USER, (user_id,)).fetchone()
+        return self._row_to_user(row) if row is not None else None
+
+    def _add_user(self, conn, user):
+        extra = {key: value for key, value in user.items() if key not in USER_FIELDS}
+        try:
+            conn.execute(self.INSERT_USER, (
+                user['userID'], user['firstName'], user['lastName'], json.dumps(user['history']),
+                user['expirationMonthLeft'], user['currentPassword'], user['accountStatus'], json.dumps(extra),
+                user.get('passwordHash'), identify_scheme(user.get('passwordHash')), user.get('passwordVersion', 0),
+            ))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"User with user ID {user['userID']} already exists.") from None
+
+    def _update_statement(self, columns, with_extra, bump_version=False):
+        # Build (once) the UPDATE statement for a set of columns so SQLite can reuse the prepared statement
+        key = (columns, with_extra, bump_version)
+        statement = self._update_statements.get(key)
+        if statement is None:
+            assignments = [f"{column} = ?" for column in columns]
+            if bump_version:
+                assignments.append("password_version = password_version + 1")
+            if with_extra:
+                assignments.append("extra = json_patch(extra, ?)")
+            statement = f"UPDATE users SET {', '.join(assignments)} WHERE user_id = ?"
+            self._update_statements[key] = statement
+        return statement
+
+    def _update_user(self, conn, user_id, changes):
+        if 'userID' in changes and changes['userID'] != user_id:
+            raise ValueError("userID cannot be changed.")
+        columns, values, extra = [], [], {}
+        for key, value in changes.items():
+            if key == 'userID':
+                continue
+            column = self.COLUMNS.get(key)
+            if column is None:
+                extra[key] = value
+            else:
+                columns.append(column)
+                values.append(json.dumps(value) if key == 'history' else value)
+                if key == 'passwordHash':
+                    columns.append('hash_scheme')
+                    values.append(identify_scheme(value))
+        if not columns and not extra:
+            return self._get_user(conn, user_id) is not None
+        if extra:
+            values.append(json.dumps(extra))
+        values.append(user_id)
+        cursor = conn.execute(self._update_statement(tuple(columns), bool(extra), bumps_password_version(changes)), values)
+        return cursor.rowcount > 0
+
+    @contextmanager
+    def transaction(self):
+        # Run several reads and writes in one write transaction
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield SQLiteTransaction(self, conn)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def batch_writer(self, batch_size=500):
+        # Get a writer that groups updates into transactions of batch_size users
+        return SQLiteBatchWriter(self, batch_size)
+
+    def get_user(self, user_id):
+        # Get the user record for a specific user ID
+        with self.pool.connection() as conn:
+            return self._get_user(conn, user_id)
+
+    def add_user(self, user):
+        # Add a new user record
+        with self.transaction() as tx:
+            tx.add_user(user)
+
+    def update_user(self, user_id, changes):
+        # Apply field changes to a user record
+        with self.transaction() as tx:
+            return tx.update_user(user_id, changes)
+
+    def update_users(self, updates):
+        # Apply a batch of (user_id, changes) pairs in one transaction and return how many users were updated
+        with self.transaction() as tx:
+            return sum(1 for user_id, changes in updates if tx.update_user(user_id, changes))
+
+    def iter_users(self, after_id=None, batch_size=1000):
+        # Yield user records in userID order, reading batch_size rows per query
+        last_id = after_id
+        while True:
+            with self.pool.connection() as conn:
+                if last_id is None:
+                    rows = conn.execute("SELECT * FROM users ORDER BY user_id LIMIT ?", (batch_size,)).fetchall()
+                else:
+                    rows = conn.execute("SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?", (last_id, batch_size)).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._row_to_user(row)
+            last_id = rows[-1]['user_id']
+
+    def _query_ids(self, sql, params):
+        with self.pool.connection() as conn:
+            return {row[0] for row in conn.execute(sql, params)}
+
+    def get_users_by_status(self, status):
+        # Get the user IDs with a specific account status
+        return self._query_ids("SELECT user_id FROM users WHERE account_status = ?", (status,))
+
+    def get_users_by_expiration(self, months_left):
+        # Get the user IDs whose password expires in exactly months_left months
+        return self._query_ids("SELECT user_id FROM users WHERE expiration_month_left = ?", (months_left,))
+
+    def get_users_expiring_within(self, months_left):
+        # Get the user IDs whose password expires within months_left months
+        return self._query_ids("SELECT user_id FROM users WHERE expiration_month_left <= ?", (months_left,))
+
+    def count_by_hash_scheme(self):
+        # Get the number of users per password hash scheme from the trigger-maintained counts table
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT scheme, count FROM hash_scheme_counts WHERE count > 0").fetchall()
+        return {(row['scheme'] or None): row['count'] for row in rows}
+
+    def close(self):
+        # Close every pooled connection
+        self.pool.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Load the sample user data set into a SQLite database
+    if len(sys.argv) != 2:
+        print("Usage: python storage.py <users.db>")
+        sys.exit(1)
+
+    from main import sample_users_data
+    store = SQLiteUserStore.from_records(sys.argv[1], sample_users_data)
+    print(f"Stored {len(sample_users_data)} users in {sys.argv[1]}")
+    store.close()
@@ -0,0 +1,54 @@
+import io
+import os
+import struct
+
+import pytest
+
+from AESencrypt import MAX_CHUNK_SIZE, STREAM_HEADER, STREAM_MAGIC, AESCipher
+
+
+def encrypt(cipher, data, chunk_size):
+    output = io.BytesIO()
+    cipher.encrypt_stream(io.BytesIO(data), output, chunk_size=chunk_size)
+    return output.getvalue()
+
+
+def decrypt(cipher, data):
+    output = io.BytesIO()
+    cipher.decrypt_stream(io.BytesIO(data), output)
+    return output.getvalue()
+
+
+@pytest.mark.parametrize("size", [0, 1, 15, 16, 4096, 10000])
+def test_stream_roundtrip(size):
+    cipher = AESCipher()
+    data = os.urandom(size)
+    encrypted = encrypt(cipher, data, 4096)
+    frames = max(1, -(-size // 4096))
+    assert len(encrypted) == STREAM_HEADER.size + size + frames * (4 + 16)
+    assert decrypt(cipher, encrypted) == data
+
+
+def test_stream_rejects_tampering_truncation_and_wrong_key():
+    cipher = AESCipher()
+    encrypted = encrypt(cipher, os.urandom(10000), 4096)
+    tampered = bytearray(encrypted)
+    tampered[STREAM_HEADER.size + 10] ^= 1
+    for corrupt in (bytes(tampered), encrypted[:-1], encrypted[:STREAM_HEADER.size + 4 + 4096 + 16], encrypted + b"x"):
+        with pytest.raises(ValueError):
+            decrypt(cipher, corrupt)
+    with pytest.raises(ValueError):
+        decrypt(AESCipher(), encrypted)
+
+
+def test_stream_rejects_oversized_chunk_header_before_allocating():
+    header = STREAM_HEADER.pack(STREAM_MAGIC, 0x7FFFFFFF, b"\0" * 8)
+    with pytest.raises(ValueError, match="chunk size"):
+        decrypt(AESCipher(), header + struct.pack(">I", 0))
+    with pytest.raises(ValueError):
+        encrypt(AESCipher(), b"data", MAX_CHUNK_SIZE + 1)
+
+
+def test_string_roundtrip():
+    cipher = AESCipher()
+    assert cipher.decrypt_string(cipher.encrypt_string("héllo")) == "héllo"
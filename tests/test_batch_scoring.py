@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+import batch_scoring
+from batch_scoring import BatchScorer
+from complexity import PasswordSecurityChecker
+from main import common_passwords
+
+EDGE_CASES = [
+    "", "a", "Aa1!", "Aa1!aaaa", "P@ssw0rd", "password123", "Kx!2024Qz", "Kx!2026Qz", "qwertY1!",
+    "ÀÉÎ1!abcd", "Ab1!Ab1!ǅ", "١٢٣Abc!xyz", "Ab1! xyzw", "ABCDEFGH", "!@#$%^&*", "Zq#7x135Rv",
+]
+
+
+def random_passwords(count, seed):
+    rng = random.Random(seed)
+    alphabet = "aBcDqWe1357902!@#$ é٣"
+    return ["".join(rng.choice(alphabet) for _ in range(rng.randrange(0, 14))) for _ in range(count)]
+
+
+def expected_levels(passwords):
+    checker = PasswordSecurityChecker("", common_passwords)
+    levels = []
+    for password in passwords:
+        checker.password = password
+        levels.append(checker.security_level())
+    return levels
+
+
+@pytest.mark.parametrize("passwords", [
+    [],
+    [""],
+    EDGE_CASES,
+    ["", "", "Aa1!aaaa", ""],
+    ["é", "Aa1!aaaa"],
+    random_passwords(2000, 17),
+])
+def test_security_levels_match_security_level(passwords):
+    assert BatchScorer(common_passwords).security_levels(passwords) == expected_levels(passwords)
+
+
+def test_accepts_any_iterable():
+    scorer = BatchScorer(common_passwords)
+    assert scorer.security_levels(iter(EDGE_CASES)) == expected_levels(EDGE_CASES)
+
+
+def test_scalar_fallback_without_numpy(monkeypatch):
+    monkeypatch.setattr(batch_scoring, "np", None)
+    passwords = EDGE_CASES + random_passwords(200, 18)
+    assert BatchScorer(common_passwords).security_levels(passwords) == expected_levels(passwords)
@@ -0,0 +1,89 @@
+import hashlib
+import os
+
+import pytest
+
+from breach_corpus import HIBP, PLAIN, BreachCorpus, password_hash, sniff_format
+
+
+def write_plain(path, passwords, newline=b"\n"):
+    path.write_bytes(newline.join(password.encode("utf-8") for password in passwords) + newline)
+    return str(path)
+
+
+def write_hibp(path, counts):
+    path.write_text("".join(f"{hashlib.sha1(password.encode()).hexdigest().upper()}:{count}\n"
+                            for password, count in counts.items()) + "not a hash line\n")
+    return str(path)
+
+
+def test_plain_and_hibp_dumps_are_counted_and_merged(tmp_path):
+    plain = write_plain(tmp_path / "plain.txt", ["password", "café", "café", "dragon", "password"], b"\r\n")
+    hibp = write_hibp(tmp_path / "hibp.txt", {"password": 100, "letmein": 7})
+    assert (sniff_format(plain), sniff_format(hibp)) == (PLAIN, HIBP)
+
+    with BreachCorpus.update(str(tmp_path / "corpus"), [plain, hibp], memory_mb=1) as corpus:
+        # NFC and NFD spellings are the same password
+        assert corpus.count("café") == 2
+        assert corpus.count("password") == 102
+        assert corpus.count("letmein") == 7
+        assert corpus.count("missing") == 0
+        assert (corpus.entries, corpus.occurrences) == (4, 5 + 107)
+    with BreachCorpus.open(str(tmp_path / "corpus")) as reopened:
+        assert reopened.count_digest(password_hash("dragon")) == 1
+
+
+def test_incremental_update_skips_ingested_dumps_and_rejects_changed_ones(tmp_path):
+    directory = str(tmp_path / "corpus")
+    first = write_plain(tmp_path / "first.txt", ["alpha", "beta"])
+    second = write_plain(tmp_path / "second.txt", ["beta", "gamma"])
+    BreachCorpus.update(directory, [first]).close()
+    with BreachCorpus.update(directory, [first, second]) as corpus:
+        assert [corpus.count(word) for word in ("alpha", "beta", "gamma")] == [1, 2, 1]
+        assert len(corpus.manifest["sources"]) == 2
+        assert corpus.manifest["generation"] == 2
+    # Only the shards named by the manifest are left
+    shard_files = {name for name in os.listdir(directory) if name.endswith(".shard")}
+    assert shard_files == {shard["file"] for shard in corpus.shards.values()}
+
+    with open(first, "ab") as dump:
+        dump.write(b"delta\n")
+    with pytest.raises(ValueError, match="changed since it was ingested"):
+        BreachCorpus.update(directory, [first])
+
+
+def test_interrupted_rebuild_leaves_the_live_corpus_intact(tmp_path, monkeypatch):
+    directory = str(tmp_path / "corpus")
+    old = write_plain(tmp_path / "old.txt", [f"old{i}" for i in range(200)])
+    new = write_plain(tmp_path / "new.txt", [f"new{i}" for i in range(200)])
+    BreachCorpus.update(directory, [old], prefix_bytes=1).close()
+
+    def interrupted(self, manifest):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(BreachCorpus, "_write_manifest", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        BreachCorpus.update(directory, [new], prefix_bytes=1, rebuild=True)
+    monkeypatch.undo()
+
+    with BreachCorpus.open(directory) as live:
+        assert all(live.count(f"old{i}") == 1 for i in range(200))
+        assert live.count("new0") == 0
+    with BreachCorpus.update(directory, [new], prefix_bytes=1, rebuild=True) as rebuilt:
+        assert rebuilt.manifest["generation"] == 2
+        assert rebuilt.count("new0") == 1 and rebuilt.count("old0") == 0
+
+
+def test_filter_has_no_false_negatives_and_follows_updates(tmp_path):
+    directory = str(tmp_path / "corpus")
+    first = write_plain(tmp_path / "first.txt", [f"pw{i}" for i in range(2000)])
+    second = write_plain(tmp_path / "second.txt", [f"more{i}" for i in range(3000)])
+    with BreachCorpus.update(directory, [first]) as corpus:
+        corpus.build_filter(false_positive_rate=0.01)
+    with BreachCorpus.update(directory, [second]) as corpus:
+        assert corpus.bloom is not None and corpus.manifest["filter"]["capacity"] >= corpus.entries
+        assert all(corpus.count(f"pw{i}") == 1 for i in range(2000))
+        assert all(corpus.count(f"more{i}") == 1 for i in range(3000))
+        assert corpus.false_positives == 0
+        assert sum(corpus.count(f"absent{i}") for i in range(2000)) == 0
+        assert corpus.filtered > 1900
@@ -0,0 +1,59 @@
+import pickle
+import struct
+
+import pytest
+
+from corpus_file import CorpusFile
+from entropy import GuessEstimator
+
+WORDS = ["password", "123456", "Monkey", "PASSWORD", "passw0rd", "pass", "p", "éclair", "dragon", "monkey"]
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = str(tmp_path / "common.cpf")
+    assert CorpusFile.build(WORDS, path) == 8
+    with CorpusFile.open(path) as corpus:
+        yield corpus
+
+
+def test_entries_are_lowercased_sorted_and_keep_first_rank(corpus):
+    assert list(corpus) == sorted(["password", "123456", "monkey", "passw0rd", "pass", "p", "éclair", "dragon"],
+                                  key=lambda word: word.encode("utf-8"))
+    assert len(corpus) == 8 and corpus.max_length == 8
+    assert corpus.get("password") == corpus.get("PassWord") == 1
+    assert corpus.get("MONKEY") == 3
+    assert corpus.get("ÉCLAIR") == 8
+    assert corpus.get("passwor") is None and "passwor" not in corpus and "Dragon" in corpus
+
+
+def test_prefix_queries(corpus):
+    assert list(corpus.prefix("PASS")) == ["pass", "passw0rd", "password"]
+    assert list(corpus.prefix("p", limit=2)) == ["p", "pass"]
+    assert list(corpus.prefix("x")) == []
+    assert corpus.prefix_matches("xpasswordx", 1) == [(2, 7), (5, 6), (9, 1)]
+    assert corpus.contains_window("swor") and not corpus.contains_window("zzzz")
+
+
+def test_estimator_matches_mixed_case_entries_like_a_list(corpus):
+    from_list = GuessEstimator(["Monkey"], layouts=())
+    from_file = GuessEstimator(corpus, layouts=())
+    for estimator in (from_list, from_file):
+        assert [match.pattern for match in estimator.estimate("monkey").sequence] == ["dictionary"]
+
+
+def test_pickling_reopens_the_file(corpus):
+    copy = pickle.loads(pickle.dumps(corpus))
+    try:
+        assert copy.get("dragon") == corpus.get("dragon")
+    finally:
+        copy.close()
+
+
+def test_rejects_other_files_and_old_versions(tmp_path, corpus):
+    with pytest.raises(ValueError, match="not a common-password corpus file"):
+        CorpusFile(b"XXXX" + bytes(64))
+    old = bytearray(corpus.data[:])
+    struct.pack_into(">B", old, 4, 1)
+    with pytest.raises(ValueError, match="rebuild"):
+        CorpusFile(bytes(old))
@@ -0,0 +1,43 @@
+import base64
+import json
+
+from encryption_keys import KeyRing, KeyRotationJob
+from storage import InMemoryUserStore
+
+
+def test_rotation_reports_unreadable_records_and_keeps_going(tmp_path):
+    keyring = KeyRing()
+    keyring.generate_key()
+    lost = KeyRing()
+    lost.add_key(99, b"k" * 32)
+    users = [{"userID": i, "accountStatus": "Active", "expirationMonthLeft": 3,
+              "encryptedPassword": keyring.encrypt_string(f"secret{i}")} for i in range(1, 11)]
+    users[2]["encryptedPassword"] = "not base64!"
+    users[5]["encryptedPassword"] = lost.encrypt_string("sealed by a lost key")
+    corrupt = bytearray(keyring.encrypt(b"tampered"))
+    corrupt[-1] ^= 1
+    users[7]["encryptedPassword"] = base64.b64encode(bytes(corrupt)).decode("ascii")
+    store = InMemoryUserStore(users)
+    old_key = keyring.active_key_id
+    keyring.generate_key()
+    checkpoint = tmp_path / "rotation.json"
+
+    summary = KeyRotationJob(store, keyring, batch_size=4, workers=1, checkpoint_path=str(checkpoint)).run()
+
+    assert summary["reencrypted"] == 7
+    assert summary["failed_user_ids"] == [3, 6, 8]
+    saved = json.loads(checkpoint.read_text())
+    assert saved["last_user_id"] == 10 and saved["failed_user_ids"] == [3, 6, 8]
+    for user_id in (1, 2, 4, 5, 7, 9, 10):
+        record = store.get_user(user_id)["encryptedPassword"]
+        assert KeyRing.key_id_of(base64.b64decode(record)) != old_key
+        assert keyring.decrypt_string(record) == f"secret{user_id}"
+    assert store.get_user(3)["encryptedPassword"] == "not base64!"
+
+    # A resumed run retries the failed records: still-broken ones stay failed, repaired ones are re-encrypted
+    store.update_user(6, {"encryptedPassword": KeyRing({1: keyring.keys[old_key]}, 1).encrypt_string("repaired")})
+    resumed = KeyRotationJob(store, keyring, workers=1, checkpoint_path=str(checkpoint)).run()
+    assert resumed["reencrypted"] == 1 and resumed["failed_user_ids"] == [3, 8]
+    assert keyring.decrypt_string(store.get_user(6)["encryptedPassword"]) == "repaired"
+    assert json.loads(checkpoint.read_text()) == {"target_key_id": keyring.active_key_id, "last_user_id": 10,
+                                                   "failed_user_ids": [3, 8]}
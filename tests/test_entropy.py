@@ -0,0 +1,25 @@
+import pytest
+
+from corpus_index import CommonPasswordIndex
+from entropy import GuessEstimator
+
+WORDS = ["password", "Monkey", "dragon"]
+
+
+@pytest.mark.parametrize("corpus", [WORDS, tuple(WORDS), set(WORDS), frozenset(WORDS), iter(WORDS),
+                                    (word for word in WORDS), {word: None for word in WORDS}])
+def test_any_iterable_corpus_matches_words(corpus):
+    estimator = GuessEstimator(corpus, layouts=())
+    assert set(estimator.ranks) == {"password", "monkey", "dragon"}
+    assert [match.pattern for match in estimator.estimate("monkey").sequence] == ["dictionary"]
+
+
+def test_list_ranks_follow_order_and_sets_rank_every_word_last():
+    assert GuessEstimator(WORDS, layouts=()).ranks == {"password": 1, "monkey": 2, "dragon": 3}
+    assert set(GuessEstimator(set(WORDS), layouts=()).ranks.values()) == {3}
+
+
+@pytest.mark.parametrize("corpus", [CommonPasswordIndex.build(WORDS), "password", 42])
+def test_corpus_without_ranked_words_is_rejected(corpus):
+    with pytest.raises(TypeError):
+        GuessEstimator(corpus, layouts=())
@@ -0,0 +1,51 @@
+import random
+
+from complexity import PasswordSecurityChecker
+from incremental import ScoringSession
+from main import common_passwords
+
+ALPHABET = "abcdeqwsxzAQW0123579!@#$ é"
+
+
+def assert_matches_full_rescore(session, checker):
+    checker.password = session.password
+    assert session.security_level() == checker.security_level(), session.password
+    assert session.feedback_on_improvement() == checker.feedback_on_improvement(), session.password
+    analysis = session.analyze()
+    assert analysis.sequences == checker.analyze().sequences
+    assert analysis.repeats == checker.analyze().repeats
+
+
+def test_appends_and_deletes_match_a_full_rescore():
+    rng = random.Random(21)
+    checker = PasswordSecurityChecker("", common_passwords)
+    corpus = [password for password in common_passwords if len(password) >= 4]
+    for _ in range(60):
+        session = ScoringSession(common_passwords)
+        for _ in range(40):
+            roll = rng.random()
+            if roll < 0.25 and len(session):
+                session.delete()
+            elif roll < 0.35:
+                # Type a piece of a common password, so the consecutive-letters check is exercised
+                for char in rng.choice(corpus)[:rng.randrange(4, 8)]:
+                    session.append(char)
+            else:
+                session.append(rng.choice(ALPHABET))
+            assert_matches_full_rescore(session, checker)
+
+
+def test_update_rescores_only_the_changed_tail():
+    checker = PasswordSecurityChecker("", common_passwords)
+    session = ScoringSession(common_passwords, "Summer2024!")
+    assert_matches_full_rescore(session, checker)
+    for text in ("Summer2", "Summer2O2x!Q", "", "qwerty123", "Kx!9aB7$", "Kx!9aB7$aaa"):
+        session.update(text)
+        assert session.password == text
+        assert_matches_full_rescore(session, checker)
+
+
+def test_delete_on_an_empty_session():
+    session = ScoringSession(common_passwords)
+    assert session.delete() is None
+    assert session.security_level() == PasswordSecurityChecker("", common_passwords).security_level()
@@ -0,0 +1,30 @@
+import pytest
+
+from kdf import PBKDF2_SHA256, SCRYPT_MAX_MEMORY, PasswordKDF, identify_scheme, scrypt_maxmem
+
+
+def test_hash_roundtrip_and_scheme():
+    kdf = PasswordKDF(log_n=10)
+    encoded = kdf.hash("correct horse")
+    assert identify_scheme(encoded) == "scrypt"
+    assert kdf.verify("correct horse", encoded)
+    assert not kdf.verify("wrong horse", encoded)
+
+
+def test_needs_rehash_on_any_parameter_difference():
+    encoded = PasswordKDF(log_n=10).hash("pw")
+    assert not PasswordKDF(log_n=10).needs_rehash(encoded)
+    assert PasswordKDF(log_n=11).needs_rehash(encoded)
+    assert PasswordKDF(log_n=9).needs_rehash(encoded)
+    assert PasswordKDF(scheme=PBKDF2_SHA256, iterations=1000).needs_rehash(encoded)
+    assert PasswordKDF().needs_rehash("not a hash")
+
+
+def test_scrypt_maxmem_stays_below_int_max():
+    assert scrypt_maxmem(1 << 10, 8) > 128 * 8 * (1 << 10)
+    assert scrypt_maxmem(1 << 24, 8) == SCRYPT_MAX_MEMORY
+
+
+def test_parse_rejects_malformed_hashes():
+    with pytest.raises(ValueError):
+        PasswordKDF.parse("$scrypt$ln=x$abc$def")
@@ -0,0 +1,11 @@
+from complexity import PasswordSecurityChecker
+from keyboard import QWERTY
+
+
+def test_turns_count_straight_segments():
+    assert [(walk.token, walk.turns) for walk in QWERTY.find_walks("qwer qwsx 1qaz")] == [("qwer", 1), ("qwsx", 2), ("1qaz", 1)]
+
+
+def test_keyboard_walk_feedback():
+    feedback = PasswordSecurityChecker("Xk9!zq1qaz", []).feedback_on_improvement()
+    assert any(item.startswith("Avoid keyboard walks of 3 or more adjacent keys") for item in feedback)
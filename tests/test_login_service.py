@@ -0,0 +1,135 @@
+import asyncio
+import copy
+import json
+
+from kdf import PasswordKDF, identify_scheme
+from login_service import MAX_LINE_BYTES, LoginClient, LoginService
+from main import common_passwords, sample_users_data
+from migration import HashMigrator, legacy_hash
+from TOTP import TOTP
+from UserData import UserManager
+
+
+def run_with_service(scenario, users=None, **options):
+    # Start a service on a free loopback port, run scenario(service, client) and shut everything down
+    async def main():
+        data = copy.deepcopy(sample_users_data if users is None else users)
+        service = LoginService(UserManager(data), common_passwords, **options)
+        host, port = await service.start("127.0.0.1", 0)
+        client = await LoginClient.connect(host, port)
+        try:
+            return await scenario(service, client)
+        finally:
+            await client.close()
+            await service.close()
+
+    return asyncio.run(main())
+
+
+def current_code(secret):
+    # The code an authenticator app shows for an enrolled secret
+    return TOTP(secret).get_totp_token()
+
+
+def enrolled_users():
+    users = copy.deepcopy(sample_users_data)
+    for user in users:
+        user['totpSecret'] = TOTP().secret
+    return users
+
+
+def test_full_login_with_expired_password():
+    async def scenario(service, client):
+        assert await client.login(1, "wrong") == {"status": "failed", "attempts": 1}
+        response = await client.login(1, "JaneDoe@2024!")
+        assert response["status"] == "totp_required"
+        assert (await client.submit_totp(response["totp"]))["status"] == "password_expired"
+        response = await client.change_password("Fresh!Start9xyz")
+        assert response["status"] == "authenticated"
+        assert response["security_level"] in ("Very Strong", "Strong", "Moderate", "Weak")
+
+    run_with_service(scenario, reveal_totp=True)
+
+
+def test_first_login_enrolls_a_secret_that_an_authenticator_can_use():
+    async def scenario(service, client):
+        response = await client.login(2, "Smith#Secure123")
+        assert set(response) == {"status", "totp_secret"} and response["status"] == "totp_required"
+        assert service.user_manager.get_totp_secret(2) == response["totp_secret"]
+        response = await client.submit_totp(current_code(response["totp_secret"]))
+        assert response["status"] == "authenticated"
+
+    run_with_service(scenario)
+
+
+def test_enrolled_user_gets_no_secret_or_code():
+    users = enrolled_users()
+
+    async def scenario(service, client):
+        response = await client.login(2, "Smith#Secure123")
+        assert response == {"status": "totp_required"}
+        assert (await client.submit_totp(current_code(users[1]['totpSecret'])))["status"] == "authenticated"
+
+    run_with_service(scenario, users=users)
+
+
+def test_users_without_a_secret_are_refused_when_enrollment_is_off():
+    async def scenario(service, client):
+        response = await client.login(2, "Smith#Secure123")
+        assert response["status"] == "failed" and "TOTP" in response["message"]
+
+    run_with_service(scenario, enroll_totp=False)
+
+
+def test_totp_attempts_are_capped_and_counted_as_failures():
+    users = enrolled_users()
+
+    async def scenario(service, client):
+        assert (await client.login(3, "Alic3@Wav3s!2024"))["status"] == "totp_required"
+        code = current_code(users[2]['totpSecret'])
+        wrong = "000000" if code != "000000" else "111111"
+        assert (await client.submit_totp(wrong)) == {"status": "invalid_totp", "attempts_left": 2}
+        assert (await client.submit_totp(wrong))["status"] == "invalid_totp"
+        assert (await client.submit_totp(wrong))["status"] == "locked"
+        assert service.rate_limiter.users.state("user:3")["attempts"] == 3
+
+    run_with_service(scenario, users=users)
+
+
+def test_malformed_requests_get_error_replies():
+    async def scenario(service, client):
+        assert (await client.request(action="login", user_id=[1], password="x"))["status"] == "error"
+        assert (await client.request(action="login", user_id=True, password="x"))["status"] == "error"
+        assert (await client.request(action="login", user_id=1))["status"] == "error"
+        assert (await client.request(action="fly"))["status"] == "error"
+        client.writer.write(b"[1, 2]\n")
+        assert json.loads(await client.reader.readline())["status"] == "error"
+        assert (await client.login(2, "Smith#Secure123"))["status"] == "totp_required"
+        assert (await client.submit_totp("١٢٣٤٥٦"))["status"] == "invalid_totp"
+        assert (await client.request(action="totp", code=123456))["status"] == "error"
+        client.writer.write(b"x" * (MAX_LINE_BYTES + 10) + b"\n")
+        assert json.loads(await client.reader.readline()) == {"status": "error", "message": "Message too long."}
+
+    run_with_service(scenario)
+
+
+def test_hashed_passwords_are_verified_and_migrated_on_login():
+    users = enrolled_users()
+    users[0]['passwordHash'] = legacy_hash("JaneDoe@2024!")
+    # The plaintext field no longer matches; only the stored hash decides
+    users[0]['currentPassword'] = "stale"
+
+    async def scenario(service, client):
+        assert (await client.login(1, "stale"))["status"] == "failed"
+        assert (await client.login(1, "JaneDoe@2024!"))["status"] == "totp_required"
+        stored = service.user_manager.get_user(1)['passwordHash']
+        assert identify_scheme(stored) == "scrypt" and service.migrator.rehashed == 1
+        assert (await client.submit_totp(current_code(users[0]['totpSecret'])))["status"] == "password_expired"
+        assert (await client.change_password("Fresh!Start9xyz"))["status"] == "authenticated"
+        assert service.migrator.verify("Fresh!Start9xyz", service.user_manager.get_user(1)['passwordHash'])
+
+    async def with_cheap_kdf(service, client):
+        service.migrator = HashMigrator(service.user_manager.store, PasswordKDF(log_n=10))
+        return await scenario(service, client)
+
+    run_with_service(with_cheap_kdf, users=users)
@@ -0,0 +1,40 @@
+import logging
+
+import pytest
+
+from kdf import PasswordKDF
+from migration import HashMigrator, legacy_hash
+from storage import InMemoryUserStore
+
+
+def make_store(password_hash):
+    return InMemoryUserStore([{'userID': 1, 'firstName': 'A', 'lastName': 'B', 'currentPassword': 'pw',
+                               'history': [], 'expirationMonthLeft': 3, 'accountStatus': 'Active',
+                               'passwordHash': password_hash}])
+
+
+def test_legacy_hash_is_upgraded_on_login():
+    store = make_store(legacy_hash("secret"))
+    migrator = HashMigrator(store, PasswordKDF(log_n=10))
+    assert migrator.login(1, "secret")
+    assert store.get_user(1)['passwordHash'].startswith("$scrypt$")
+    assert migrator.login(1, "secret")
+    assert not migrator.login(1, "wrong")
+
+
+@pytest.mark.parametrize("stored_hash", [
+    "$scrypt$ln=oops$$",
+    # Missing parameters
+    "$scrypt$r=8,p=1$AAAA$AAAA",
+    "$pbkdf2-sha256$x=1$AAAA$AAAA",
+    # Parameters hashlib would reject with TypeError, OverflowError or a memory error
+    "$scrypt$ln=100,r=8,p=1$AAAA$AAAA",
+    "$scrypt$ln=10,r=8,p=0$AAAA$AAAA",
+    "$pbkdf2-sha256$i=99999999999$AAAA$AAAA",
+    "$scrypt$ln=10,r=8,p=1$AAAA$",
+])
+def test_malformed_kdf_hash_fails_the_login(caplog, stored_hash):
+    migrator = HashMigrator(make_store(stored_hash), PasswordKDF(log_n=10))
+    with caplog.at_level(logging.WARNING, logger="migration"):
+        assert migrator.login(1, "secret") is False
+    assert "Malformed" in caplog.text and "password hash" in caplog.text
@@ -0,0 +1,19 @@
+import io
+
+from progress import ProgressReporter, count_lines
+
+
+def test_count_lines_counts_a_missing_final_newline(tmp_path):
+    path = tmp_path / "passwords.txt"
+    for content, expected in ((b"", 0), (b"a\n", 1), (b"a\nb", 2), (b"a\r\nb\r\n\n", 3)):
+        path.write_bytes(content)
+        assert count_lines(str(path), block_size=2) == expected
+
+
+def test_status_shows_total_and_eta():
+    reporter = ProgressReporter("Hashed", total=200, stream=io.StringIO())
+    reporter.start()
+    reporter.advance(50, 1)
+    reporter.close()
+    status = reporter.status()
+    assert "Hashed: 50/200 (25.0%)" in status and "ETA" in status and "1 errors" in status
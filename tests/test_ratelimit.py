@@ -0,0 +1,40 @@
+from ratelimit import InMemoryRateStore, RateLimiter, SQLiteRateStore
+
+
+def test_lockout_after_limit():
+    limiter = RateLimiter(limit=3, window=60)
+    for _ in range(2):
+        assert not limiter.hit("user:1", now=1000)["locked"]
+    assert limiter.hit("user:1", now=1000)["locked"]
+    assert limiter.is_locked("user:1", now=1030)
+    assert not limiter.is_locked("user:1", now=1061)
+
+
+def test_spraying_new_keys_does_not_lift_lockouts():
+    limiter = RateLimiter(limit=1, window=60, lockout=3600, store=InMemoryRateStore(shards=1, max_keys_per_shard=10))
+    limiter.hit("user:victim", now=1000)
+    for i in range(1000):
+        limiter.store.update(f"user:{i}", 1001, 60, lambda entry: None)
+    assert limiter.is_locked("user:victim", now=1002)
+    assert len(limiter.store) <= 11
+
+
+def test_idle_keys_behind_a_locked_key_are_evicted():
+    store = InMemoryRateStore(shards=1)
+    limiter = RateLimiter(limit=2, window=60, lockout=3600, store=store)
+    limiter.lock("user:locked", now=1000)
+    for i in range(20):
+        limiter.hit(f"user:idle{i}", now=1000 + i / 100)
+    assert len(store) == 21
+    # Much later, one update sweeps every idle key but keeps the locked one
+    limiter.hit("user:new", now=1500)
+    assert len(store) == 2
+    assert limiter.is_locked("user:locked", now=1500)
+
+
+def test_sqlite_store_shares_counts(tmp_path):
+    path = str(tmp_path / "rates.db")
+    first = RateLimiter(limit=2, window=60, store=SQLiteRateStore(path))
+    second = RateLimiter(limit=2, window=60, store=SQLiteRateStore(path))
+    first.hit("user:1", now=1000)
+    assert second.hit("user:1", now=1001)["locked"]
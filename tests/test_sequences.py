@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from complexity import PasswordSecurityChecker
+from main import common_passwords
+from sequences import RepeatSpan, SequenceSpan, char_kind, find_repeats, find_sequences
+
+
+def reference_sequences(text, min_length=3):
+    # Every maximal window of one kind with a constant nonzero step, found by brute force
+    windows = []
+    for start in range(len(text)):
+        for end in range(start + 2, len(text) + 1):
+            window = text[start:end]
+            kinds = {char_kind(char) for char in window}
+            steps = {ord(b.lower()) - ord(a.lower()) for a, b in zip(window, window[1:])}
+            if len(kinds) == 1 and None not in kinds and len(steps) == 1 and 0 not in steps:
+                windows.append((start, end, steps.pop(), kinds.pop()))
+    maximal = [w for w in windows
+               if not any(o != w and o[0] <= w[0] and w[1] <= o[1] for o in windows)]
+    return [SequenceSpan(start, end, text[start:end], step, kind)
+            for start, end, step, kind in sorted(maximal) if end - start >= min_length]
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("", []),
+    ("12", []),
+    ("123", ["123"]),
+    ("9876", ["9876"]),
+    ("x1357y", ["1357"]),
+    ("12357", ["123", "357"]),
+    ("aBcD9876", ["aBcD", "9876"]),
+    ("1233345", ["123", "345"]),
+    ("ab1cd", []),
+    ("aceg", ["aceg"]),
+])
+def test_find_sequences_examples(text, tokens):
+    assert [span.token for span in find_sequences(text)] == tokens
+
+
+def test_find_sequences_matches_brute_force():
+    rng = random.Random(20)
+    for alphabet in ("0123", "0123456789", "abcABC", "a1b2c3!", "acegACEG0246"):
+        for _ in range(400):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randrange(0, 14)))
+            assert find_sequences(text) == reference_sequences(text), text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("aaaa", [RepeatSpan(0, 4, "aaaa", "a", 4)]),
+    ("abcabcab", [RepeatSpan(0, 6, "abcabc", "abc", 2)]),
+    ("xyxyxy aaa", [RepeatSpan(0, 6, "xyxyxy", "xy", 3), RepeatSpan(7, 10, "aaa", "a", 3)]),
+    ("aa", []),
+    ("abcd", []),
+])
+def test_find_repeats_examples(text, expected):
+    assert find_repeats(text) == expected
+
+
+def test_find_repeats_spans_are_whole_blocks_and_cover_every_triple():
+    rng = random.Random(21)
+    for alphabet in ("ab", "abc", "a1!"):
+        for _ in range(400):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randrange(0, 20)))
+            spans = find_repeats(text)
+            for span in spans:
+                assert span.token == text[span.start:span.end] == span.block * span.count
+                assert span.count >= 2 and len(span.token) >= 3 and len(span.block) <= 8
+            for i in range(len(text) - 2):
+                if text[i] == text[i + 1] == text[i + 2]:
+                    assert any(span.start <= i and i + 3 <= span.end for span in spans), text
+
+
+@pytest.mark.parametrize("password, token", [
+    ("Kx!2024Qz", "024"),
+    ("Zq#7x135Rv", "135"),
+])
+def test_stepped_digit_runs_are_flagged(password, token):
+    # The old is_sequence only looked for neighbouring digits one apart, so these were "Very Strong" before
+    checker = PasswordSecurityChecker(password, common_passwords)
+    assert not checker.check_number_sequence()
+    assert checker.security_level() == "Strong"
+    assert checker.feedback_on_improvement() == [f'Avoid using 3 consecutive numbers such as "{token}".']
+
+
+def test_is_sequence_requires_one_run_over_the_whole_string():
+    checker = PasswordSecurityChecker("", common_passwords)
+    assert checker.is_sequence("135")
+    assert checker.is_sequence("9876")
+    assert not checker.is_sequence("1235")
+    assert not checker.is_sequence("2024")
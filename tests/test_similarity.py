@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from similarity import bounded_edit_distance, is_similar, normalize
+from UserData import UserManager
+
+
+def levenshtein(a, b):
+    # Plain dynamic-programming edit distance
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i]
+        for j, char_b in enumerate(b, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def expected(a, b, max_distance):
+    distance = levenshtein(a, b)
+    return distance if distance <= max_distance else None
+
+
+def mutate(rng, text, edits, alphabet):
+    text = list(text)
+    for _ in range(edits):
+        operation = rng.randrange(3)
+        position = rng.randrange(len(text) + 1)
+        if operation == 0 or not text:
+            text.insert(position, rng.choice(alphabet))
+        elif operation == 1:
+            del text[min(position, len(text) - 1)]
+        else:
+            text[min(position, len(text) - 1)] = rng.choice(alphabet)
+    return "".join(text)
+
+
+def test_matches_dynamic_programming_on_random_inputs():
+    rng = random.Random(25)
+    for alphabet in ("ab", "abcdef", "aé€😀"):
+        for _ in range(300):
+            a = "".join(rng.choice(alphabet) for _ in range(rng.randrange(0, 80)))
+            b = mutate(rng, a, rng.randrange(0, 8), alphabet) if rng.random() < 0.7 else \
+                "".join(rng.choice(alphabet) for _ in range(rng.randrange(0, 80)))
+            distance = levenshtein(a, b)
+            for max_distance in {0, max(0, distance - 1), distance, distance + 1, rng.randrange(0, 20)}:
+                assert bounded_edit_distance(a, b, max_distance) == expected(a, b, max_distance), (a, b, max_distance)
+
+
+@pytest.mark.parametrize("length", [0, 1, 63, 64, 65, 128, 200])
+def test_boundary_lengths(length):
+    rng = random.Random(length)
+    a = "".join(rng.choice("xyz") for _ in range(length))
+    for b in (a, a + "q", "q" + a, a[1:], a[:-1], a[::-1], mutate(rng, a, 3, "xyzq"), ""):
+        distance = levenshtein(a, b)
+        # Exactly at the bound, and one below it
+        assert bounded_edit_distance(a, b, distance) == distance
+        assert bounded_edit_distance(b, a, distance) == distance
+        if distance:
+            assert bounded_edit_distance(a, b, distance - 1) is None
+
+
+def test_known_distances_and_normalization():
+    assert bounded_edit_distance("kitten", "sitting", 3) == 3
+    assert bounded_edit_distance("kitten", "sitting", 2) is None
+    assert bounded_edit_distance("", "", 0) == 0
+    assert bounded_edit_distance("", "abc", 2) is None
+    assert normalize("P@55w0rd") == "password"
+    assert is_similar("Summer2024!", "Summr2025!")
+    assert not is_similar("Summer2024!", "Winter#Sky77")
+
+
+def test_history_rejects_near_misses_with_a_message():
+    users = [{'userID': 1, 'firstName': 'A', 'lastName': 'B', 'currentPassword': 'Summer2024!',
+              'history': ['Kx9$mQ2v'], 'expirationMonthLeft': 3, 'accountStatus': 'Active'}]
+    manager = UserManager(users)
+    assert manager.is_password_close_to_history(1, 'summr2025!')
+    assert manager.is_password_close_to_history(1, 'KX9$MQ3V')
+    assert not manager.is_password_close_to_history(1, 'Unrelated#Pass88')
+    assert not manager.is_password_close_to_history(2, 'Summer2024!')
+    # Shares no four-character run with the history, so only the edit-distance check catches it
+    assert not manager.is_password_similar_to_history(1, 'SuMmr2O25!')
+    assert manager.set_new_password(1, 'SuMmr2O25!') == \
+        "Password cannot be set. It is only a few edits away from the history or current password."
+    assert manager.set_new_password(1, 'Unrelated#Pass88') == "Password updated successfully for userID 1."
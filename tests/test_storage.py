@@ -0,0 +1,168 @@
+import queue
+import sqlite3
+import threading
+
+import pytest
+
+from storage import InMemoryUserStore, SQLiteUserStore
+
+
+def make_user(user_id, status='Active', months=3, password_hash=None):
+    user = {'userID': user_id, 'firstName': f'First{user_id}', 'lastName': f'Last{user_id}', 'history': ['Old#1'],
+            'expirationMonthLeft': months, 'currentPassword': f'Pass#{user_id}', 'accountStatus': status}
+    if password_hash is not None:
+        user['passwordHash'] = password_hash
+    return user
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    users = [make_user(1), make_user(2, months=0), make_user(3, status='Disabled', months=5)]
+    if request.param == "memory":
+        yield InMemoryUserStore(users)
+    else:
+        store = SQLiteUserStore.from_records(str(tmp_path / "users.db"), users)
+        yield store
+        store.close()
+
+
+def test_failed_transaction_rolls_back_every_change(store):
+    with pytest.raises(RuntimeError):
+        with store.transaction() as tx:
+            tx.update_user(1, {'accountStatus': 'Disabled', 'expirationMonthLeft': 6, 'history': ['a', 'b']})
+            tx.add_user(make_user(4, status='Locked'))
+            raise RuntimeError("abort")
+    assert store.get_user(1)['accountStatus'] == 'Active' and store.get_user(1)['history'] == ['Old#1']
+    assert store.get_user(4) is None
+    assert store.get_users_by_status('Active') == {1, 2}
+    assert store.get_users_by_status('Locked') == set()
+    assert store.get_users_expiring_within(3) == {1, 2}
+    assert [user['userID'] for user in store.iter_users()] == [1, 2, 3]
+
+
+def test_committed_transaction_keeps_indexes_in_step(store):
+    with store.transaction() as tx:
+        tx.update_user(2, {'accountStatus': 'Disabled', 'expirationMonthLeft': 6})
+        tx.add_user(make_user(4))
+    assert store.get_users_by_status('Disabled') == {2, 3}
+    assert store.get_users_by_expiration(6) == {2}
+    assert store.get_users_expiring_within(5) == {1, 3, 4}
+
+
+def test_in_memory_readers_survive_concurrent_writers():
+    store = InMemoryUserStore([make_user(i, months=i % 7) for i in range(1, 201)])
+    stop = threading.Event()
+    errors = []
+
+    def write():
+        month = 0
+        while not stop.is_set():
+            month += 1
+            store.update_users([(i, {'expirationMonthLeft': (i + month) % 50}) for i in range(1, 201)])
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(2000):
+            try:
+                store.get_users_expiring_within(25)
+            except RuntimeError as error:
+                errors.append(error)
+                break
+    finally:
+        stop.set()
+        writer.join()
+    assert not errors
+
+
+def test_hash_scheme_counts_follow_inserts_and_updates(store):
+    legacy = "a" * 64
+    assert store.count_by_hash_scheme() == {None: 3}
+    store.add_user(make_user(4, password_hash=legacy))
+    store.update_user(1, {'passwordHash': "$scrypt$ln=10,r=8,p=1$AAAA$AAAA"})
+    store.update_user(2, {'passwordHash': legacy})
+    assert store.count_by_hash_scheme() == {None: 1, 'sha256': 2, 'scrypt': 1}
+    # Changes that keep the scheme, or don't touch the hash, leave the counts alone
+    store.update_user(4, {'passwordHash': "b" * 64, 'accountStatus': 'Disabled'})
+    assert store.count_by_hash_scheme() == {None: 1, 'sha256': 2, 'scrypt': 1}
+
+
+def test_records_round_trip_with_extra_fields(store):
+    store.update_user(1, {'totpSecret': 'JBSWY3DPEHPK3PXP', 'history': ['x', 'y']})
+    user = store.get_user(1)
+    assert user['totpSecret'] == 'JBSWY3DPEHPK3PXP' and user['history'] == ['x', 'y']
+    assert store.update_user(99, {'accountStatus': 'Active'}) is False
+    with pytest.raises(ValueError):
+        store.add_user(make_user(1))
+    with pytest.raises(ValueError):
+        store.update_user(1, {'userID': 2})
+
+
+def test_batch_writer_commits_in_batches(tmp_path):
+    store = SQLiteUserStore.from_records(str(tmp_path / "users.db"), [make_user(i) for i in range(1, 11)])
+    with store.batch_writer(batch_size=4) as writer:
+        for i in range(1, 11):
+            writer.update_user(i, {'expirationMonthLeft': 0})
+        assert writer.written == 8 and len(writer.pending) == 2
+    assert writer.written == 10
+    assert store.get_users_by_expiration(0) == set(range(1, 11))
+    store.close()
+
+
+def test_pool_reuses_connections_up_to_its_limit(tmp_path):
+    store = SQLiteUserStore(str(tmp_path / "users.db"), max_connections=2)
+    pool = store.pool
+    pool.timeout = 0.05
+    with pool.connection() as first:
+        pass
+    with pool.connection() as again:
+        assert again is first
+    a, b = pool.acquire(), pool.acquire()
+    assert pool._opened == 2
+    # A full pool waits for a release and gives up after its timeout
+    with pytest.raises(queue.Empty):
+        pool.acquire()
+    pool.release(a)
+    assert pool.acquire() is a
+    pool.release(a)
+    pool.release(b)
+    store.close()
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+
+def test_old_databases_are_upgraded(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE users (user_id INTEGER PRIMARY KEY, first_name TEXT NOT NULL, last_name TEXT NOT NULL,
+                    history TEXT NOT NULL, expiration_month_left INTEGER NOT NULL, current_password TEXT NOT NULL,
+                    account_status TEXT NOT NULL, extra TEXT NOT NULL DEFAULT '{}')""")
+    conn.executemany("INSERT INTO users VALUES (?, 'A', 'B', '[]', 3, 'pw', 'Active', ?)", [
+        (1, '{"passwordHash": "%s", "note": "kept"}' % ("c" * 64)),
+        (2, '{}'),
+    ])
+    conn.commit()
+    conn.close()
+
+    store = SQLiteUserStore(path)
+    assert store.count_by_hash_scheme() == {'sha256': 1, None: 1}
+    user = store.get_user(1)
+    assert user['passwordHash'] == "c" * 64 and user['note'] == 'kept'
+    store.update_user(2, {'passwordHash': "d" * 64})
+    assert store.count_by_hash_scheme() == {'sha256': 2}
+    store.close()
+    # Opening an upgraded database again changes nothing
+    store = SQLiteUserStore(path)
+    assert store.count_by_hash_scheme() == {'sha256': 2}
+    store.close()
+
+
+def test_password_changes_bump_the_version_stamp(store):
+    assert store.get_user(1).get('passwordVersion', 0) == 0
+    store.update_user(1, {'accountStatus': 'Disabled'})
+    assert store.get_user(1).get('passwordVersion', 0) == 0
+    store.update_user(1, {'currentPassword': 'New#1'})
+    store.update_user(1, {'history': []})
+    assert store.get_user(1)['passwordVersion'] == 2
+    store.update_user(1, {'currentPassword': 'New#2', 'passwordVersion': 10})
+    assert store.get_user(1)['passwordVersion'] == 10
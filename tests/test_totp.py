@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import hmac
+
+import pytest
+
+from TOTP import TOTP, TOTPVerifier, hotp
+
+RFC_SECRET = base64.b32encode(b"12345678901234567890").decode("ascii")
+
+
+def test_hotp_matches_rfc4226_vectors():
+    key = hmac.new(b"12345678901234567890", digestmod=hashlib.sha1)
+    expected = [755224, 287082, 359152, 969429, 338314, 254676, 287922, 162583, 399871, 520489]
+    assert [hotp(key, counter) for counter in range(10)] == expected
+
+
+def test_totp_matches_rfc6238_vectors():
+    verifier = TOTPVerifier(digits=8)
+    verifier.register("user", RFC_SECRET)
+    assert verifier.generate("user", now=59) == "94287082"
+    assert verifier.generate("user", now=1111111109) == "07081804"
+
+
+def test_get_hotp_token_uses_secret():
+    assert TOTP(RFC_SECRET).get_hotp_token(1) == 287082
+
+
+def test_verify_accepts_window_and_rejects_replay():
+    verifier = TOTPVerifier(drift=1)
+    verifier.register("user", RFC_SECRET)
+    now = 1_000_000
+    assert verifier.verify("user", verifier.generate("user", now - 30), now)
+    # The same code, and any code of an earlier step, is rejected afterwards
+    assert not verifier.verify("user", verifier.generate("user", now - 30), now)
+    assert verifier.verify("user", verifier.generate("user", now), now)
+    assert not verifier.verify("user", verifier.generate("user", now - 30), now)
+    # Outside the drift window
+    assert not verifier.verify("user", verifier.generate("user", now + 90), now)
+
+
+def test_replay_is_rejected_after_many_other_users():
+    verifier = TOTPVerifier(shards=1)
+    now = 1_000_000
+    verifier.register("victim", RFC_SECRET)
+    code = verifier.generate("victim", now)
+    assert verifier.verify("victim", code, now)
+    for i in range(5000):
+        verifier.register(i, RFC_SECRET)
+        assert verifier.verify(i, verifier.generate(i, now), now)
+    assert not verifier.verify("victim", code, now)
+    # Entries expire once their step has left every window
+    assert verifier.replay_cache_size() == 5001
+    verifier.verify("victim", verifier.generate("victim", now + 120), now + 120)
+    assert verifier.replay_cache_size() == 1
+
+
+@pytest.mark.parametrize("code", ["١٢٣٤٥٦", "²²²²²²", "12345", "1234567", "12 456", "", None, 123456])
+def test_verify_rejects_malformed_codes(code):
+    verifier = TOTPVerifier()
+    verifier.register("user", RFC_SECRET)
+    assert verifier.verify("user", code) is False
+
+
+def test_verify_rejects_unknown_user():
+    assert TOTPVerifier().verify("nobody", "123456") is False
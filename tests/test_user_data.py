@@ -0,0 +1,74 @@
+from UserData import UserManager
+
+
+def make_users(count):
+    return [
+        {'userID': i, 'firstName': 'A', 'lastName': 'B', 'currentPassword': f'Current{i}!pass',
+         'history': [f'Older{i}#word', f'Oldest{i}$text'], 'expirationMonthLeft': 3, 'accountStatus': 'Active'}
+        for i in range(1, count + 1)
+    ]
+
+
+def test_similarity_uses_current_password_and_history():
+    manager = UserManager(make_users(1))
+    assert manager.is_password_similar_to_history(1, 'xxOlder1#yy')
+    assert not manager.is_password_similar_to_history(1, 'Zq#8kLm!4')
+
+
+def test_fingerprints_follow_changes_made_outside_the_manager():
+    users = make_users(1)
+    manager = UserManager(users)
+    other = UserManager(manager.store)
+    assert not manager.is_password_similar_to_history(1, 'Brand9New!x')
+    other.rotate_password(1, 'Brand9New!x')
+    assert manager.is_password_similar_to_history(1, 'Brand9New!x')
+    manager.store.update_user(1, {'currentPassword': 'Another7$one', 'history': []})
+    assert manager.is_password_similar_to_history(1, 'Another7$one')
+    assert not manager.is_password_similar_to_history(1, 'xxOlder1#yy')
+
+
+def test_rotate_password_keeps_cache_equal_to_rebuilt_fingerprints():
+    manager = UserManager(make_users(1))
+    manager.is_password_similar_to_history(1, 'warm the cache')
+    for password in ['First1!aaaa', 'Second2@bbbb', 'Third3#cccc', 'Fourth4$dddd']:
+        assert manager.rotate_password(1, password)
+        rotated = manager._fingerprints[1][1]
+        fresh = UserManager(manager.store)
+        fresh._fingerprint_key = manager._fingerprint_key
+        assert rotated == fresh._get_fingerprints(manager.get_user(1))
+
+
+def test_fingerprint_cache_is_bounded():
+    manager = UserManager(make_users(50), max_cached_users=10)
+    for user_id in range(1, 51):
+        manager.is_password_similar_to_history(user_id, 'anything')
+    assert list(manager._fingerprints) == list(range(41, 51))
+    manager.is_password_similar_to_history(41, 'anything')
+    manager.is_password_similar_to_history(1, 'anything')
+    assert 41 in manager._fingerprints and 42 not in manager._fingerprints
+
+
+def test_cached_lookups_do_not_hash_the_history(monkeypatch):
+    manager = UserManager(make_users(1))
+    manager.is_password_similar_to_history(1, 'warm the cache')
+    hashed = []
+    original = manager.password_fingerprints
+    monkeypatch.setattr(manager, 'password_fingerprints', lambda password: hashed.append(password) or original(password))
+    assert manager.is_password_similar_to_history(1, 'xxOlder1#yy')
+    # Only the candidate password is fingerprinted; the cached entry is validated by its version stamp
+    assert hashed == ['xxOlder1#yy']
+
+
+def test_rolled_back_rotation_does_not_leave_a_matching_cache_entry():
+    manager = UserManager(make_users(1))
+    manager.is_password_similar_to_history(1, 'warm the cache')
+    try:
+        with manager.store.transaction() as tx:
+            tx.update_user(1, {'currentPassword': 'Rolled9Back!x'})
+            manager.is_password_similar_to_history(1, 'warm the cache again')
+            raise RuntimeError
+    except RuntimeError:
+        pass
+    manager.store.update_user(1, {'currentPassword': 'Committed7$pw'})
+    assert manager.is_password_similar_to_history(1, 'Committed7$pw')
+    assert not manager.is_password_similar_to_history(1, 'Rolled9Back!x')